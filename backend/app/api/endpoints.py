@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, WebSocket
+from fastapi import APIRouter, HTTPException, WebSocket, Request, Response, Query
+from fastapi.responses import JSONResponse, FileResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import os
 import uuid
 import asyncio
+import time
+import threading
+from datetime import datetime
 from starlette.websockets import WebSocketDisconnect  # <--- Added Import
 
 # --- Core Logic Imports ---
@@ -11,23 +15,87 @@ from app.core.scanner import scan_directory
 from app.core.parser import extract_functions
 # Import both the blocking wrapper and the generator
 from app.core.ingestion import ingest_codebase, ingest_codebase_generator
+from app.core.sync import sync_codebase, sync_status, SyncError
+from app.core.snapshot import (
+    export_snapshot, verify_snapshot, import_snapshot, list_snapshots, loaded_snapshot,
+    snapshot_path, SnapshotError,
+)
 from app.core.rag import generate_rag_response
-
-# --- Database Import ---
-try:
-    from app.db.session import supabase
-except ImportError:
-    supabase = None
-    print("⚠️ Warning: Supabase client not found in app.db.session. Chat history will not be saved.")
+from app.core.symbols import symbol_index
+from app.core.file_tree import directory_snapshot
+from app.core.file_content import file_cache, resolve_workspace_file, workspace_roots, language_for, highlight
+from app.core.coordination import IngestionBusyError
+from app.core.admission import (
+    AdmissionError, client_key, chat_rate_limiter, ingest_rate_limiter, chat_slots,
+)
+from app.core import metrics
+from app.core import profiling
+from app.core.profiling import profile_session
+from app.db.chat_store import SESSIONS_TABLE, MESSAGES_TABLE
+from app.db.history_writer import get_history_writer
+from app.db import history_reader
 
 router = APIRouter()
 
+
+def _client(http_request) -> str:
+    """Rate-limit key of an HTTP request or websocket: its address, never a claimed identity."""
+    host = http_request.client.host if http_request.client else None
+    return client_key(host, http_request.headers.get("x-forwarded-for"))
+
+def _rejected(e: AdmissionError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def _iterate_in_thread(generator):
+    """
+    Runs a blocking generator on a thread of its own and yields its items
+    on the event loop, so a long job doesn't stall every other request of
+    this worker. One thread for the whole run: the generator holds locks and
+    context variables across steps. Stops it when the consumer goes away.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # loop closed
+            stop.set()
+
+    def produce():
+        try:
+            for item in generator:
+                put(item)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            generator.close()
+            put(done)
+
+    threading.Thread(target=produce, name="stream-job", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
 # ==========================================
 # 1. SCANNING & INGESTION
 # ==========================================
 
 class ScanRequest(BaseModel):
     path: str
+    # Profile this ingestion job (see /profiles)
+    profile: bool = False
 
 @router.post("/scan/preview")
 def preview_scan(request: ScanRequest):
@@ -60,23 +128,32 @@ def test_parser(request: ParseRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/ingest")
-def start_ingestion(request: ScanRequest):
+def start_ingestion(request: ScanRequest, http_request: Request):
     """
     Triggers the ingestion process synchronously (Blocking).
     Used by the landing page or direct API calls.
     """
     try:
+        ingest_rate_limiter.acquire(_client(http_request))
         print(f"🔄 API: Starting blocking ingestion for {request.path}")
         
         # --- BLOCKING CALL ---
-        ingest_codebase(request.path) 
+        final = ingest_codebase(request.path, profile=request.profile)
         
         print("✅ API: Ingestion finished successfully")
-        return {
+        response = {
             "status": "success", 
             "message": "Ingestion complete", 
-            "target": request.path
+            "target": request.path,
+            "job_id": final.get("job_id"),
         }
+        if "profile" in final:
+            response["profile"] = final["profile"]
+        return response
+    except AdmissionError as e:
+        raise _rejected(e)
+    except IngestionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"❌ API: Ingestion failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -100,12 +177,17 @@ async def websocket_ingest(websocket: WebSocket):
             await websocket.close()
             return
 
-        # 2. Run Ingestion Generator and stream updates
-        for update in ingest_codebase_generator(path):
+        try:
+            ingest_rate_limiter.acquire(_client(websocket))
+        except AdmissionError as e:
+            await websocket.send_json({"status": "error", "code": "rate_limited",
+                                       "message": str(e), "retry_after": e.retry_after})
+            return
+
+        # 2. Run Ingestion Generator (on its own thread) and stream updates
+        async for update in _iterate_in_thread(ingest_codebase_generator(path, profile=bool(data.get("profile")))):
             await websocket.send_json(update)
-            # Small sleep to allow the event loop to handle other requests
-            await asyncio.sleep(0.01) 
-            
+
     except WebSocketDisconnect:
         # Client disconnected normally, just stop processing
         print("ℹ️ Client disconnected from ingestion stream.")
@@ -133,89 +215,144 @@ class ChatRequest(BaseModel):
     filter_path: Optional[str] = None
     session_id: Optional[str] = None
     user_id: Optional[str] = None
+    # Attach per-stage timings and candidate counts to the response
+    debug: bool = False
+    # Profile this request (see /profiles)
+    profile: bool = False
 
 @router.post("/chat")
-def chat_with_codebase(request: ChatRequest):
+def chat_with_codebase(request: ChatRequest, http_request: Request):
     try:
-        # 1. Generate RAG Response (Core Logic)
-        result = generate_rag_response(
-            question=request.message, 
-            file_path_filter=request.filter_path
-        )
-        
-        # 2. Extract answer text
-        if isinstance(result, dict):
-            answer_text = result.get("answer", str(result))
-        else:
-            answer_text = str(result)
-
-        # 3. Database Persistence
-        session_id = request.session_id
-        
-        if supabase and request.user_id:
-            # A. Create new session if needed
-            if not session_id:
-                session_id = str(uuid.uuid4())
-                title = (request.message[:40] + '..') if len(request.message) > 40 else request.message
-                
-                supabase.table("chat_sessions").insert({
-                    "id": session_id,
-                    "user_id": request.user_id,
-                    "title": title
-                }).execute()
-
-            # B. Save User Message
-            supabase.table("chat_messages").insert({
-                "session_id": session_id,
-                "role": "user",
-                "content": request.message
-            }).execute()
-
-            # C. Save Assistant Response
-            supabase.table("chat_messages").insert({
-                "session_id": session_id,
-                "role": "assistant",
-                "content": answer_text
-            }).execute()
-
-        # 4. Return response
-        if isinstance(result, dict):
-            result["session_id"] = session_id
-            return result
-        else:
-            return {"answer": result, "session_id": session_id}
-
+        chat_rate_limiter.acquire(_client(http_request))
+        with metrics.trace("chat") as chat_trace, chat_slots.slot(), \
+                profile_session("chat", chat_trace.trace_id, enabled=request.profile) as chat_profile:
+            result = _chat(request)
+        if request.debug and isinstance(result, dict):
+            result["debug"] = chat_trace.to_dict()
+        if chat_profile is not None and isinstance(result, dict):
+            result["profile"] = chat_profile.summary()
+        return result
+    except AdmissionError as e:
+        raise _rejected(e)
     except Exception as e:
         print(f"Chat Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _chat(request: ChatRequest) -> dict:
+    asked_at = datetime.utcnow().isoformat()
+
+    # New chats get their id up front so the first turn is remembered too
+    is_new_session = not request.session_id
+    session_id = request.session_id or str(uuid.uuid4())
+
+    # 1. Generate RAG Response (Core Logic)
+    result = generate_rag_response(
+        question=request.message, 
+        file_path_filter=request.filter_path,
+        session_id=session_id,
+    )
+    
+    # 2. Extract answer text
+    if isinstance(result, dict):
+        answer_text = result.get("answer", str(result))
+    else:
+        answer_text = str(result)
+
+    # 3. Database Persistence
+    # Rows are queued for the background writer: no DB round trip here
+    writer = get_history_writer()
+    if writer and request.user_id:
+        # A. Create new session if needed
+        if is_new_session:
+            title = (request.message[:40] + '..') if len(request.message) > 40 else request.message
+
+            writer.enqueue(SESSIONS_TABLE, {
+                "id": session_id,
+                "user_id": request.user_id,
+                "title": title,
+                "created_at": asked_at,
+            })
+
+        # B. Save User Message
+        # (client_id: a retried insert that had in fact succeeded is a no-op)
+        writer.enqueue(MESSAGES_TABLE, {
+            "client_id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "role": "user",
+            "content": request.message,
+            "created_at": asked_at,
+        })
+
+        # C. Save Assistant Response
+        writer.enqueue(MESSAGES_TABLE, {
+            "client_id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "role": "assistant",
+            "content": answer_text,
+            "created_at": datetime.utcnow().isoformat(),
+        })
+
+        history_reader.invalidate(user_id=request.user_id, session_id=session_id)
+
+    # 4. Return response
+    if isinstance(result, dict):
+        result["session_id"] = session_id
+        return result
+    else:
+        return {"answer": result, "session_id": session_id}
+
+class MessagesBatchRequest(BaseModel):
+    session_ids: List[str]
+    limit: int = 50
+
+MAX_BATCH_SESSIONS = 50
+
+def _paged_response(page: dict) -> JSONResponse:
+    # Body stays a plain list (what the frontend already renders);
+    # the cursor for the next page travels in a header
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else {}
+    return JSONResponse(content=page["items"], headers=headers)
+
 @router.get("/history/{user_id}")
-def get_chat_history(user_id: str):
-    if not supabase:
-        return []
-        
+def get_chat_history(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Sessions for the sidebar (id, title, created_at), newest first."""
     try:
-        response = supabase.table("chat_sessions")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
-            .execute()
-        return response.data
+        return _paged_response(history_reader.list_sessions(user_id, cursor=cursor, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/history/messages/{session_id}")
-def get_chat_messages(session_id: str):
-    if not supabase:
-        return []
-        
+def get_chat_messages(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=500),
+):
     try:
-        response = supabase.table("chat_messages")\
-            .select("*")\
-            .eq("session_id", session_id)\
-            .order("created_at", desc=False)\
-            .execute()
-        return response.data
+        return _paged_response(history_reader.list_messages(session_id, cursor=cursor, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/history/messages/batch")
+def get_chat_messages_batch(request: MessagesBatchRequest):
+    """
+    First page of messages for several sessions at once:
+    {session_id: {"items": [...], "next_cursor": ...}}. Later pages come from
+    /history/messages/{session_id}?cursor=...
+    """
+    if len(request.session_ids) > MAX_BATCH_SESSIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SESSIONS} sessions per batch")
+    if not 1 <= request.limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    try:
+        return history_reader.list_messages_batch(request.session_ids, limit=request.limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -227,53 +364,254 @@ def get_chat_messages(session_id: str):
 # Ensure this matches the directory used in your ingestion.py
 TEMP_REPO_DIR = os.path.join(os.getcwd(), "temp_cloned_repo")
 
-@router.get("/files")
-def get_file_structure(path: str):
-    # ---------------------------------------------------------
-    # 1. HANDLE GITHUB URLS
+def _resolve_tree_root(path: str) -> str:
     # If the path is a URL, we look into the temp directory
     # where the repo was cloned, instead of looking for the URL on disk.
-    # ---------------------------------------------------------
     if path.startswith("http") or path.startswith("git@"):
-        target_path = TEMP_REPO_DIR
-    else:
-        target_path = path
+        return TEMP_REPO_DIR
+    return path
 
-    # 2. Check if the target path actually exists
+@router.get("/files")
+def get_file_structure(path: str):
+    """
+    Full nested tree in one response (legacy). Served from the directory
+    snapshot, so only directories changed since ingestion are re-listed.
+    Prefer /files/tree for large repositories.
+    """
+    target_path = _resolve_tree_root(path)
+
+    # Check if the target path actually exists
     if not os.path.exists(target_path):
          return []
 
-    # 3. Recursive function to build the tree
-    def build_tree(dir_path):
-        tree = []
-        try:
-            # Sort items to keep folders and files organized
-            items = sorted(os.listdir(dir_path))
-            for item in items:
-                # Skip hidden files and standard ignore folders
-                if item.startswith('.') or item in ["__pycache__", "node_modules", "venv", ".git"]:
-                    continue
-                    
-                full_path = os.path.join(dir_path, item)
-                is_dir = os.path.isdir(full_path)
-                
-                node = {
-                    "name": item,
-                    "type": "folder" if is_dir else "file",
-                    # We send the full server path so the frontend can request file content later
-                    "path": full_path 
-                }
-                
-                if is_dir:
-                    node["children"] = build_tree(full_path)
-                    
-                tree.append(node)
-        except PermissionError:
-            # Skip folders we don't have permission to access
-            pass
-        except Exception as e:
-            print(f"Error scanning directory {dir_path}: {e}")
-            
-        return tree
+    return directory_snapshot.build_tree(target_path)
 
-    return build_tree(target_path)
\ No newline at end of file
+@router.get("/files/tree")
+def get_file_tree_page(
+    path: str,
+    request: Request,
+    dir_path: Optional[str] = Query(None, alias="dir"),
+    cursor: Optional[str] = None,
+    limit: int = 200,
+):
+    """
+    Lazily expandable tree: the children of ONE directory per call,
+    cursor-paginated. `path` is the ingested root (or repo URL), `dir` the
+    folder to expand (defaults to the root). Supports ETag / If-None-Match.
+    Only ingested roots (file_content.workspace_roots) can be listed.
+    """
+    root = os.path.realpath(_resolve_tree_root(path))
+    if root not in workspace_roots():
+        raise HTTPException(status_code=403, detail="Path is not an ingested workspace root")
+    target = os.path.realpath(dir_path) if dir_path else root
+
+    if os.path.commonpath([root, target]) != root:
+        raise HTTPException(status_code=403, detail="Directory is outside the workspace root")
+    if not os.path.isdir(target):
+        raise HTTPException(status_code=404, detail="Directory not found")
+
+    page = directory_snapshot.page(target, cursor=cursor, limit=max(1, min(limit, 1000)))
+    etag = page.pop("etag")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=page, headers=headers)
+
+
+def _parse_range(header: str, size: int):
+    """
+    Parses a single "bytes=a-b" / "bytes=a-" / "bytes=-n" range.
+    Returns (start, end) inclusive, or None if unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+@router.get("/files/content")
+def get_file_content(
+    path: str,
+    request: Request,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    highlight_code: bool = Query(False, alias="highlight"),
+):
+    """
+    Serves file content from ingested workspaces only.
+    - start_line/end_line: JSON with just those lines (e.g. a cited chunk),
+      located through the file's cached newline index.
+    - Otherwise: raw bytes, honouring an HTTP Range header (206).
+    """
+    real_path = resolve_workspace_file(path)
+    if real_path is None:
+        raise HTTPException(status_code=404, detail="File not found in an ingested workspace")
+
+    try:
+        if start_line is not None or end_line is not None:
+            start = start_line or 1
+            end = end_line if end_line is not None else start + 199
+            if end < start:
+                raise HTTPException(status_code=400, detail="end_line must be >= start_line")
+
+            result = file_cache.read_lines(real_path, start, end)
+            result["path"] = real_path
+            result["language"] = language_for(real_path)
+            if highlight_code:
+                result["highlighted"] = highlight(
+                    real_path, result["mtime"], result["start_line"], result["end_line"], result["content"]
+                )
+            return result
+
+        size = file_cache.get(real_path).size
+        headers = {"Accept-Ranges": "bytes"}
+        range_header = request.headers.get("range")
+
+        if range_header and size > 0:
+            byte_range = _parse_range(range_header, size)
+            if byte_range is None:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            data, _ = file_cache.read_bytes(real_path, *byte_range)
+            headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+            return Response(content=data, status_code=206, media_type="text/plain; charset=utf-8", headers=headers)
+
+        data, _ = file_cache.read_bytes(real_path, 0, size - 1)
+        return Response(content=data, media_type="text/plain; charset=utf-8", headers=headers)
+    except OSError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+# ==========================================
+# 5. SYMBOL LOOKUP (No Vector Store / LLM)
+# ==========================================
+
+@router.get("/symbols")
+def lookup_symbol(name: str, kind: Optional[str] = None, limit: int = 50):
+    """
+    Answers "where is X defined / who calls X" straight from the symbol table.
+    Accepts plain or dotted names, e.g. `search` or `VectorStore.search`.
+    """
+    if not name.strip():
+        raise HTTPException(status_code=400, detail="Symbol name is required")
+
+    start = time.perf_counter()
+    result = symbol_index.lookup(name, kind=kind, limit=max(1, min(limit, 500)))
+    result["took_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+# ==========================================
+# 6. PROFILES (opt-in via "profile": true on /chat, /ingest, /ws/ingest)
+# ==========================================
+@router.get("/profiles")
+def get_profiles():
+    return profiling.list_profiles()
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    meta = profiling.get_profile(profile_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    meta["downloads"] = {name: f"/profiles/{profile_id}/{name}" for name in profiling.ARTIFACTS}
+    return meta
+
+@router.get("/profiles/{profile_id}/{artifact}")
+def download_profile_artifact(profile_id: str, artifact: str):
+    path = profiling.artifact_path(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    media_type = "application/octet-stream" if artifact.endswith(".prof") else None
+    return FileResponse(path, media_type=media_type, filename=f"{profile_id}-{artifact}")
+
+
+# ==========================================
+# 7. INCREMENTAL SYNC (git hooks, push webhooks, editors)
+# ==========================================
+class SyncRequest(BaseModel):
+    paths: Optional[List[str]] = None  # only these files; default: work it out (git diff / stat)
+    profile: bool = False
+
+@router.post("/sync")
+def start_sync(request: Optional[SyncRequest] = None):
+    """
+    Re-indexes what changed since the last ingestion/sync (blocking).
+    The body is optional so a hook can just `curl -X POST .../sync`.
+    """
+    request = request or SyncRequest()
+    try:
+        final = sync_codebase(request.paths, profile=request.profile)
+    except IngestionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SyncError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ API: Sync failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    final.pop("status", None)
+    final.pop("progress", None)
+    return {"status": "success", **final}
+
+@router.get("/sync/status")
+def get_sync_status():
+    return sync_status()
+
+
+# ==========================================
+# 8. INDEX SNAPSHOTS (build once in CI, import on serving nodes)
+# ==========================================
+class SnapshotRequest(BaseModel):
+    name: str                # a directory under SNAPSHOT_DIR
+    overwrite: bool = False  # export: replace an existing snapshot of that name
+    force: bool = False      # import: accept a different embedding model
+    checksums: bool = True   # verify: sha256 every file (False: sizes only)
+
+@router.get("/snapshots")
+def get_snapshots():
+    return {"snapshots": list_snapshots(), "loaded": loaded_snapshot()}
+
+@router.post("/snapshots/export")
+def export_index_snapshot(request: SnapshotRequest):
+    try:
+        manifest = export_snapshot(snapshot_path(request.name), overwrite=request.overwrite)
+    except IngestionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    manifest.pop("files")
+    return {"status": "success", "name": request.name, **manifest}
+
+@router.post("/snapshots/verify")
+def verify_index_snapshot(request: SnapshotRequest):
+    try:
+        report = verify_snapshot(snapshot_path(request.name), checksums=request.checksums)
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    report["manifest"].pop("files")
+    return report
+
+@router.post("/snapshots/import")
+def import_index_snapshot(request: SnapshotRequest, http_request: Request):
+    try:
+        # Replaces the whole index, like an ingestion
+        ingest_rate_limiter.acquire(_client(http_request))
+        result = import_snapshot(snapshot_path(request.name), force=request.force)
+    except AdmissionError as e:
+        raise _rejected(e)
+    except IngestionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "name": request.name, **result}
@@ -0,0 +1,303 @@
+#cli.py
+"""
+Headless entry point for batch jobs (nightly indexing, scripted evaluation).
+Runs without the web server, the frontend or Supabase:
+
+    python -m app.cli ingest PATH_OR_URL [--profile]
+    python -m app.cli ingest REPO... --data-root DIR [--workers N]
+    python -m app.cli query "How is auth done?" [--filter PATH] [--debug]
+    python -m app.cli query --questions FILE|-
+    python -m app.cli snapshot export|verify|import PATH
+
+stdout carries JSON lines only (one object per progress update or answer);
+the app's own logging goes to stderr.
+
+One index lives in one data directory, and an ingestion replaces it. A single
+repo is ingested in-process into the configured one (CODEMIND_DATA_DIR, or
+--data-dir). Several repos get one data directory each under --data-root and
+are ingested by up to --workers child processes, each with its own database
+and ingestion lock; their progress lines are relayed tagged with "repo".
+That needs VECTOR_BACKEND=local: the Pinecone index is one shared
+"codebase-rag" index, and every ingestion starts by wiping it.
+
+Exit codes: 0 success, 1 failure (any repo or question), 2 usage,
+3 another ingestion holds the lock.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2  # argparse's own code
+EXIT_BUSY = 3
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class JsonLines:
+    """Writes one JSON object per line to the real stdout, from any thread."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, record: dict):
+        line = json.dumps({"ts": round(time.time(), 3), **record}, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def _is_remote(source: str) -> bool:
+    return source.startswith("http") or source.startswith("git@")
+
+def _repo_slug(source: str, taken: set) -> str:
+    """Data directory name for a repo: its last path component, made unique."""
+    name = source.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+    if name.endswith(".git"):
+        name = name[:-4]
+    name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name).lstrip(".") or "repo"
+    slug, n = name, 2
+    while slug in taken:
+        slug, n = f"{name}-{n}", n + 1
+    taken.add(slug)
+    return slug
+
+def _read_lines(path: str) -> List[str]:
+    """Non-empty lines of a file ('-' for stdin), skipping # comments."""
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+# ---------------------------------------------------------
+# 1. INGEST
+# ---------------------------------------------------------
+def _ingest_here(source: str, profile: bool, out: JsonLines) -> int:
+    from app.core.ingestion import ingest_codebase_generator
+
+    code = EXIT_FAILED
+    for update in ingest_codebase_generator(source, profile=profile):
+        out.emit({"repo": source, **update})
+        if update.get("status") == "complete":
+            code = EXIT_OK
+        elif update.get("status") == "error":
+            code = EXIT_BUSY if update.get("code") == "busy" else EXIT_FAILED
+    return code
+
+def _ingest_child(source: str, data_dir: str, args, out: JsonLines) -> dict:
+    """One repo in a child process; its JSON lines are relayed with "repo" set."""
+    os.makedirs(data_dir, exist_ok=True)
+    env = dict(os.environ)
+    env.update({
+        "CODEMIND_DATA_DIR": data_dir,
+        "SQLITE_PATH": os.path.join(data_dir, "assistant.db"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")])),
+    })
+    # Split the cores between the concurrent embedders instead of oversubscribing
+    env.setdefault("ONNX_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+    command = [sys.executable, "-m", "app.cli", "ingest", source] + (["--profile"] if args.profile else [])
+    log_path = os.path.join(data_dir, "ingest.log")
+
+    started = time.perf_counter()
+    last = {}
+    # cwd: clones land in <data_dir>/temp_cloned_repo, not in a directory shared by the workers
+    with open(log_path, "w") as log:
+        child = subprocess.Popen(command, cwd=data_dir, env=env, stdout=subprocess.PIPE,
+                                 stderr=log, text=True, bufsize=1)
+        for line in child.stdout:
+            try:
+                update = json.loads(line)
+            except ValueError:
+                continue
+            update.pop("ts", None)
+            last = {**update, "repo": source}
+            out.emit(last)
+        code = child.wait()
+
+    return {
+        "repo": source,
+        "data_dir": data_dir,
+        "log": log_path,
+        "exit_code": code,
+        "status": "complete" if code == EXIT_OK else "error",
+        "message": last.get("message", ""),
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+def run_ingest(args, out: JsonLines) -> int:
+    sources = list(args.repos)
+    if args.repos_file:
+        sources += _read_lines(args.repos_file)
+    if not sources:
+        print("ingest: no repos given", file=sys.stderr)
+        return EXIT_USAGE
+    sources = [s if _is_remote(s) else os.path.abspath(s) for s in sources]
+
+    if not args.data_root:
+        if len(sources) > 1:
+            print("ingest: several repos need --data-root (each ingestion replaces the index)", file=sys.stderr)
+            return EXIT_USAGE
+        return _ingest_here(sources[0], args.profile, out)
+
+    from app.core.vector_store import VECTOR_BACKEND
+    if len(sources) > 1 and VECTOR_BACKEND != "local":
+        # Each child's reset would delete the other repos' vectors from the one index
+        print(f"ingest: several repos need VECTOR_BACKEND=local (got {VECTOR_BACKEND!r}: "
+              "every repo would share, and wipe, the same Pinecone index)", file=sys.stderr)
+        return EXIT_USAGE
+
+    data_root = os.path.abspath(args.data_root)
+    taken = set()
+    jobs = [(source, os.path.join(data_root, _repo_slug(source, taken))) for source in sources]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(lambda job: _ingest_child(job[0], job[1], args, out), jobs))
+
+    failed = [r for r in results if r["exit_code"] != EXIT_OK]
+    out.emit({
+        "status": "summary",
+        "repos": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": [{k: r[k] for k in ("repo", "exit_code", "message", "log")} for r in failed],
+        "results": results,
+        "seconds": round(time.perf_counter() - started, 1),
+    })
+    if not failed:
+        return EXIT_OK
+    return EXIT_BUSY if all(r["exit_code"] == EXIT_BUSY for r in failed) else EXIT_FAILED
+
+
+# ---------------------------------------------------------
+# 2. QUERY
+# ---------------------------------------------------------
+def _questions(args) -> List[dict]:
+    """Plain lines, or JSON lines like {"question": ..., "filter": ..., "id": ...}."""
+    questions = [{"question": q, "filter": args.filter} for q in args.question]
+    if args.questions:
+        for line in _read_lines(args.questions):
+            if line.startswith("{"):
+                item = json.loads(line)
+                questions.append({**item, "filter": item.get("filter", args.filter)})
+            else:
+                questions.append({"question": line, "filter": args.filter})
+    return questions
+
+def run_query(args, out: JsonLines) -> int:
+    from app.db.session import init_db
+    from app.core import metrics
+    from app.core.rag import generate_rag_response
+
+    init_db()
+    questions = _questions(args)
+    if not questions:
+        print("query: no question given", file=sys.stderr)
+        return EXIT_USAGE
+
+    code = EXIT_OK
+    for item in questions:
+        record = dict(item)
+        try:
+            with metrics.trace("cli") as query_trace:
+                result = generate_rag_response(item["question"], file_path_filter=item["filter"])
+            record["answer"] = result["answer"]
+            record["context"] = result["context"] if args.with_code else [
+                {k: v for k, v in ctx.items() if k != "code"} for ctx in result["context"]
+            ]
+            if args.debug:
+                record["debug"] = query_trace.to_dict()
+            record["ms"] = round((time.perf_counter() - query_trace.started) * 1000, 1)
+        except Exception as e:
+            record["error"] = str(e)
+            code = EXIT_FAILED
+        out.emit(record)
+    return code
+
+
+# ---------------------------------------------------------
+# 3. SNAPSHOT
+# ---------------------------------------------------------
+def run_snapshot(args, out: JsonLines) -> int:
+    from app.core.snapshot import export_snapshot, verify_snapshot, import_snapshot, SnapshotError
+    from app.core.coordination import IngestionBusyError
+    from app.db.session import init_db
+
+    init_db()
+    try:
+        if args.action == "export":
+            result = export_snapshot(args.path, overwrite=args.overwrite)
+            result.pop("files")
+        elif args.action == "verify":
+            result = verify_snapshot(args.path, checksums=not args.no_checksums)
+            result["manifest"].pop("files")
+        else:
+            result = import_snapshot(args.path, force=args.force)
+    except IngestionBusyError as e:
+        out.emit({"ok": False, "error": str(e)})
+        return EXIT_BUSY
+    except SnapshotError as e:
+        out.emit({"ok": False, "error": str(e)})
+        return EXIT_FAILED
+    out.emit(result)
+    return EXIT_OK if result.get("ok", True) else EXIT_FAILED
+
+
+# ---------------------------------------------------------
+# 4. ARGUMENTS
+# ---------------------------------------------------------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-dir", help="index data directory (default: CODEMIND_DATA_DIR or the cwd)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="ingest one or more repos (paths or git URLs)")
+    ingest.add_argument("repos", nargs="*")
+    ingest.add_argument("--repos-file", help="file with one repo per line ('-' for stdin)")
+    ingest.add_argument("--data-root", help="one data directory per repo under this one (required for several)")
+    ingest.add_argument("--workers", type=int, default=2, help="repos ingested at the same time (default: 2)")
+    ingest.add_argument("--profile", action="store_true", help="profile each ingestion (see /profiles)")
+
+    query = commands.add_parser("query", help="answer questions against the index")
+    query.add_argument("question", nargs="*")
+    query.add_argument("--questions", help="file with one question (or JSON object) per line ('-' for stdin)")
+    query.add_argument("--filter", help="only search files whose path contains this")
+    query.add_argument("--with-code", action="store_true", help="include the code of every context item")
+    query.add_argument("--debug", action="store_true", help="include stage timings and candidate counts")
+
+    snapshot = commands.add_parser("snapshot", help="export, verify or import an index snapshot")
+    snapshot.add_argument("action", choices=("export", "verify", "import"))
+    snapshot.add_argument("path")
+    snapshot.add_argument("--overwrite", action="store_true", help="export: replace an existing snapshot")
+    snapshot.add_argument("--no-checksums", action="store_true", help="verify: compare sizes only")
+    snapshot.add_argument("--force", action="store_true", help="import: accept a different embedding model")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.data_dir:
+        # Before any app import: DATA_DIR and the database path are read at import time
+        data_dir = os.path.abspath(args.data_dir)
+        os.makedirs(data_dir, exist_ok=True)
+        os.environ["CODEMIND_DATA_DIR"] = data_dir
+        os.environ.setdefault("SQLITE_PATH", os.path.join(data_dir, "assistant.db"))
+
+    out = JsonLines(sys.stdout)
+    handlers = {"ingest": run_ingest, "query": run_query, "snapshot": run_snapshot}
+    # Everything the app prints is logging; stdout stays parseable
+    with contextlib.redirect_stdout(sys.stderr):
+        return handlers[args.command](args, out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#admission.py
+"""
+Admission control for the expensive endpoints, so overload is turned away
+quickly instead of slowing every request down together.
+
+- Rate limits: a token bucket per client IP and endpoint class. The user_id
+  of a request body is not authenticated, so it never picks the bucket: a
+  fresh one per request would be a fresh bucket too. An empty bucket is a
+  429 with Retry-After.
+- Chat concurrency: at most CHAT_MAX_ACTIVE answers are generated at once
+  (each holds reranker and Gemini time). Up to CHAT_MAX_WAITING more wait
+  at most CHAT_QUEUE_TIMEOUT_S for a slot; beyond that, or after the
+  timeout, the request gets a 503 right away. Queue time is therefore
+  bounded, and so is the latency of every admitted request.
+- Ingestion: the single-writer lock (coordination.py) already caps jobs at
+  one per data directory; the bucket keeps one client from wiping the index
+  over and over.
+
+Limits are per process: with N pre-forked workers the server admits up to
+N times these numbers. Depths and rejections are exported in /metrics.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional
+from app.core import metrics
+
+# ---------------------------------------------------------
+# CONFIGURATION (env overridable, 0 = unlimited)
+# ---------------------------------------------------------
+CHAT_RATE_PER_MIN = float(os.getenv("CHAT_RATE_PER_MIN", "30"))
+CHAT_RATE_BURST = float(os.getenv("CHAT_RATE_BURST", "10"))
+INGEST_RATE_PER_HOUR = float(os.getenv("INGEST_RATE_PER_HOUR", "6"))
+INGEST_RATE_BURST = float(os.getenv("INGEST_RATE_BURST", "2"))
+CHAT_MAX_ACTIVE = int(os.getenv("CHAT_MAX_ACTIVE", "4"))
+CHAT_MAX_WAITING = int(os.getenv("CHAT_MAX_WAITING", "16"))
+CHAT_QUEUE_TIMEOUT_S = float(os.getenv("CHAT_QUEUE_TIMEOUT_S", "10"))
+# Clients tracked per bucket set (least recently seen are dropped first)
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Behind a reverse proxy the client address is the first X-Forwarded-For hop
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+
+class AdmissionError(Exception):
+    """Request turned away: `status_code` is 429 (rate) or 503 (saturated)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def client_key(host: Optional[str], forwarded_for: Optional[str] = None) -> str:
+    if TRUST_FORWARDED_FOR and forwarded_for:
+        return f"ip:{forwarded_for.split(',')[0].strip()}"
+    return f"ip:{host or 'unknown'}"
+
+
+# ---------------------------------------------------------
+# 1. TOKEN BUCKETS (per client)
+# ---------------------------------------------------------
+class RateLimiter:
+    """`rate` tokens per second refill each client's bucket of `burst` tokens."""
+
+    def __init__(self, name: str, rate: float, burst: float, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last refill]
+
+    def acquire(self, key: str, cost: float = 1.0):
+        """Takes `cost` tokens or raises AdmissionError(429)."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None) or [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return
+            wait = (cost - bucket[0]) / self.rate
+        metrics.admission_rejected.inc(endpoint=self.name, reason="rate_limited")
+        raise AdmissionError(f"Too many {self.name} requests; retry in {wait:.0f}s", 429, wait)
+
+
+# ---------------------------------------------------------
+# 2. BOUNDED CONCURRENCY (per endpoint)
+# ---------------------------------------------------------
+class ConcurrencyLimiter:
+    """
+    `max_active` holders at once; at most `max_waiting` callers block (up to
+    `timeout` seconds) for a slot, everyone else is rejected immediately.
+    A released slot is handed straight to the longest waiter (FIFO).
+    """
+
+    def __init__(self, name: str, max_active: int, max_waiting: int, timeout: float):
+        self.name = name
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queue = deque()  # [granted] flags of the waiters, oldest first
+
+    def _publish(self):
+        metrics.queue_depth.set(len(self._queue), queue=f"{self.name}_waiting")
+        metrics.queue_depth.set(self._active, queue=f"{self.name}_active")
+
+    def _reject(self, reason: str, message: str):
+        metrics.admission_rejected.inc(endpoint=self.name, reason=reason)
+        raise AdmissionError(message, 503, self.timeout)
+
+    @contextmanager
+    def slot(self):
+        """Holds one slot for the block, or raises AdmissionError(503)."""
+        if self.max_active <= 0:
+            yield
+            return
+        with self._cond:
+            # Slots are handed over while anyone waits, so a free one means an empty queue
+            if self._active < self.max_active:
+                self._active += 1
+            elif len(self._queue) >= self.max_waiting:
+                self._reject("queue_full", f"Server busy: {len(self._queue)} {self.name} requests already waiting")
+            else:
+                waiter = [False]
+                self._queue.append(waiter)
+                self._publish()
+                deadline = time.monotonic() + self.timeout
+                with metrics.span(self.name, "admission_wait"):
+                    while not waiter[0]:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                if not waiter[0]:
+                    self._queue.remove(waiter)
+                    self._publish()
+                    self._reject("timeout", f"Server busy: no {self.name} slot within {self.timeout:g}s")
+            self._publish()
+        try:
+            yield
+        finally:
+            with self._cond:
+                if self._queue:
+                    self._queue.popleft()[0] = True  # the slot passes on, _active is unchanged
+                    self._cond.notify_all()
+                else:
+                    self._active -= 1
+                self._publish()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"active": self._active, "waiting": len(self._queue),
+                    "max_active": self.max_active, "max_waiting": self.max_waiting}
+
+
+chat_rate_limiter = RateLimiter("chat", CHAT_RATE_PER_MIN / 60.0, CHAT_RATE_BURST)
+ingest_rate_limiter = RateLimiter("ingest", INGEST_RATE_PER_HOUR / 3600.0, INGEST_RATE_BURST)
+chat_slots = ConcurrencyLimiter("chat", CHAT_MAX_ACTIVE, CHAT_MAX_WAITING, CHAT_QUEUE_TIMEOUT_S)
@@ -0,0 +1,124 @@
+#candidates.py
+"""
+Retrieval candidates as parallel NumPy arrays: chunk ids, vector scores and
+cross-encoder scores, index-aligned with the passage dicts. Ordering, score
+fusion, top-k selection and the per-file cap run on the arrays; only the
+final top-k passages are copied into result dicts (materialize), so raising
+the retrieval depth to hundreds of candidates stays cheap.
+
+Missing scores are NaN: only symbol hits lack a vector score (rag.py scores
+passages cached from earlier turns against the new query), and only the
+passages that reached the cross-encoder have a rerank score.
+
+Final scores are on one scale, 0-1 relevance: the cross-encoder's
+probability, or the cosine similarity mapped linearly from
+[floor, ceil] onto [0, 1] where nothing was reranked (symbol hits: 1).
+Results carry "scored_by" ("rerank", "vector" or "symbol") to tell them apart.
+"""
+from typing import Dict, List, Optional
+import numpy as np
+
+
+def cosine_relevance(sims: np.ndarray, floor: float, ceil: float) -> np.ndarray:
+    """Cosine similarities to 0-1 relevance: `floor` and below is 0, `ceil` and above 1."""
+    return np.clip((np.asarray(sims, dtype=np.float64) - floor) / max(ceil - floor, 1e-6), 0.0, 1.0)
+
+
+def top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the `k` highest scores, best first (ties keep input order)."""
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        # O(n) selection, then only the k winners are sorted
+        picked = np.argpartition(-scores, k - 1)[:k]
+        picked.sort()
+    else:
+        picked = np.arange(n)
+    return picked[np.argsort(-scores[picked], kind="stable")]
+
+
+class CandidateSet:
+    def __init__(self, passages: List[dict], vector_scores: Optional[Dict[int, float]] = None):
+        n = len(passages)
+        self.passages = passages
+        self.ids = np.fromiter((p["id"] for p in passages), dtype=np.int64, count=n)
+        if vector_scores:
+            self.vector = np.fromiter((vector_scores.get(p["id"], np.nan) for p in passages),
+                                      dtype=np.float64, count=n)
+        else:
+            self.vector = np.full(n, np.nan, dtype=np.float64)
+        self.rerank = np.full(n, np.nan, dtype=np.float64)
+        self._files = None
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def subset(self, index: np.ndarray) -> "CandidateSet":
+        """The candidates at `index`, in that order (scores carried along)."""
+        index = np.asarray(index, dtype=np.int64)
+        subset = CandidateSet.__new__(CandidateSet)
+        subset.passages = [self.passages[i] for i in index]
+        subset.ids = self.ids[index]
+        subset.vector = self.vector[index]
+        subset.rerank = self.rerank[index]
+        subset._files = self._files[index] if self._files is not None else None
+        return subset
+
+    def vector_ranking(self) -> np.ndarray:
+        """
+        Similarities with missing ones (symbol hits) as +inf, so those always
+        rank first, like an exact match.
+        """
+        return np.where(np.isnan(self.vector), np.inf, self.vector)
+
+    def files(self) -> np.ndarray:
+        """One integer per candidate, equal for candidates from the same file."""
+        if self._files is None:
+            paths = [p["meta"].get("file_path") or "" for p in self.passages]
+            self._files = np.unique(np.array(paths, dtype=object), return_inverse=True)[1].astype(np.int64)
+        return self._files
+
+    def relevance(self, floor: float, ceil: float) -> np.ndarray:
+        """Vector scores as 0-1 relevance (cosine_relevance); symbol hits are 1."""
+        return np.where(np.isnan(self.vector), 1.0, cosine_relevance(np.nan_to_num(self.vector), floor, ceil))
+
+    def fused(self, floor: float, ceil: float, vector_weight: float = 0.0) -> np.ndarray:
+        """
+        Final 0-1 scores: the cross-encoder probability, blended with the
+        vector relevance by `vector_weight`; the vector relevance alone where
+        no rerank score exists.
+        """
+        relevance = self.relevance(floor, ceil)
+        if vector_weight > 0:
+            blended = (1.0 - vector_weight) * self.rerank + vector_weight * relevance
+        else:
+            blended = self.rerank
+        return np.where(np.isnan(self.rerank), relevance, blended)
+
+    def top(self, scores: np.ndarray, k: int, per_file: int = 0) -> np.ndarray:
+        """
+        Positions of the best `k` candidates by `scores`, best first, with
+        at most `per_file` from any one file (0 = no cap).
+        """
+        if per_file > 0:
+            return self._capped(scores, k, per_file)
+        return top_indices(scores, k)
+
+    def _capped(self, scores: np.ndarray, k: int, per_file: int) -> np.ndarray:
+        order = np.argsort(-scores, kind="stable")
+        files = self.files()[order]
+        # Rank of each candidate among those of its file: position in a
+        # stable sort by file minus the position where that file's run starts
+        by_file = np.argsort(files, kind="stable")
+        grouped = files[by_file]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+        run_start = np.repeat(starts, np.diff(np.r_[starts, len(grouped)]))
+        rank_in_file = np.empty(len(order), dtype=np.int64)
+        rank_in_file[by_file] = np.arange(len(order)) - run_start
+        return order[rank_in_file < per_file][:k]
+
+    def materialize(self, index: np.ndarray, scores: np.ndarray) -> List[dict]:
+        """Result dicts (passage + "score", "scored_by") for the candidates at `index` only."""
+        sources = np.where(~np.isnan(self.rerank), "rerank", np.where(np.isnan(self.vector), "symbol", "vector"))
+        return [dict(self.passages[i], score=float(scores[i]), scored_by=str(sources[i])) for i in index]
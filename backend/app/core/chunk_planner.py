@@ -0,0 +1,280 @@
+#chunk_planner.py
+"""
+Sizes chunks for the embedder. MiniLM reads at most CHUNK_MAX_TOKENS word
+pieces of a chunk: the rest is never embedded, yet still goes whole to the
+reranker and the LLM.
+
+- Python: every top-level statement is a unit. A definition that fits the
+  budget is one chunk, nested definitions included, so nothing is emitted
+  twice. One that does not fit is split between the statements of its body,
+  recursing into compound statements (if/for/try/with, nested definitions)
+  that are still too big, and into lines as a last resort. Every piece
+  starts with the signature lines of the scopes it sits in; `# ...` marks
+  the lines skipped in between. Definitions under CHUNK_MIN_TOKENS and
+  module-level code are merged with their neighbours up to the budget.
+- Other files: the text chunker's window is the same token budget, in
+  characters for that kind of text.
+
+Token counts are estimates from the whitespace-collapsed length
+(CHARS_PER_TOKEN). ChunkSizes is the histogram of one ingestion/sync run.
+"""
+import os
+import math
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+from app.core.metrics import TOKEN_BUCKETS
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+# Smaller definitions are merged with their neighbours instead of standing alone
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "48"))
+
+# Approximate characters per MiniLM word piece (whitespace collapsed):
+# identifiers and operators split into many pieces, prose into few
+CHARS_PER_TOKEN = {"code": 2.8, "markup": 2.6, "data": 2.4, "prose": 4.2}
+_TEXT_KINDS = {
+    ".md": "prose", ".rst": "prose", ".txt": "prose",
+    ".html": "markup", ".xml": "markup", ".svg": "markup", ".css": "markup", ".scss": "markup",
+    ".json": "data", ".yml": "data", ".yaml": "data", ".toml": "data", ".ini": "data",
+    ".cfg": "data", ".csv": "data", ".lock": "data",
+}
+
+_DEFINITIONS = ("function_definition", "class_definition", "decorated_definition")
+
+
+def text_kind(filename: str) -> str:
+    return _TEXT_KINDS.get(os.path.splitext(filename)[1].lower(), "code")
+
+def estimate_tokens(text: str, filename: str) -> int:
+    return math.ceil(len(" ".join(text.split())) / CHARS_PER_TOKEN[text_kind(filename)])
+
+def char_budget(filename: str) -> int:
+    """CHUNK_MAX_TOKENS in characters of this kind of text."""
+    return int(CHUNK_MAX_TOKENS * CHARS_PER_TOKEN[text_kind(filename)])
+
+
+# ---------------------------------------------------------
+# 1. PYTHON PLANNER
+# ---------------------------------------------------------
+class _Unit:
+    """A statement (with the comments right above it) at one nesting level."""
+    __slots__ = ("start", "end", "node")
+
+    def __init__(self, start: int, end: int, node):
+        self.start, self.end, self.node = start, end, node  # 1-based, inclusive
+
+    @property
+    def is_definition(self) -> bool:
+        return self.node is not None and self.node.type in _DEFINITIONS
+
+
+class _PythonPlanner:
+    def __init__(self, code: str):
+        self.lines = code.split("\n")
+        self.budget = CHUNK_MAX_TOKENS * CHARS_PER_TOKEN["code"]
+        self.min_size = CHUNK_MIN_TOKENS * CHARS_PER_TOKEN["code"]
+        # Prefix sums of the collapsed line lengths: the size of any line range is O(1)
+        self._prefix = [0]
+        for line in self.lines:
+            self._prefix.append(self._prefix[-1] + len(" ".join(line.split())) + 1)
+        self.chunks: List[dict] = []
+
+    def _size(self, start: int, end: int) -> int:
+        return self._prefix[end] - self._prefix[start - 1]
+
+    def _header_size(self, header) -> int:
+        return sum(self._size(s, e) + 8 for s, e in header)  # + a `# ...` marker each
+
+    def _fits(self, header, start: int, end: int) -> bool:
+        return self._header_size(header) + self._size(start, end) <= self.budget
+
+    def _blank(self, start: int, end: int) -> bool:
+        return all(not self.lines[i - 1].strip() for i in range(start, end + 1))
+
+    def _trim(self, header):
+        """Drops the outermost signatures while they take over half the budget."""
+        while len(header) > 1 and self._header_size(header) > self.budget / 2:
+            header = header[1:]
+        return header
+
+    @staticmethod
+    def _line_range(node) -> Tuple[int, int]:
+        (start, _), (end, column) = node.start_point, node.end_point
+        if column == 0 and end > start:
+            end -= 1
+        return start + 1, end + 1
+
+    @staticmethod
+    def _owner(node):
+        if node.type == "decorated_definition":
+            return node.child_by_field_name("definition") or node
+        return node
+
+    def _name(self, unit: _Unit, scope: List[str]) -> Optional[str]:
+        name_node = self._owner(unit.node).child_by_field_name("name") if unit.is_definition else None
+        return ".".join(scope + [name_node.text.decode("utf8")]) if name_node else None
+
+    def _units(self, nodes) -> List[_Unit]:
+        units, comments = [], None
+        for node in nodes:
+            start, end = self._line_range(node)
+            if node.type == "comment":
+                if units and start <= units[-1].end:
+                    continue  # trailing comment of the previous statement
+                comments = (comments[0], end) if comments else (start, end)
+                continue
+            if comments:
+                if comments[1] + 1 == start:
+                    start = comments[0]
+                else:
+                    units.append(_Unit(comments[0], comments[1], None))
+                comments = None
+            units.append(_Unit(start, end, node))
+        if comments:
+            units.append(_Unit(comments[0], comments[1], None))
+        return units
+
+    def _emit(self, header, start: int, end: int, name: str):
+        ranges = []
+        for s, e in list(header) + [(start, end)]:
+            if ranges and (s <= ranges[-1][1] + 1 or self._blank(ranges[-1][1] + 1, s - 1)):
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], e))
+            else:
+                ranges.append((s, e))
+        parts = []
+        for i, (s, e) in enumerate(ranges):
+            if i:
+                first = self.lines[s - 1]
+                parts.append(first[:len(first) - len(first.lstrip())] + "# ...")
+            parts.append("\n".join(self.lines[s - 1:e]))
+        self.chunks.append({
+            "name": name,
+            "code": "\n".join(parts),
+            # The run holding the piece itself: a split definition's first
+            # piece starts on its `def` line, so symbols still map to it
+            "start_line": ranges[-1][0],
+            "end_line": end,
+        })
+
+    def _pack(self, units: List[_Unit], header, lead, scope: List[str], standalone: bool):
+        """
+        Greedily groups `units` into pieces under `header`. `lead` replaces
+        the header of the first piece (it also holds the comments and
+        decorators of the definition being split). With `standalone`,
+        definitions of at least CHUNK_MIN_TOKENS get a piece of their own.
+        """
+        emitted = len(self.chunks)
+        scope_name = ".".join(scope) or "<module>"
+        group: List[_Unit] = []
+
+        def current():
+            return lead if lead is not None and len(self.chunks) == emitted else header
+
+        def flush():
+            if group:
+                names = [n for n in (self._name(u, scope) for u in group) if n]
+                self._emit(current(), group[0].start, group[-1].end, ", ".join(names) or scope_name)
+                group.clear()
+
+        for unit in units:
+            if not self._fits(current(), unit.start, unit.end):
+                flush()
+                self._split(unit, header, current(), scope, standalone)
+                continue
+            if standalone and unit.is_definition and self._size(unit.start, unit.end) >= self.min_size:
+                flush()
+                self._emit(current(), unit.start, unit.end, self._name(unit, scope))
+                continue
+            if group and not self._fits(current(), group[0].start, unit.end):
+                flush()
+            group.append(unit)
+        flush()
+
+    def _split(self, unit: _Unit, header, lead, scope: List[str], standalone: bool):
+        node = unit.node
+        owner = self._owner(node) if node is not None else None
+        blocks = [i for i, child in enumerate(owner.children) if child.type == "block"] if owner else []
+        body = owner.children[blocks[0]].named_children if blocks else []
+        body_start = self._line_range(body[0])[0] if body else None
+        if not body or body_start <= self._line_range(node)[0]:
+            self._split_lines(unit, header, lead, scope)
+            return
+
+        # Statements of the block(s), and clauses (elif/else/except/finally) whole
+        children = []
+        for child in owner.children[blocks[0]:]:
+            if child.type == "block":
+                children.extend(child.named_children)
+            elif child.is_named:
+                children.append(child)
+
+        first = len(self.chunks)
+        name = self._name(unit, scope)
+        inner_scope = scope + [name.rsplit(".", 1)[-1]] if name else scope
+        self._pack(
+            self._units(children),
+            self._trim(header + [(self._line_range(node)[0], body_start - 1)]),
+            self._trim((lead if lead is not None else header) + [(unit.start, body_start - 1)]),
+            inner_scope,
+            owner.type == "class_definition" or (standalone and not name),
+        )
+        # Pieces that hold no definition of their own are numbered parts of this one
+        parts = [c for c in self.chunks[first:] if c["name"] == ".".join(inner_scope)]
+        if name and len(parts) > 1:
+            for i, chunk in enumerate(parts, 1):
+                chunk["name"] = f"{name} (part {i}/{len(parts)})"
+
+    def _split_lines(self, unit: _Unit, header, lead, scope: List[str]):
+        """Last resort (one huge statement): runs of whole lines."""
+        name = self._name(unit, scope) or ".".join(scope) or "<module>"
+        start, size = unit.start, 0
+        current = lead if lead is not None else header
+        # Later runs repeat the statement's first line (`BIG = [`, `def f(): ...`)
+        opening = self._trim(header + [(self._line_range(unit.node)[0],) * 2]) if unit.node else header
+        for line in range(unit.start, unit.end + 1):
+            weight = self._size(line, line)
+            if line > start and self._header_size(current) + size + weight > self.budget:
+                self._emit(current, start, line - 1, name)
+                current, start, size = opening, line, 0
+            size += weight
+        self._emit(current, start, unit.end, name)
+
+    def plan(self, root) -> List[dict]:
+        self._pack(self._units(root.named_children), [], None, [], True)
+        return self.chunks
+
+
+def plan_python_chunks(root, code: str) -> List[dict]:
+    """Chunks ({name, code, start_line, end_line}) for a parsed Python module."""
+    return _PythonPlanner(code).plan(root)
+
+
+# ---------------------------------------------------------
+# 2. PER-RUN SIZE HISTOGRAM
+# ---------------------------------------------------------
+class ChunkSizes:
+    """Estimated token sizes of the chunks one ingestion or sync embedded."""
+
+    def __init__(self):
+        self.counts = [0] * (len(TOKEN_BUCKETS) + 1)
+        self.chunks = 0
+        self.tokens = 0
+        self.largest = 0
+        self.over_limit = 0
+
+    def add(self, tokens: int):
+        self.counts[bisect_left(TOKEN_BUCKETS, tokens)] += 1
+        self.chunks += 1
+        self.tokens += tokens
+        self.largest = max(self.largest, tokens)
+        self.over_limit += tokens > CHUNK_MAX_TOKENS
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in TOKEN_BUCKETS] + [f">{TOKEN_BUCKETS[-1]}"]
+        return {
+            "chunks": self.chunks,
+            "tokens": dict(zip(labels, self.counts)),
+            "mean_tokens": round(self.tokens / self.chunks, 1) if self.chunks else 0,
+            "max_tokens": self.largest,
+            "over_limit": self.over_limit,
+            "limit": CHUNK_MAX_TOKENS,
+        }
@@ -0,0 +1,454 @@
+#chunk_store.py
+"""
+One place to read and write chunks. A search returns its hits with their text
+and metadata in one call; nothing is fetched from SQLite per query.
+
+Text and metadata live once, in a compressed content store keyed by chunk ID
+(DATA_DIR/chunk_store/):
+- records.bin: zlib-compressed JSON records, append-only
+- records.idx: fixed-size (id, offset, length, raw_length) entries, appended
+  after the record bytes so a reader never sees an entry without its record
+Every worker memory-maps both files read-only and remaps when they grow, like
+the local vector index.
+
+SQLite keeps the relational side: chunk rows without their text (file and
+line filters, dependency expansion) and the symbol table. Pinecone keeps only
+small filterable metadata. Deleted chunks (incremental sync) leave dead records
+behind; a full ingestion starts the files afresh. Appending a record for an
+existing ID supersedes the old one (used to move a chunk to another location).
+
+Duplicate chunks (dedup.py) are embedded once; their other locations come from
+the chunk_locations table, mirrored in memory per index generation, and are
+returned as meta["also_in"]. A file filter matches any of the locations.
+"""
+import os
+import json
+import zlib
+import shutil
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlmodel import Session, select, delete, col, or_
+from app.core.coordination import DATA_DIR, index_generation
+from app.core.vector_store import vector_db, VECTOR_BACKEND
+from app.db.session import engine
+from app.db.models import Chunk, ChunkLocation
+
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", os.path.join(DATA_DIR, "chunk_store"))
+CHUNK_STORE_COMPRESSION = int(os.getenv("CHUNK_STORE_COMPRESSION", "6"))  # zlib level
+# Pinecone drill-down: files in one metadata filter (more: plain search instead)
+ROUTE_MAX_FILTER_FILES = int(os.getenv("ROUTE_MAX_FILTER_FILES", "500"))
+
+INDEX_DTYPE = np.dtype([("id", "<i8"), ("offset", "<i8"), ("length", "<i4"), ("raw_length", "<i4")])
+
+
+def _passage(chunk_id: int, record: dict) -> dict:
+    # The shape rag.py and the reranker work with
+    return {
+        "id": chunk_id,
+        "text": record["text"],
+        "meta": {
+            "file_name": record["file_name"],
+            "file_path": record["file_path"],
+            "start_line": record["start_line"],
+            "end_line": record["end_line"],
+            "type": record["type"],
+        },
+    }
+
+def _row_passage(chunk: Chunk) -> dict:
+    return _passage(chunk.id, {
+        "text": chunk.content, "file_name": chunk.file_name, "file_path": chunk.file_path,
+        "start_line": chunk.start_line, "end_line": chunk.end_line, "type": chunk.chunk_type,
+    })
+
+def _path_matches(file_path: Optional[str], file_filter: Optional[str]) -> bool:
+    # Same semantics as the SQL LIKE '%filter%' it replaces (ASCII case-insensitive)
+    return not file_filter or file_filter.lower() in (file_path or "").lower()
+
+def matches_filter(passage: dict, file_filter: Optional[str]) -> bool:
+    return _path_matches(passage["meta"]["file_path"], file_filter)
+
+def _with_locations(passage: dict, others: List[dict], file_filter: Optional[str]) -> dict:
+    """
+    Adds meta["also_in"]. When the filter rules out the stored location but
+    matches a copy, that copy is reported as the passage's location instead.
+    """
+    meta = passage["meta"]
+    locations = [{key: meta[key] for key in ("file_name", "file_path", "start_line", "end_line")}] + others
+    primary = next((loc for loc in locations if _path_matches(loc["file_path"], file_filter)), locations[0])
+    meta.update(primary)
+    meta["also_in"] = [
+        {"file_path": loc["file_path"], "start_line": loc["start_line"], "end_line": loc["end_line"]}
+        for loc in locations if loc is not primary
+    ]
+    return passage
+
+
+# ---------------------------------------------------------
+# 1. CONTENT STORE (compressed, memory-mapped)
+# ---------------------------------------------------------
+class ContentStore:
+    def __init__(self, store_dir: str = CHUNK_STORE_DIR):
+        self.store_dir = store_dir
+        self._data_path = os.path.join(self.store_dir, "records.bin")
+        self._index_path = os.path.join(self.store_dir, "records.idx")
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._data = np.zeros(0, dtype=np.uint8)
+        self._index = np.zeros(0, dtype=INDEX_DTYPE)
+        self._order = None  # argsort of ids when they aren't appended in order
+        self._remap()
+
+    def _file_stamp(self):
+        try:
+            index_stat = os.stat(self._index_path)
+            data_stat = os.stat(self._data_path)
+        except FileNotFoundError:
+            return None
+        return (index_stat.st_ino, index_stat.st_size, data_stat.st_ino, data_stat.st_size)
+
+    def _remap(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            self._stamp = stamp
+            rows = stamp[1] // INDEX_DTYPE.itemsize if stamp else 0
+            if rows == 0 or stamp[3] == 0:
+                self._data = np.zeros(0, dtype=np.uint8)
+                self._index = np.zeros(0, dtype=INDEX_DTYPE)
+                self._order = None
+                return
+            self._data = np.memmap(self._data_path, dtype=np.uint8, mode="r", shape=(stamp[3],))
+            self._index = np.memmap(self._index_path, dtype=INDEX_DTYPE, mode="r", shape=(rows,))
+            ids = self._index["id"]
+            # IDs come from one increasing counter, so this is normally a no-op
+            self._order = None if bool(np.all(ids[1:] >= ids[:-1])) else np.argsort(ids, kind="stable")
+
+    def __len__(self):
+        self._remap()
+        return len(self._index)
+
+    def stats(self) -> dict:
+        self._remap()
+        index = self._index
+        return {
+            "records": len(index),
+            "stored_bytes": int(index["length"].sum()) if len(index) else 0,
+            "raw_bytes": int(index["raw_length"].sum()) if len(index) else 0,
+        }
+
+    def put(self, chunks: Iterable[Chunk]):
+        """Appends one record per chunk. Only the ingestion writer calls this."""
+        blobs = []
+        entries = []
+        with self._lock:
+            offset = os.path.getsize(self._data_path) if os.path.exists(self._data_path) else 0
+            for chunk in chunks:
+                raw = json.dumps({
+                    "text": chunk.content, "file_name": chunk.file_name, "file_path": chunk.file_path,
+                    "start_line": chunk.start_line, "end_line": chunk.end_line, "type": chunk.chunk_type,
+                }, separators=(",", ":")).encode()
+                blob = zlib.compress(raw, CHUNK_STORE_COMPRESSION)
+                blobs.append(blob)
+                entries.append((chunk.id, offset, len(blob), len(raw)))
+                offset += len(blob)
+            if not entries:
+                return
+            # Created on first write: importing the module leaves DATA_DIR alone
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(self._data_path, "ab") as f:
+                f.write(b"".join(blobs))
+            with open(self._index_path, "ab") as f:
+                f.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+        self._remap()
+
+    def _rows(self, ids: Iterable[int]):
+        """(chunk ID, index entry) for the IDs present, plus the data map they point into."""
+        self._remap()
+        with self._lock:
+            index, data, order = self._index, self._data, self._order
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(index) == 0 or len(ids) == 0:
+            return [], data
+
+        sorted_ids = index["id"] if order is None else index["id"][order]
+        # Last entry of an ID wins: a re-put record supersedes (stable argsort keeps append order)
+        positions = np.searchsorted(sorted_ids, ids, side="right") - 1
+        rows = []
+        for chunk_id, pos in zip(ids.tolist(), positions.tolist()):
+            if pos < 0 or sorted_ids[pos] != chunk_id:
+                continue
+            rows.append((chunk_id, index[pos if order is None else order[pos]]))
+        return rows, data
+
+    def get(self, ids: Iterable[int]) -> Dict[int, dict]:
+        """Passages for the IDs present in the store (missing IDs are left out)."""
+        rows, data = self._rows(ids)
+        found = {}
+        for chunk_id, row in rows:
+            start = int(row["offset"])
+            record = json.loads(zlib.decompress(data[start:start + int(row["length"])].tobytes()))
+            found[chunk_id] = _passage(chunk_id, record)
+        return found
+
+    def export_to(self, out_dir: str, ids: Iterable[int]) -> int:
+        """
+        Writes the current record of each of `ids`, in ID order, to out_dir
+        (same two files). Dead and superseded records stay behind; the
+        compressed bytes are copied as they are.
+        """
+        rows, data = self._rows(np.unique(np.asarray(list(ids), dtype=np.int64)))
+        entries = []
+        offset = 0
+        with open(os.path.join(out_dir, "records.bin"), "wb") as f:
+            for chunk_id, row in rows:
+                start, length = int(row["offset"]), int(row["length"])
+                f.write(data[start:start + length].tobytes())
+                entries.append((chunk_id, offset, length, int(row["raw_length"])))
+                offset += length
+        np.array(entries, dtype=INDEX_DTYPE).tofile(os.path.join(out_dir, "records.idx"))
+        return len(entries)
+
+    def load_from(self, src_dir: str):
+        """
+        Swaps in copies of a snapshot's files. The index is emptied first, so
+        a reader never sees old entries pointing into the new data file.
+        """
+        with self._lock:
+            os.makedirs(self.store_dir, exist_ok=True)
+            tmp_path = self._index_path + ".tmp"
+            open(tmp_path, "wb").close()
+            os.replace(tmp_path, self._index_path)
+            for name, path in (("records.bin", self._data_path), ("records.idx", self._index_path)):
+                tmp_path = path + ".tmp"
+                shutil.copyfile(os.path.join(src_dir, name), tmp_path)
+                os.replace(tmp_path, path)
+        self._remap()
+
+    def reset(self):
+        """Swaps in empty files; other workers' maps stay valid until they remap."""
+        with self._lock:
+            os.makedirs(self.store_dir, exist_ok=True)
+            for path in (self._index_path, self._data_path):
+                tmp_path = path + ".tmp"
+                open(tmp_path, "wb").close()
+                os.replace(tmp_path, path)
+        self._remap()
+
+
+# ---------------------------------------------------------
+# 2. DUPLICATE LOCATIONS (in-memory mirror of chunk_locations)
+# ---------------------------------------------------------
+class LocationIndex:
+    """chunk_id -> locations of its collapsed copies; reloaded when the index generation moves."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_chunk: Dict[int, List[dict]] = {}
+        self._generation = None
+
+    def _ensure_loaded(self):
+        generation = index_generation()
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation == self._generation:
+                return
+            by_chunk = defaultdict(list)
+            try:
+                with Session(engine) as session:
+                    rows = session.exec(select(ChunkLocation)).all()
+            except Exception:
+                rows = []  # table doesn't exist yet (nothing ingested)
+            for row in rows:
+                by_chunk[row.chunk_id].append({
+                    "file_name": row.file_name, "file_path": row.file_path,
+                    "start_line": row.start_line, "end_line": row.end_line,
+                })
+            self._by_chunk = dict(by_chunk)
+            self._generation = generation
+
+    def get(self, ids: Iterable[int]) -> Dict[int, List[dict]]:
+        self._ensure_loaded()
+        by_chunk = self._by_chunk
+        return {i: by_chunk[i] for i in ids if i in by_chunk}
+
+
+# ---------------------------------------------------------
+# 3. CHUNK STORE (vectors + content + relational rows)
+# ---------------------------------------------------------
+class ChunkStore:
+    def __init__(self, content: Optional[ContentStore] = None):
+        self.content = content or ContentStore()
+        self.locations = LocationIndex()
+
+    def add(self, vectors: np.ndarray, chunks: List[Chunk], vector_metadatas: Optional[List[dict]] = None):
+        """
+        Writes a batch everywhere it belongs: vectors (with small filterable
+        metadata), text + metadata to the content store, text-less SQL rows.
+        """
+        vector_db.add_vectors(vectors, vector_metadatas, ids=[chunk.id for chunk in chunks])
+        vector_db.save()
+        self.content.put(chunks)
+        with Session(engine) as session:
+            for chunk in chunks:
+                session.add(Chunk(
+                    id=chunk.id, chunk_hash=chunk.chunk_hash, chunk_type=chunk.chunk_type,
+                    file_name=chunk.file_name, file_path=chunk.file_path,
+                    start_line=chunk.start_line, end_line=chunk.end_line,
+                ))
+            session.commit()
+
+    def search(self, query_vector: np.ndarray, k: int = 50,
+               file_filter: Optional[str] = None) -> Tuple[List[dict], Dict[int, float]]:
+        """
+        Nearest chunks as passages (best first) plus the vector score of every
+        hit, including hits the file filter dropped.
+        """
+        distances, indices = vector_db.search(query_vector, k=k)
+        scores = {int(idx): float(dist) for idx, dist in zip(indices[0], distances[0]) if idx != -1}
+        passages = self.get(list(scores), file_filter)
+        return passages, scores
+
+    def search_within(self, query_vector: np.ndarray, scopes: List[dict], k: int = 20,
+                      file_filter: Optional[str] = None, max_ids: int = 20000):
+        """
+        search() restricted to the chunks of the given files and directories
+        (summary routes, see summaries.py), copies located there included.
+        None when the scope is the whole repository or over `max_ids` chunks
+        (Pinecone: ROUTE_MAX_FILTER_FILES files), where a plain search is just
+        as good. The local index scores the scope's rows exactly; Pinecone
+        gets one query filtered on the files those chunks are stored under.
+        """
+        files = [scope["path"] for scope in scopes if scope["kind"] == "file"]
+        dirs = [scope["path"].rstrip("/") + "/" for scope in scopes if scope["kind"] == "dir" and not scope["root"]]
+        if not files and not dirs:
+            return None
+
+        def in_scope(column):
+            return or_(col(column).in_(files), *[col(column).startswith(d, autoescape=True) for d in dirs])
+
+        if VECTOR_BACKEND != "local":
+            with Session(engine) as session:
+                paths = set(session.exec(
+                    select(Chunk.file_path).where(in_scope(Chunk.file_path), Chunk.chunk_type == "code").distinct()
+                ).all())
+                # Copies located in scope are stored (and filtered) under their chunk's own file;
+                # that file's other chunks are out of scope
+                copies = dict(session.exec(
+                    select(Chunk.id, Chunk.file_path).join(ChunkLocation, ChunkLocation.chunk_id == Chunk.id)
+                    .where(in_scope(ChunkLocation.file_path))
+                ).all())
+                copied_from = set(copies.values()) - paths
+                excluded = set(session.exec(
+                    select(Chunk.id).where(col(Chunk.file_path).in_(copied_from))
+                ).all()) - set(copies) if copied_from else set()
+            paths |= copied_from
+            if not paths or len(paths) > ROUTE_MAX_FILTER_FILES:
+                return None
+            distances, indices = vector_db.search_files(query_vector, paths, k=min(k + len(excluded), 1000))
+            scores = {int(idx): float(dist) for idx, dist in zip(indices[0], distances[0]) if int(idx) not in excluded}
+            scores = dict(list(scores.items())[:k])
+            return self.get(list(scores), file_filter), scores
+
+        with Session(engine) as session:
+            ids = set(session.exec(
+                select(Chunk.id).where(in_scope(Chunk.file_path), Chunk.chunk_type == "code")
+            ).all())
+            ids.update(session.exec(
+                select(ChunkLocation.chunk_id).where(in_scope(ChunkLocation.file_path))
+            ).all())
+        if not ids or len(ids) > max_ids:
+            return None
+
+        distances, indices = vector_db.search_subset(query_vector, ids, k=k)
+        scores = {int(idx): float(dist) for idx, dist in zip(indices[0], distances[0])}
+        return self.get(list(scores), file_filter), scores
+
+    def similarities(self, query_vector: np.ndarray, ids: List[int]) -> Dict[int, float]:
+        """Vector scores of these chunks for the query (IDs not in the index are left out)."""
+        if not ids:
+            return {}
+        distances, indices = vector_db.search_subset(query_vector, ids, k=len(ids))
+        return {int(idx): float(dist) for idx, dist in zip(indices[0], distances[0])}
+
+    def get(self, ids: List[int], file_filter: Optional[str] = None) -> List[dict]:
+        """Passages in `ids` order. Unknown IDs are skipped."""
+        found = self.content.get(ids)
+        missing = [i for i in ids if i not in found]
+        if missing:
+            # Chunks ingested before the content store existed still carry their text in SQLite
+            with Session(engine) as session:
+                for chunk in session.exec(select(Chunk).where(Chunk.id.in_(missing))).all():
+                    if chunk.content:
+                        found[chunk.id] = _row_passage(chunk)
+        for chunk_id, others in self.locations.get(list(found)).items():
+            _with_locations(found[chunk_id], others, file_filter)
+        return [found[i] for i in ids if i in found and matches_filter(found[i], file_filter)]
+
+    def find_by_digest(self, digest: str, exclude_paths: Iterable[str] = ()) -> Optional[int]:
+        """An indexed code chunk with this content digest (Chunk.chunk_hash), if any."""
+        query = select(Chunk.id).where(Chunk.chunk_hash == digest, Chunk.chunk_type == "code")
+        exclude_paths = list(exclude_paths)
+        if exclude_paths:
+            query = query.where(Chunk.file_path.not_in(exclude_paths))
+        with Session(engine) as session:
+            return session.exec(query.limit(1)).first()
+
+    def relocate(self, chunk_id: int, location: ChunkLocation):
+        """
+        Makes a copy's location the chunk's own (its stored location is going
+        away) and drops that copy's ChunkLocation row.
+        """
+        passage = self.content.get([chunk_id]).get(chunk_id)
+        if passage is None:
+            return
+        meta = passage["meta"]
+        self.content.put([Chunk(
+            id=chunk_id, chunk_hash="", chunk_type=meta["type"], content=passage["text"],
+            file_name=location.file_name, file_path=location.file_path,
+            start_line=location.start_line, end_line=location.end_line,
+        )])
+        with Session(engine) as session:
+            chunk = session.get(Chunk, chunk_id)
+            if chunk is not None:
+                chunk.file_name = location.file_name
+                chunk.file_path = location.file_path
+                chunk.start_line = location.start_line
+                chunk.end_line = location.end_line
+                session.add(chunk)
+            session.exec(delete(ChunkLocation).where(ChunkLocation.id == location.id))
+            session.commit()
+        # Pinecone filters (routed drill-down) match on the stored file
+        vector_db.update_metadata(chunk_id, {
+            "file_name": location.file_name, "file_path": location.file_path,
+            "start_line": str(location.start_line) if location.start_line else "",
+        })
+
+    def delete(self, ids: List[int]):
+        """
+        Removes chunks from search and from SQLite. Their content records stay
+        in the append-only file (unreachable) until the next full ingestion.
+        """
+        if not ids:
+            return
+        vector_db.delete(ids)
+        vector_db.save()
+        with Session(engine) as session:
+            session.exec(delete(Chunk).where(Chunk.id.in_(ids)))
+            session.exec(delete(ChunkLocation).where(ChunkLocation.chunk_id.in_(ids)))
+            session.commit()
+
+    def reset(self):
+        vector_db.reset()
+        self.content.reset()
+        with Session(engine) as session:
+            session.exec(delete(Chunk))
+            session.exec(delete(ChunkLocation))
+            session.commit()
+
+
+chunk_store = ChunkStore()
@@ -0,0 +1,170 @@
+#conversation.py
+"""
+Per-session conversation context for follow-up questions.
+
+Each session keeps its last few turns: the query vector, the reranked top
+passages (ids, scores, text) and a compact question/answer summary. A follow-up
+then fetches only chunks it doesn't already hold, can skip retrieval entirely
+when it asks the same thing again, and the LLM sees the previous turns.
+
+The cache is per process. With several workers a session that lands on
+another worker simply starts cold, exactly like the old stateless path.
+"""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+import numpy as np
+from app.core.coordination import index_generation
+from app.core.chunk_store import matches_filter
+
+# ---------------------------------------------------------
+# CONFIGURATION (env overridable)
+# ---------------------------------------------------------
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "512"))
+CONVERSATION_IDLE_S = float(os.getenv("CONVERSATION_IDLE_S", "1800"))
+# Turns remembered per session, and cached passages across those turns
+CONVERSATION_TURNS = int(os.getenv("CONVERSATION_TURNS", "3"))
+CONVERSATION_MAX_PASSAGES = int(os.getenv("CONVERSATION_MAX_PASSAGES", "15"))
+# Characters of each answer kept in the summary the LLM sees
+CONVERSATION_SUMMARY_CHARS = int(os.getenv("CONVERSATION_SUMMARY_CHARS", "600"))
+# A follow-up this similar to the previous question reuses its context as-is
+CONVERSATION_REUSE_SIMILARITY = float(os.getenv("CONVERSATION_REUSE_SIMILARITY", "0.95"))
+# Follow-ups this short ("why?", "and the tests?") are retrieved together
+# with the previous question
+FOLLOWUP_MAX_WORDS = int(os.getenv("FOLLOWUP_MAX_WORDS", "8"))
+
+
+def _summarize(question: str, answer: str) -> str:
+    answer = re.sub(r"```.*?```", "[code]", answer or "", flags=re.S)
+    answer = " ".join(answer.split())
+    if len(answer) > CONVERSATION_SUMMARY_CHARS:
+        answer = answer[:CONVERSATION_SUMMARY_CHARS].rsplit(" ", 1)[0] + " ..."
+    return f"Q: {question.strip()}\nA: {answer}"
+
+
+class Turn:
+    __slots__ = ("question", "query_vector", "file_filter", "results", "summary")
+
+    def __init__(self, question: str, query_vector: np.ndarray, file_filter: Optional[str],
+                 results: List[dict], answer: str):
+        self.question = question
+        self.query_vector = np.asarray(query_vector, dtype=np.float32)
+        self.file_filter = file_filter
+        # Reranked passages as returned by reranker.rerank (id, text, meta, score, scored_by)
+        self.results = results
+        self.summary = _summarize(question, answer)
+
+    def similarity(self, query_vector: np.ndarray) -> float:
+        denom = float(np.linalg.norm(self.query_vector) * np.linalg.norm(query_vector))
+        return float(np.dot(self.query_vector, query_vector) / denom) if denom else 0.0
+
+
+class SessionContext:
+    def __init__(self, generation):
+        self.turns: "deque[Turn]" = deque(maxlen=CONVERSATION_TURNS)
+        self.generation = generation
+        self.touched = time.monotonic()
+
+    def last_turn(self) -> Optional[Turn]:
+        return self.turns[-1] if self.turns else None
+
+    def passages(self, file_filter: Optional[str] = None) -> Dict[int, dict]:
+        """
+        Passages retrieved by earlier turns, most recent first, keyed by chunk id
+        and limited to those matching the current file filter.
+        """
+        cached: Dict[int, dict] = {}
+        for turn in reversed(self.turns):
+            for res in turn.results:
+                if len(cached) >= CONVERSATION_MAX_PASSAGES:
+                    return cached
+                if res["id"] in cached:
+                    continue
+                if not matches_filter(res, file_filter):
+                    continue
+                cached[res["id"]] = {k: v for k, v in res.items() if k not in ("score", "scored_by")}
+        return cached
+
+    def history_text(self) -> str:
+        return "\n\n".join(turn.summary for turn in self.turns)
+
+    def retrieval_text(self, question: str) -> str:
+        """Short follow-ups are embedded together with the previous question."""
+        last = self.last_turn()
+        if last and len(question.split()) <= FOLLOWUP_MAX_WORDS:
+            return f"{last.question}\n{question}"
+        return question
+
+
+class ConversationCache:
+    """
+    LRU of SessionContext objects. Bounded by session count and idle time;
+    every session holds at most CONVERSATION_TURNS turns. A re-ingestion
+    (index generation change) drops a session's cached passages.
+    """
+
+    def __init__(self, max_sessions: int = CONVERSATION_MAX_SESSIONS, idle_s: float = CONVERSATION_IDLE_S):
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, SessionContext]" = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> Optional[SessionContext]:
+        if not session_id:
+            return None
+        generation = index_generation()
+        with self._lock:
+            self._evict_idle()
+            context = self._sessions.get(session_id)
+            if context is None:
+                return None
+            if context.generation != generation:
+                # Chunk ids and texts may be stale: keep only the summaries
+                for turn in context.turns:
+                    turn.results = []
+                context.generation = generation
+            self._sessions.move_to_end(session_id)
+            context.touched = time.monotonic()
+            return context
+
+    def record_turn(self, session_id: Optional[str], question: str, query_vector: np.ndarray,
+                    file_filter: Optional[str], results: List[dict], answer: str):
+        if not session_id:
+            return
+        turn = Turn(question, query_vector, file_filter, results, answer)
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None:
+                context = SessionContext(index_generation())
+                self._sessions[session_id] = context
+            context.turns.append(turn)
+            context.touched = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(len(c.turns) for c in self._sessions.values()),
+            }
+
+    def _evict_idle(self):
+        # Called with self._lock held; oldest sessions sit at the front
+        cutoff = time.monotonic() - self.idle_s
+        while self._sessions:
+            _, oldest = next(iter(self._sessions.items()))
+            if oldest.touched >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+
+conversation_cache = ConversationCache()
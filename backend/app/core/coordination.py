@@ -0,0 +1,133 @@
+#coordination.py
+"""
+Cross-process coordination for multi-worker serving.
+- A single ingestion writer at a time (file lock shared by all workers).
+- Chunk IDs allocated from one SQLite counter instead of per-process counters.
+- An "index generation" stamp so readers in other workers notice new data.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from sqlalchemy import text
+from app.db.session import engine, init_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a process-local lock
+    fcntl = None
+
+DATA_DIR = os.getenv("CODEMIND_DATA_DIR", os.getcwd())
+INGEST_LOCK_FILE = os.path.join(DATA_DIR, "ingestion.lock")
+GENERATION_FILE = os.path.join(DATA_DIR, "index.generation")
+
+ID_BLOCK_SIZE = 256
+
+
+class IngestionBusyError(RuntimeError):
+    """Raised when another worker/process is already ingesting."""
+
+
+# ---------------------------------------------------------
+# 1. SINGLE WRITER LOCK
+# ---------------------------------------------------------
+_local_lock = threading.Lock()
+
+@contextmanager
+def ingestion_lock():
+    """
+    Non-blocking exclusive lock around an ingestion job.
+    Raises IngestionBusyError if any process already holds it.
+    """
+    if not _local_lock.acquire(blocking=False):
+        raise IngestionBusyError("Another ingestion is already running")
+
+    handle = None
+    try:
+        if fcntl is not None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            handle = open(INGEST_LOCK_FILE, "a+")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise IngestionBusyError("Another ingestion is already running")
+            handle.seek(0)
+            handle.truncate()
+            handle.write(str(os.getpid()))
+            handle.flush()
+        yield
+    finally:
+        if handle is not None:
+            handle.close()  # closing the descriptor releases the flock
+        _local_lock.release()
+
+def is_ingesting_here() -> bool:
+    """True while this process is the ingestion writer."""
+    return _local_lock.locked()
+
+
+# ---------------------------------------------------------
+# 2. CENTRAL ID ALLOCATION
+# ---------------------------------------------------------
+_tables_ready = False
+
+def allocate_ids(count: int, name: str = "chunks") -> range:
+    """
+    Atomically reserves `count` consecutive IDs from the SQLite counter.
+    IDs are never reused (not even after a reset), so a stale vector that
+    survived an eventually-consistent delete can't be silently overwritten.
+    """
+    global _tables_ready
+    if not _tables_ready:
+        init_db()
+        _tables_ready = True
+
+    with engine.begin() as conn:
+        # First use: start after any chunk already in the DB
+        conn.execute(text(
+            "INSERT OR IGNORE INTO id_counters (name, next_id) "
+            "SELECT :name, COALESCE(MAX(id) + 1, 0) FROM chunk"
+        ), {"name": name})
+        conn.execute(text(
+            "UPDATE id_counters SET next_id = next_id + :count WHERE name = :name"
+        ), {"name": name, "count": count})
+        end = conn.execute(text(
+            "SELECT next_id FROM id_counters WHERE name = :name"
+        ), {"name": name}).scalar_one()
+    return range(end - count, end)
+
+
+class IdSource:
+    """
+    Hands out IDs one at a time while reserving them from the
+    central counter in blocks (one DB write per block, not per chunk).
+    """
+
+    def __init__(self, block_size: int = ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._block = iter(())
+
+    def next_id(self) -> int:
+        try:
+            return next(self._block)
+        except StopIteration:
+            self._block = iter(allocate_ids(self.block_size))
+            return next(self._block)
+
+
+# ---------------------------------------------------------
+# 3. INDEX GENERATION (Reader Invalidation)
+# ---------------------------------------------------------
+def index_generation() -> int:
+    """
+    Cheap (single stat) version stamp of the ingested data.
+    """
+    try:
+        return os.stat(GENERATION_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def bump_index_generation():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(GENERATION_FILE, "w") as f:
+        f.write(str(time.time_ns()))
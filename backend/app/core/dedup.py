@@ -0,0 +1,122 @@
+#dedup.py
+"""
+Chunk-level deduplication for ingestion: vendored copies, generated clients
+and near-identical fixtures are embedded once.
+
+- Exact: sha1 of the whitespace-normalized text (also stored as
+  Chunk.chunk_hash, so incremental sync can match against the index in SQL).
+- Near: 64-bit SimHash over token 3-grams. Two chunks within
+  DEDUP_MAX_DISTANCE bits are duplicates; the hash is split into
+  DEDUP_MAX_DISTANCE + 1 bands, so any such pair shares at least one band
+  exactly and candidates are dict lookups, not a scan.
+
+The first chunk seen is the representative that gets embedded; every copy
+becomes a ChunkLocation row pointing at it (see chunk_store.py).
+"""
+import os
+import re
+import hashlib
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Shorter chunks are never collapsed (one-liners like `pass` say nothing about copying)
+DEDUP_MIN_CHARS = int(os.getenv("DEDUP_MIN_CHARS", "64"))
+# Near-duplicate matching needs enough tokens for a stable SimHash
+DEDUP_NEAR_MIN_TOKENS = int(os.getenv("DEDUP_NEAR_MIN_TOKENS", "32"))
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "5"))  # Hamming bits out of 64
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def content_digest(text: str) -> str:
+    """Whitespace-insensitive digest: re-indented or re-wrapped copies match."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8", errors="ignore")).hexdigest()
+
+def simhash(tokens: List[str]) -> int:
+    """64-bit SimHash of the token 3-grams (each shingle weighs 1)."""
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(s.encode("utf-8", errors="ignore"), digest_size=8).digest() for s in shingles),
+        dtype=np.uint8,
+    ).reshape(len(shingles), 8)
+    # Per bit: +1 for every shingle hash with it set, -1 otherwise
+    votes = np.unpackbits(hashes, axis=1).sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class DedupIndex:
+    """
+    Representatives seen so far in one ingestion/sync run.
+    `existing` optionally resolves a digest to an already indexed chunk ID
+    (incremental sync matches exact copies against the stored index).
+    """
+
+    def __init__(self, existing: Optional[Callable[[str], Optional[int]]] = None,
+                 max_distance: int = DEDUP_MAX_DISTANCE):
+        self.existing = existing
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = SIMHASH_BITS // self.bands
+        self._by_digest: Dict[str, int] = {}
+        self._by_band: Dict[Tuple[int, int], List[Tuple[int, int]]] = defaultdict(list)
+        self.exact = 0
+        self.near = 0
+        self._last = (None, None)  # (digest, simhash) of the last miss, reused by add()
+
+    def _band_keys(self, value: int):
+        mask = (1 << self.band_bits) - 1
+        return [(band, (value >> (band * self.band_bits)) & mask) for band in range(self.bands)]
+
+    def match(self, text: str, digest: str) -> Optional[int]:
+        """
+        The representative chunk ID for `text`, or None: then call add()
+        once the new chunk has its ID.
+        """
+        if len(text) < DEDUP_MIN_CHARS:
+            return None
+        chunk_id = self._by_digest.get(digest)
+        if chunk_id is None and self.existing is not None:
+            chunk_id = self.existing(digest)
+        if chunk_id is not None:
+            self.exact += 1
+            return chunk_id
+
+        tokens = _TOKEN_PATTERN.findall(text)
+        if len(tokens) < DEDUP_NEAR_MIN_TOKENS:
+            return None
+        value = simhash(tokens)
+        self._last = (digest, value)
+        for key in self._band_keys(value):
+            for other, chunk_id in self._by_band.get(key, ()):
+                if _hamming(value, other) <= self.max_distance:
+                    self.near += 1
+                    return chunk_id
+        return None
+
+    def add(self, chunk_id: int, text: str, digest: str):
+        if len(text) < DEDUP_MIN_CHARS:
+            return
+        self._by_digest.setdefault(digest, chunk_id)
+        last_digest, value = self._last
+        if last_digest != digest:
+            tokens = _TOKEN_PATTERN.findall(text)
+            if len(tokens) < DEDUP_NEAR_MIN_TOKENS:
+                return
+            value = simhash(tokens)
+        for key in self._band_keys(value):
+            self._by_band[key].append((value, chunk_id))
+
+    @property
+    def duplicates(self) -> int:
+        return self.exact + self.near
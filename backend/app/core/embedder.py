@@ -1,12 +1,25 @@
-from fastembed import TextEmbedding
+import os
 import numpy as np
+from app.core.lazy import lazy_component
+
+# ONNX intra-op threads. The pre-fork server sets this to 1: a single-threaded
+# session has no thread pool, so it stays usable after fork() and N workers
+# don't oversubscribe the cores.
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0")) or None
+
+# Every stored vector comes from this model (snapshots record and check it)
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384
 
 class Embedder:
     def __init__(self):
+        # Imported here: pulling in fastembed/onnxruntime alone costs ~0.5s of API startup
+        from fastembed import TextEmbedding
+
         print("Loading FastEmbed Model...")
         # 1. Use the EXACT same model name so dimensions (384) stay the same.
         # This runs on ONNX Runtime (Lightweight) instead of PyTorch.
-        self.model = TextEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        self.model = TextEmbedding(model_name=EMBEDDING_MODEL, threads=ONNX_THREADS)
 
     def embed_text(self, text: str) -> np.ndarray:
         # 2. FastEmbed expects a list of documents and returns a generator.
@@ -18,4 +31,10 @@ class Embedder:
         
         return vector.astype("float32")
 
-embedder = Embedder()
\ No newline at end of file
+    def embed_batch(self, texts: list) -> np.ndarray:
+        # One ONNX call for the whole list (used by the embedding executor)
+        vectors = list(self.model.embed(texts, batch_size=max(1, len(texts))))
+        return np.vstack(vectors).astype("float32")
+
+# Built on first use (or by the startup warm-up), not at import time
+embedder = lazy_component("embedder", Embedder)
\ No newline at end of file
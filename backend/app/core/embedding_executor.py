@@ -0,0 +1,141 @@
+#embedding_executor.py
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import List
+import numpy as np
+from app.core.embedder import embedder
+
+# ---------------------------------------------------------
+# CONFIGURATION (env overridable)
+# ---------------------------------------------------------
+# How long the worker waits for more texts before running a batch
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))
+# Texts per ONNX call. Kept small so a query never waits behind a huge
+# ingestion batch for long.
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+
+PRIORITY_QUERY = 0      # interactive chat
+PRIORITY_INGEST = 1     # background ingestion
+
+
+class _EmbedJob:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+
+
+class EmbeddingExecutor:
+    """
+    Single embedding worker shared by every caller.
+    Texts from many requests are micro-batched within a small time window and
+    results are handed back through futures. Query jobs always drain before
+    ingestion jobs, and batches never mix the two, so a large ingestion
+    can't starve interactive chat latency.
+    """
+
+    def __init__(self, window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_MAX_BATCH):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._reset_state()
+        # Threads don't survive fork(): pre-forked workers start their own
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        self._cond = threading.Condition()
+        self._pending = {PRIORITY_QUERY: deque(), PRIORITY_INGEST: deque()}
+        self._worker = None
+
+    # ---------------------------------------------------------
+    # PUBLIC API
+    # ---------------------------------------------------------
+    def submit(self, texts: List[str], priority: int = PRIORITY_INGEST) -> List[Future]:
+        """
+        Queues texts for embedding. Returns one future per slice of at most
+        `max_batch` texts; each resolves to an (n, 384) float32 array.
+        """
+        futures = []
+        with self._cond:
+            self._ensure_worker()
+            for i in range(0, len(texts), self.max_batch):
+                job = _EmbedJob(texts[i:i + self.max_batch])
+                self._pending[priority].append(job)
+                futures.append(job.future)
+            self._cond.notify()
+        return futures
+
+    def embed(self, texts: List[str], priority: int = PRIORITY_INGEST) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.vstack([f.result() for f in self.submit(texts, priority)])
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed([text], PRIORITY_QUERY)[0]
+
+    def pending(self) -> dict:
+        with self._cond:
+            return {
+                "query": sum(len(j.texts) for j in self._pending[PRIORITY_QUERY]),
+                "ingest": sum(len(j.texts) for j in self._pending[PRIORITY_INGEST]),
+            }
+
+    # ---------------------------------------------------------
+    # WORKER
+    # ---------------------------------------------------------
+    def _ensure_worker(self):
+        # Called with self._cond held
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-executor", daemon=True)
+            self._worker.start()
+
+    def _next_batch(self) -> List[_EmbedJob]:
+        with self._cond:
+            while not self._pending[PRIORITY_QUERY] and not self._pending[PRIORITY_INGEST]:
+                self._cond.wait()
+
+            # Give concurrent callers a moment to join this batch.
+            # Queries always win, and a batch never mixes priorities.
+            deadline = time.monotonic() + self.window
+            while True:
+                priority = PRIORITY_QUERY if self._pending[PRIORITY_QUERY] else PRIORITY_INGEST
+                queued = sum(len(j.texts) for j in self._pending[priority])
+                remaining = deadline - time.monotonic()
+                if queued >= self.max_batch or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            jobs = []
+            budget = self.max_batch
+            pending = self._pending[priority]
+            while pending and budget >= len(pending[0].texts):
+                job = pending.popleft()
+                jobs.append(job)
+                budget -= len(job.texts)
+            if not jobs:
+                jobs.append(pending.popleft())
+            return jobs
+
+    def _run(self):
+        while True:
+            self._execute(self._next_batch())
+
+    def _execute(self, jobs: List[_EmbedJob]):
+        texts = [t for job in jobs for t in job.texts]
+        try:
+            vectors = embedder.embed_batch(texts)
+        except Exception as e:
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        offset = 0
+        for job in jobs:
+            job.future.set_result(vectors[offset:offset + len(job.texts)])
+            offset += len(job.texts)
+
+
+embedding_executor = EmbeddingExecutor()
@@ -0,0 +1,200 @@
+#file_content.py
+import os
+import json
+import mmap
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+from app.core import metrics
+from app.core.coordination import DATA_DIR
+
+# Total bytes of mapped files + line indexes kept hot
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+HIGHLIGHT_CACHE_ENTRIES = int(os.getenv("HIGHLIGHT_CACHE_ENTRIES", "256"))
+
+WORKSPACE_ROOTS_FILE = os.path.join(DATA_DIR, "workspace_roots.json")
+
+LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "jsx", ".ts": "typescript",
+    ".tsx": "tsx", ".json": "json", ".md": "markdown", ".html": "html",
+    ".css": "css", ".go": "go", ".rs": "rust", ".java": "java", ".c": "c",
+    ".h": "c", ".cpp": "cpp", ".sh": "bash", ".yml": "yaml", ".yaml": "yaml",
+}
+
+
+# ---------------------------------------------------------
+# 1. WORKSPACE ROOTS (Access Control)
+# ---------------------------------------------------------
+def register_workspace_root(path: str):
+    """Called by ingestion: only files under ingested roots can be served."""
+    roots = set(workspace_roots())
+    roots.add(os.path.realpath(path))
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = WORKSPACE_ROOTS_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(sorted(roots), f)
+    os.replace(tmp_path, WORKSPACE_ROOTS_FILE)
+
+def workspace_roots() -> List[str]:
+    try:
+        with open(WORKSPACE_ROOTS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def resolve_workspace_file(path: str) -> Optional[str]:
+    """
+    Maps a requested path to a real file inside an ingested root, or None.
+    Accepts absolute server paths and root-relative paths (chunks of cloned
+    repos are stored as "/src/x.py", relative to the clone directory).
+    """
+    roots = workspace_roots()
+    candidates = [path] + [os.path.join(root, path.lstrip("/\\")) for root in roots]
+    for candidate in candidates:
+        real = os.path.realpath(candidate)
+        if not os.path.isfile(real):
+            continue
+        for root in roots:
+            if os.path.commonpath([root, real]) == root:
+                return real
+    return None
+
+
+# ---------------------------------------------------------
+# 2. MEMORY-MAPPED FILES + NEWLINE INDEX (LRU by bytes)
+# ---------------------------------------------------------
+class _MappedFile:
+    __slots__ = ("mtime", "size", "data", "line_starts", "cost")
+
+    def __init__(self, path: str, stat: os.stat_result):
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        if self.size == 0:
+            self.data = b""
+        else:
+            with open(path, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # line_starts[i] = byte offset where line i+1 begins
+        raw = np.frombuffer(self.data, dtype=np.uint8) if self.size else np.zeros(0, dtype=np.uint8)
+        newlines = np.flatnonzero(raw == 10)
+        self.line_starts = np.concatenate(([0], newlines + 1)).astype(np.int64)
+        if self.size and self.line_starts[-1] == self.size:
+            self.line_starts = self.line_starts[:-1]  # trailing newline doesn't open a line
+        self.cost = self.size + self.line_starts.nbytes
+
+    @property
+    def total_lines(self) -> int:
+        return len(self.line_starts) if self.size else 0
+
+    def line_span(self, start_line: int, end_line: int) -> Tuple[int, int]:
+        """Byte range [start, end) covering 1-based inclusive lines."""
+        start_line = max(1, start_line)
+        end_line = min(self.total_lines, end_line)
+        if self.size == 0 or start_line > end_line:
+            return 0, 0
+        start = int(self.line_starts[start_line - 1])
+        end = int(self.line_starts[end_line]) if end_line < self.total_lines else self.size
+        return start, end
+
+
+class FileContentCache:
+    """
+    LRU of memory-mapped files with their newline offset index, bounded by
+    total bytes. An entry is rebuilt when the file's mtime or size changes.
+    """
+
+    def __init__(self, max_bytes: int = FILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _MappedFile]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, path: str) -> _MappedFile:
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+                self._entries.move_to_end(path)
+                metrics.cache_event("file_content", True)
+                return entry
+
+        metrics.cache_event("file_content", False)
+        entry = _MappedFile(path, stat)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= old.cost
+            # Files bigger than the whole budget are served but not kept
+            if entry.cost <= self.max_bytes:
+                self._entries[path] = entry
+                self._bytes += entry.cost
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.cost
+        return entry
+
+    def read_lines(self, path: str, start_line: int, end_line: int) -> dict:
+        entry = self.get(path)
+        start, end = entry.line_span(start_line, end_line)
+        return {
+            "content": bytes(entry.data[start:end]).decode("utf-8", errors="replace"),
+            "start_line": max(1, start_line),
+            "end_line": min(entry.total_lines, end_line),
+            "total_lines": entry.total_lines,
+            "mtime": entry.mtime,
+        }
+
+    def read_bytes(self, path: str, start: int, end: int) -> Tuple[bytes, int]:
+        """Bytes [start, end] inclusive (HTTP Range semantics) and the file size."""
+        entry = self.get(path)
+        return bytes(entry.data[start:end + 1]), entry.size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+file_cache = FileContentCache()
+
+
+# ---------------------------------------------------------
+# 3. OPTIONAL SERVER-SIDE HIGHLIGHTING (needs pygments)
+# ---------------------------------------------------------
+_highlight_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_highlight_lock = threading.Lock()
+
+def language_for(path: str) -> Optional[str]:
+    return LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+def highlight(path: str, mtime: int, start_line: int, end_line: int, code: str) -> Optional[str]:
+    """
+    HTML for a line range, cached by (path, mtime, range).
+    Returns None when pygments isn't installed; the frontend then falls back
+    to its own client-side highlighter.
+    """
+    key = (path, mtime, start_line, end_line)
+    with _highlight_lock:
+        if key in _highlight_cache:
+            _highlight_cache.move_to_end(key)
+            return _highlight_cache[key]
+
+    try:
+        from pygments import highlight as render
+        from pygments.formatters import HtmlFormatter
+        from pygments.lexers import get_lexer_for_filename, TextLexer
+    except ImportError:
+        return None
+
+    try:
+        lexer = get_lexer_for_filename(path, stripnl=False)
+    except Exception:
+        lexer = TextLexer(stripnl=False)
+    html = render(code, lexer, HtmlFormatter(linenos="inline", linenostart=start_line, nowrap=True))
+
+    with _highlight_lock:
+        _highlight_cache[key] = html
+        while len(_highlight_cache) > HIGHLIGHT_CACHE_ENTRIES:
+            _highlight_cache.popitem(last=False)
+    return html
@@ -0,0 +1,167 @@
+#file_tree.py
+import os
+import json
+import bisect
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from app.core.coordination import DATA_DIR, index_generation
+
+# Same filter the /files endpoint has always applied
+IGNORED_NAMES = {"__pycache__", "node_modules", "venv", ".git"}
+
+SNAPSHOT_FILE = os.path.join(DATA_DIR, "file_tree_snapshot.json")
+
+
+def _list_directory(dir_path: str) -> List[dict]:
+    """
+    One directory level, sorted by name. os.scandir gives us the entry type
+    without an extra isdir() stat per child.
+    """
+    entries = []
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.name.startswith(".") or entry.name in IGNORED_NAMES:
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                entries.append({
+                    "name": entry.name,
+                    "type": "folder" if is_dir else "file",
+                    # We send the full server path so the frontend can request file content later
+                    "path": os.path.join(dir_path, entry.name),
+                })
+    except PermissionError:
+        # Skip folders we don't have permission to access
+        pass
+    except Exception as e:
+        print(f"Error scanning directory {dir_path}: {e}")
+    entries.sort(key=lambda e: e["name"])
+    return entries
+
+
+class DirectorySnapshot:
+    """
+    Directory listings captured at ingestion time, keyed by absolute path.
+    Each listing remembers the directory's mtime; a directory is re-listed
+    only when its mtime changes (entries added, removed or renamed).
+    """
+
+    def __init__(self, snapshot_file: str = SNAPSHOT_FILE):
+        self.snapshot_file = snapshot_file
+        self._lock = threading.Lock()
+        self._dirs: Dict[str, dict] = {}
+        self._generation = None
+
+    # ---------------------------------------------------------
+    # CAPTURE / PERSISTENCE
+    # ---------------------------------------------------------
+    def capture(self, root: str):
+        """
+        Walks the whole tree once (called at the end of ingestion) and
+        persists it so every worker process can serve from it.
+        """
+        root = os.path.realpath(root)
+        dirs = {}
+        stack = [root]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            entries = _list_directory(dir_path)
+            dirs[dir_path] = {"mtime": mtime, "entries": entries}
+            stack.extend(e["path"] for e in entries if e["type"] == "folder")
+
+        with self._lock:
+            self._dirs = dirs
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_file), exist_ok=True)
+            tmp_path = self.snapshot_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(dirs, f)
+            os.replace(tmp_path, self.snapshot_file)
+        except OSError as e:
+            print(f"⚠️ Could not persist file tree snapshot: {e}")
+        print(f"🌳 Captured file tree snapshot ({len(dirs)} directories)")
+
+    def _maybe_reload(self):
+        generation = index_generation()
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation == self._generation:
+                return
+            try:
+                with open(self.snapshot_file) as f:
+                    self._dirs = json.load(f)
+            except (OSError, ValueError):
+                pass  # No snapshot yet: directories get listed on demand
+            self._generation = generation
+
+    # ---------------------------------------------------------
+    # QUERIES
+    # ---------------------------------------------------------
+    def listing(self, dir_path: str) -> dict:
+        """
+        Returns {"mtime": ..., "entries": [...]} for one directory,
+        re-listing it only if it changed since the snapshot.
+        """
+        self._maybe_reload()
+        dir_path = os.path.realpath(dir_path)
+        mtime = os.stat(dir_path).st_mtime_ns
+
+        cached = self._dirs.get(dir_path)
+        if cached is not None and cached["mtime"] == mtime:
+            return cached
+
+        fresh = {"mtime": mtime, "entries": _list_directory(dir_path)}
+        with self._lock:
+            self._dirs[dir_path] = fresh
+        return fresh
+
+    def page(self, dir_path: str, cursor: Optional[str] = None, limit: int = 200) -> dict:
+        """
+        One page of a directory's children. The cursor is the name of the
+        last entry of the previous page (entries are sorted by name).
+        """
+        listing = self.listing(dir_path)
+        entries = listing["entries"]
+        start = bisect.bisect_right([e["name"] for e in entries], cursor) if cursor else 0
+        page = entries[start:start + limit]
+        has_more = start + limit < len(entries)
+        return {
+            "path": os.path.realpath(dir_path),
+            "entries": page,
+            "next_cursor": page[-1]["name"] if has_more and page else None,
+            "total": len(entries),
+            "etag": self.etag(dir_path, listing["mtime"], cursor, limit),
+        }
+
+    @staticmethod
+    def etag(dir_path: str, mtime: int, cursor: Optional[str], limit: int) -> str:
+        digest = hashlib.blake2b(f"{dir_path}|{mtime}|{cursor}|{limit}".encode(), digest_size=12).hexdigest()
+        return f'W/"{digest}"'
+
+    def build_tree(self, dir_path: str) -> List[dict]:
+        """
+        Full nested tree (legacy /files shape), assembled from cached listings.
+        """
+        tree = []
+        try:
+            entries = self.listing(dir_path)["entries"]
+        except OSError:
+            return tree
+        for entry in entries:
+            node = dict(entry)
+            if entry["type"] == "folder":
+                node["children"] = self.build_tree(entry["path"])
+            tree.append(node)
+        return tree
+
+
+directory_snapshot = DirectorySnapshot()
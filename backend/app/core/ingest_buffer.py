@@ -0,0 +1,137 @@
+#ingest_buffer.py
+"""
+Bounded building blocks for constant-memory ingestion.
+- ChunkBuffer: vectors in ONE preallocated float32 array plus the matching
+  Chunk rows / metadata / symbols / file records / duplicate locations, full
+  at a chunk count or a text byte budget.
+- BoundedQueue: hand-off between the scan+parse thread and the embed+flush
+  stage. put() blocks while the queue is over its item or byte budget, which
+  is what slows the scanner down when embedding or upserts fall behind.
+"""
+import os
+import threading
+from collections import deque
+from typing import List, Optional
+import numpy as np
+
+# Chunks held before a flush, and the text bytes they may add up to
+INGEST_BUFFER_CHUNKS = int(os.getenv("INGEST_BUFFER_CHUNKS", "256"))
+INGEST_BUFFER_BYTES = int(os.getenv("INGEST_BUFFER_BYTES", str(8 * 1024 * 1024)))
+# Parsed files waiting for the embed stage (count and source bytes)
+INGEST_QUEUE_FILES = int(os.getenv("INGEST_QUEUE_FILES", "16"))
+INGEST_QUEUE_BYTES = int(os.getenv("INGEST_QUEUE_BYTES", str(16 * 1024 * 1024)))
+
+EMBEDDING_DIM = 384
+
+
+class ChunkBuffer:
+    def __init__(self, capacity: int = INGEST_BUFFER_CHUNKS, max_bytes: int = INGEST_BUFFER_BYTES,
+                 dimension: int = EMBEDDING_DIM):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.vectors = np.empty((capacity, dimension), dtype=np.float32)
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.text_bytes = 0
+        self.chunks: List = []
+        self.metadatas: List[dict] = []
+        self.symbols: List = []
+        self.files: List = []
+        self.locations: List = []
+
+    def add(self, vector: np.ndarray, chunk, metadata: dict):
+        """Adds one chunk. Callers flush when `full` turns True."""
+        self.vectors[self.count] = vector
+        self.count += 1
+        self.text_bytes += len(chunk.content)
+        self.chunks.append(chunk)
+        self.metadatas.append(metadata)
+
+    def add_symbols(self, symbols: List):
+        self.symbols.extend(symbols)
+
+    def add_file(self, record):
+        """IngestedFile row, written with the file's chunks."""
+        self.files.append(record)
+
+    def add_location(self, location):
+        """ChunkLocation row of a duplicate that wasn't embedded."""
+        self.locations.append(location)
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity or self.text_bytes >= self.max_bytes
+
+    @property
+    def room(self) -> int:
+        return self.capacity - self.count
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def empty(self) -> bool:
+        # A file without chunks (e.g. empty, or all duplicates) still has rows to write
+        return self.count == 0 and not self.files and not self.locations
+
+    def batch(self):
+        """(vectors view, chunks, metadatas, symbols, files, locations) of everything buffered."""
+        return (self.vectors[:self.count], self.chunks, self.metadatas, self.symbols,
+                self.files, self.locations)
+
+
+class QueueClosed(Exception):
+    """The consumer went away (e.g. the websocket disconnected)."""
+
+
+class BoundedQueue:
+    def __init__(self, max_items: int = INGEST_QUEUE_FILES, max_bytes: int = INGEST_QUEUE_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._items = deque()
+        self._bytes = 0
+        self._closed = False
+        self.producer_waits = 0   # how often backpressure kicked in
+
+    def put(self, item, size: int = 0):
+        with self._cond:
+            # An item bigger than the whole budget still goes through, alone
+            while not self._closed and self._items and (
+                len(self._items) >= self.max_items or self._bytes + size > self.max_bytes
+            ):
+                self.producer_waits += 1
+                self._cond.wait()
+            if self._closed:
+                raise QueueClosed()
+            self._items.append((item, size))
+            self._bytes += size
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None):
+        with self._cond:
+            while not self._items:
+                if not self._cond.wait(timeout):
+                    raise TimeoutError()
+            item, size = self._items.popleft()
+            self._bytes -= size
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """Wakes and stops a blocked producer."""
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._bytes = 0
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._items)
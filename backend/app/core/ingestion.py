@@ -1,95 +1,118 @@
 import os
+import time
+import uuid
 import shutil
+import hashlib
+import threading
 import git
 from datetime import datetime
 from sqlmodel import Session, delete, SQLModel
 from app.core.scanner import scan_directory
-from app.core.parser import extract_functions
-from app.core.embedder import embedder
-from app.core.vector_store import vector_db
+from app.core.parser import parse_python, extract_functions, extract_symbols
+from app.core.embedding_executor import embedding_executor, PRIORITY_INGEST
+from app.core.chunk_store import chunk_store
+from app.core.symbols import symbol_index, DEFINITION_KINDS
+from app.core.file_tree import directory_snapshot
+from app.core.file_content import register_workspace_root
+from app.core import metrics
+from app.core.profiling import profile_session
+from app.core.ingest_buffer import ChunkBuffer, BoundedQueue, QueueClosed
+from app.core.dedup import DedupIndex, DEDUP_ENABLED, content_digest
+from app.core.chunk_planner import ChunkSizes, estimate_tokens, text_kind
+from app.core.summaries import summary_index, file_summary, SUMMARY_MODE
+from app.core.coordination import IdSource, IngestionBusyError, ingestion_lock, bump_index_generation
 from app.db.session import engine
-from app.db.models import Chunk
-import numpy as np
+from app.db.models import Chunk, Symbol, IngestedFile, RepoState, ChunkLocation
 
 TEMP_REPO_DIR = os.path.join(os.getcwd(), "temp_cloned_repo")
 
 # ----------------------------
 # 1. GIT HISTORY PROCESSING (GENERATOR)
 # ----------------------------
-def process_git_history_generator(repo_path: str, start_id: int, limit: int = 50):
+def process_git_history_generator(repo_path: str, id_source: IdSource, limit: int = 50, timings=None, rev=None):
     """
     Yields progress updates so the WebSocket doesn't timeout during heavy git processing.
-    Yields final ID at the end.
+    Chunk IDs are drawn from the shared `id_source`; stage seconds go to `timings`.
+    `rev` limits the walk (e.g. "old..new" for the commits a sync pulled in).
     """
     print("⏳ Processing Git Commit History...")
-    current_id = start_id
     
     try:
         repo = git.Repo(repo_path)
     except git.exc.InvalidGitRepositoryError:
         print("⚠ Not a valid git repository. Skipping history.")
-        yield current_id # Return current ID as is
         return
 
-    vectors_buffer = []
-    chunks_buffer = []
-    metadata_buffer = []
+    buffer = ChunkBuffer()
+    total = 0
     
     # Iterate commits
-    commits = list(repo.iter_commits(max_count=limit))
-    total_commits = len(commits)
+    with metrics.span("ingest", "git_log", timings):
+        commits = list(repo.iter_commits(rev, max_count=limit))
 
-    for i, commit in enumerate(commits):
+    commit_texts = []
+    for commit in commits:
         try:
             # 1. Extract Author and Time (The fix you requested)
             author_name = commit.author.name
             date_str = datetime.fromtimestamp(commit.committed_date).strftime('%Y-%m-%d %H:%M:%S')
 
             # 2. Add them to the content text
-            content_text = (
+            commit_texts.append(
                 f"COMMIT: {commit.hexsha}\n"
                 f"AUTHOR: {author_name}\n"
                 f"DATE: {date_str}\n"
                 f"MSG: {commit.message.strip()}"
             )
+        except Exception as e:
+            print(f"Error processing commit: {e}")
 
-            vector = embedder.embed_text(content_text)
-            vectors_buffer.append(vector)
+    # Queue every commit up front so the executor can batch them,
+    # then collect the results one by one for progress updates
+    futures = [embedding_executor.submit([text], PRIORITY_INGEST)[0] for text in commit_texts]
+
+    for i, (content_text, future) in enumerate(zip(commit_texts, futures)):
+        try:
+            with metrics.span("ingest", "embed", timings):
+                vector = future.result()[0]
             
+            # Small filterable metadata only: the text lives in the chunk store
             meta = {
                 "file_name": "GIT_LOG",
                 "chunk_type": "commit",
-                "content": content_text[:1000]
             }
-            metadata_buffer.append(meta)
 
             chunk = Chunk(
-                id=current_id,
-                chunk_hash=str(hash(content_text)),
+                id=id_source.next_id(),
+                chunk_hash=content_digest(content_text),
                 chunk_type="commit",
                 file_name="GIT_HISTORY",
                 file_path="GIT_LOG",
                 content=content_text
             )
-            chunks_buffer.append(chunk)
-            current_id += 1
+            buffer.add(vector, chunk, meta)
+            total += 1
+            if buffer.full:
+                with metrics.span("ingest", "flush", timings):
+                    _flush_buffers(*buffer.batch())
+                buffer.clear()
             
             # --- CRITICAL FIX: Yield progress to keep WebSocket alive ---
             yield {
                 "status": "processing_git", 
-                "message": f"Processing commit {i+1}/{total_commits}..."
+                "message": f"Processing commit {i+1}/{len(commit_texts)}..."
             }
             
         except Exception as e:
             print(f"Error processing commit: {e}")
             continue
 
-    if vectors_buffer:
-        _flush_buffers(vectors_buffer, chunks_buffer, metadata_buffer)
-        print(f"✅ Ingested {len(chunks_buffer)} git commits.")
-
-    # Yield the final ID so the main function can update its counter
-    yield current_id
+    if len(buffer):
+        with metrics.span("ingest", "flush", timings):
+            _flush_buffers(*buffer.batch())
+    if total:
+        metrics.ingest_items.inc(total, kind="commits")
+        print(f"✅ Ingested {total} git commits.")
 
 
 # ----------------------------
@@ -108,11 +131,36 @@ def chunk_fallback(text: str, max_chars: int = 800):
 # ----------------------------
 # MAIN INGESTION (GENERATOR)
 # ----------------------------
-def ingest_codebase_generator(input_path: str):
+def ingest_codebase_generator(input_path: str, profile: bool = False):
     """
     Generator function that yields status updates during ingestion.
+    Only one ingestion runs at a time across all worker processes.
+    With `profile`, the job is profiled (see profiling.py) and the
+    "complete" update carries the profile id and URL. The consumer's own work
+    between updates runs on the same thread and shows up in that profile too.
     """
+    started = time.perf_counter()
+    outcome = "error"
+    job_id = uuid.uuid4().hex[:16]
+    try:
+        with ingestion_lock(), profile_session("ingest", job_id, enabled=profile) as job_profile:
+            for update in _ingest_codebase_steps(input_path):
+                if update.get("status") == "complete":
+                    outcome = "ok"
+                    update["job_id"] = job_id
+                    if job_profile is not None:
+                        update["profile"] = job_profile.summary()
+                yield update
+    except IngestionBusyError as e:
+        outcome = "busy"
+        yield {"status": "error", "code": "busy", "message": str(e)}
+    finally:
+        metrics.request_seconds.observe(time.perf_counter() - started, pipeline="ingest", outcome=outcome)
+
+def _ingest_codebase_steps(input_path: str):
     target_path = input_path
+    # Seconds per stage for this job, reported with the "complete" update
+    timings = {}
 
     # 1. Clone Logic
     if input_path.startswith("http") or input_path.startswith("git@"):
@@ -127,7 +175,8 @@ def ingest_codebase_generator(input_path: str):
                 pass # Ignore cleanup errors
                 
         try:
-            git.Repo.clone_from(input_path, TEMP_REPO_DIR)
+            with metrics.span("ingest", "clone", timings):
+                git.Repo.clone_from(input_path, TEMP_REPO_DIR)
             target_path = TEMP_REPO_DIR
         except Exception as e:
             yield {"status": "error", "message": f"Clone Failed: {e}"}
@@ -138,127 +187,362 @@ def ingest_codebase_generator(input_path: str):
         return
 
     yield {"status": "scanning", "message": f"Scanning files in {target_path}..."}
+
+    # Only files under ingested roots are served by /files/content
+    register_workspace_root(target_path)
     
     # Database Prep
-    SQLModel.metadata.create_all(engine)
-    vector_db.reset()
-    with Session(engine) as session:
-        session.exec(delete(Chunk))
-        session.commit()
+    with metrics.span("ingest", "reset", timings):
+        SQLModel.metadata.create_all(engine)
+        chunk_store.reset()
+        with Session(engine) as session:
+            session.exec(delete(Symbol))
+            session.exec(delete(IngestedFile))
+            session.commit()
+        symbol_index.reset()
+        bump_index_generation()
 
-    global_id_counter = 0
+    # IDs come from the central SQLite counter, shared by SQLite and the vector store
+    id_source = IdSource()
     
     # 2. Process Git (Consuming the new Generator)
     # We iterate over the git processor so it keeps yielding "alive" messages
-    git_processor = process_git_history_generator(target_path, start_id=global_id_counter)
-    
-    for update in git_processor:
-        if isinstance(update, int):
-            # If it's an int, it's the final ID count
-            global_id_counter = update
-        else:
-            # If it's a dict, it's a status message for the UI
-            yield update
+    for update in process_git_history_generator(target_path, id_source, timings=timings):
+        yield update
 
     processed_count = 0
-    vectors_buffer = []
-    chunks_buffer = []
-    metadata_buffer = []
-
-    # Get total file count for progress bar
-    # (Wrapped in list to force immediate execution, but might block on huge repos. 
-    # Usually fast enough for <10k files)
-    all_files = list(scan_directory(target_path))
-    total_files = len(all_files)
+    chunk_count = 0
+    buffer = ChunkBuffer()
+    # Copies of already embedded chunks become locations of the first one
+    dedup = DedupIndex() if DEDUP_ENABLED else None
+    sizes = ChunkSizes()
+
+    def flush():
+        if buffer.empty:
+            return
+        metrics.ingest_items.inc(len(buffer.symbols), kind="symbols")
+        with metrics.span("ingest", "flush", timings):
+            _flush_buffers(*buffer.batch())
+        buffer.clear()
+
+    # Streaming count for the progress bar: nothing but the total is kept
+    with metrics.span("ingest", "scan", timings):
+        total_files = sum(1 for _ in scan_directory(target_path))
     
     yield {"status": "info", "total_files": total_files, "message": f"Found {total_files} files to process"}
 
-    for i, file_path in enumerate(all_files):
-        try:
-            file_name = os.path.basename(file_path)
-            
+    # Reading + parsing runs ahead on its own thread, at most a bounded queue
+    # ahead: when embedding or upserts fall behind, the scanner waits.
+    queue = BoundedQueue()
+    producer_timings = {}
+    producer = threading.Thread(
+        target=_produce_files,
+        args=(target_path, queue, producer_timings),
+        name="ingest-scanner",
+        daemon=True,
+    )
+    producer.start()
+
+    try:
+        received = 0
+        while True:
+            kind, item = queue.get()
+            metrics.queue_depth.set(queue.depth(), queue="ingest_files")
+            if kind == "done":
+                break
+            if kind == "error":
+                raise item
+            received += 1
+            if item is None:  # the file could not be read or parsed
+                continue
+
+            file_path = item[0]
+
             # Yield update to frontend
             yield {
                 "status": "processing_file", 
-                "file": file_name, 
-                "progress": int((i / total_files) * 100)
+                "file": os.path.basename(file_path), 
+                "progress": int((received / max(total_files, 1)) * 100)
             }
 
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-
-            display_path = str(file_path).replace(TEMP_REPO_DIR, "") if target_path == TEMP_REPO_DIR else str(file_path)
-            functions = extract_functions(content, str(file_path))
-
-            def add_chunk(text, start_line=None, end_line=None):
-                nonlocal global_id_counter
-                vector = embedder.embed_text(text)
-                vectors_buffer.append(vector)
-                
-                meta = {
-                    "file_name": os.path.basename(file_path),
-                    "file_path": display_path,
-                    "chunk_type": "code",
-                    "start_line": str(start_line) if start_line else "",
-                    "content": text[:1000]
-                }
-                metadata_buffer.append(meta)
-                
-                chunk = Chunk(
-                    id=global_id_counter,
-                    chunk_hash=str(hash(text)),
-                    chunk_type="code",
-                    file_name=os.path.basename(file_path),
-                    file_path=display_path,
-                    start_line=start_line,
-                    end_line=end_line,
-                    content=text
-                )
-                chunks_buffer.append(chunk)
-                global_id_counter += 1
-
-            if not functions:
-                for chunk_text in chunk_fallback(content):
-                    add_chunk(chunk_text)
-            else:
-                for func in functions:
-                    add_chunk(func["code"], func["start_line"], func["end_line"])
-
-            processed_count += 1
-
-            if len(vectors_buffer) > 0 and processed_count % 10 == 0:
-                _flush_buffers(vectors_buffer, chunks_buffer, metadata_buffer)
-                vectors_buffer = []
-                chunks_buffer = []
-                metadata_buffer = []
+            try:
+                added = _embed_file(buffer, flush, id_source, item, timings, dedup, sizes)
+                processed_count += 1
+                chunk_count += added
+            except Exception as e:
+                print(f"❌ Error processing {file_path}: {e}")
 
-        except Exception as e:
-            print(f"❌ Error processing {file_path}: {e}")
+        flush()
+    finally:
+        # Also reached when the consumer stops early (e.g. websocket closed)
+        queue.close()
+        producer.join()
+        metrics.queue_depth.set(0, queue="ingest_files")
+        for stage, seconds in producer_timings.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
 
-    if vectors_buffer:
-        _flush_buffers(vectors_buffer, chunks_buffer, metadata_buffer)
+    duplicates = dedup.duplicates if dedup else 0
+    print(f"✅ Total files processed: {processed_count} ({chunk_count} chunks, {duplicates} duplicates "
+          f"collapsed, scanner waited {queue.producer_waits}x on backpressure)")
+    # Directory listings for the lazy /files/tree API
+    with metrics.span("ingest", "snapshot", timings):
+        directory_snapshot.capture(target_path)
+    # File + directory summaries for routing broad questions (summaries.py)
+    summary_index.rebuild(timings)
+    # What incremental sync (sync.py) diffs against next time
+    save_repo_state(input_path, target_path)
+    bump_index_generation()
 
-    print(f"✅ Total files processed: {processed_count}")
-    yield {"status": "complete", "message": "Ingestion Complete!", "progress": 100}
+    yield {
+        "status": "complete",
+        "message": "Ingestion Complete!",
+        "progress": 100,
+        "timings_ms": {stage: round(sec * 1000, 1) for stage, sec in timings.items()},
+        "backpressure_waits": queue.producer_waits,
+        "duplicates": {"exact": dedup.exact, "near": dedup.near} if dedup else None,
+        "chunk_sizes": sizes.to_dict(),
+    }
 
 
 # ----------------------------
 # WRAPPER FOR BACKWARD COMPATIBILITY
 # ----------------------------
-def ingest_codebase(input_path: str):
+def ingest_codebase(input_path: str, profile: bool = False) -> dict:
     """
     Consumes the generator purely for blocking calls (old API support).
+    Raises on error updates instead of reporting a silent success.
+    Returns the final ("complete") update.
     """
-    for update in ingest_codebase_generator(input_path):
-        pass # Just consume the generator to make it run
+    last = {}
+    for update in ingest_codebase_generator(input_path, profile=profile):
+        if update.get("status") == "error":
+            if update.get("code") == "busy":
+                raise IngestionBusyError(update["message"])
+            raise RuntimeError(update["message"])
+        last = update
+    return last
 
-def _flush_buffers(vectors, chunks, metadatas):
-    if not vectors:
+def _chunk_for_lines(spans, start_line, end_line):
+    """
+    Picks the chunk holding a definition from the file's (chunk_id, start_line,
+    end_line) spans: the chunk starting on the same line, else the innermost
+    chunk containing it, else the one holding its first line (definitions
+    split by chunk_planner.py), else the first chunk inside it (classes).
+    """
+    containing = None
+    holding_start = None
+    first_inside = None
+    for span in spans:
+        chunk_id, chunk_start, chunk_end = span
+        if chunk_start is None:
+            continue
+        if chunk_start == start_line:
+            return chunk_id
+        if chunk_start <= start_line and end_line <= chunk_end:
+            if containing is None or chunk_start > containing[1]:
+                containing = span
+        elif chunk_start <= start_line <= chunk_end:
+            if holding_start is None or chunk_start > holding_start[1]:
+                holding_start = span
+        elif first_inside is None and start_line <= chunk_start <= end_line:
+            first_inside = span
+    best = containing or holding_start or first_inside
+    return best[0] if best is not None else None
+
+def _produce_files(target_path: str, queue: BoundedQueue, timings: dict):
+    """
+    Scanner thread: reads and parses one file at a time and hands
+    (file_path, record, pieces, symbols) to the ingestion loop.
+    queue.put blocks while the loop is behind. Unreadable files are sent as
+    None so progress still advances.
+    """
+    try:
+        for file_path in scan_directory(target_path):
+            if queue.closed:
+                return
+            try:
+                content, record = read_file(file_path, target_path, timings)
+                pieces, symbols = parse_file(content, file_path, timings)
+                if SUMMARY_MODE != "off":
+                    record.summary = file_summary(content, record.display_path, symbols)
+                item = (file_path, record, pieces, symbols)
+                size = sum(len(p[0]) for p in pieces)
+            except Exception as e:
+                print(f"❌ Error processing {file_path}: {e}")
+                item, size = None, 0
+            queue.put(("file", item), size)
+        queue.put(("done", None))
+    except QueueClosed:
+        return
+    except Exception as e:
+        try:
+            queue.put(("error", e))
+        except QueueClosed:
+            pass
+
+def _flush_buffers(vectors, chunks, metadatas, symbols=None, files=None, locations=None):
+    """`vectors` may be a view of a reused buffer: the stores copy what they keep."""
+    if not chunks and not files and not locations:
         return
-    vector_batch = np.vstack(vectors)
-    vector_db.add_vectors(vector_batch, metadatas) 
-    vector_db.save()
+    if chunks:
+        chunk_store.add(vectors, chunks, metadatas)
+    if symbols or files or locations:
+        # expire_on_commit=False keeps the Symbol attributes readable for the in-memory index
+        with Session(engine, expire_on_commit=False) as session:
+            for symbol in symbols or []:
+                session.add(symbol)
+            for record in files or []:
+                # merge: a sync re-indexing a file replaces its record
+                session.merge(record)
+            for location in locations or []:
+                session.add(location)
+            session.commit()
+        if symbols:
+            symbol_index.add(symbols)
+    # Let readers in other worker processes pick up the new data
+    bump_index_generation()
+
+# ----------------------------
+# PER-FILE STEPS (shared with incremental sync)
+# ----------------------------
+def display_path_for(file_path, target_path: str) -> str:
+    return str(file_path).replace(TEMP_REPO_DIR, "") if target_path == TEMP_REPO_DIR else str(file_path)
+
+def read_file(file_path, target_path: str, timings=None):
+    """
+    The file's text plus its IngestedFile record (digest of that text, stat
+    taken before reading so a concurrent write shows up as changed next sync).
+    """
+    with metrics.span("ingest", "read", timings):
+        stat = os.stat(file_path)
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+    record = IngestedFile(
+        path=str(file_path),
+        display_path=display_path_for(file_path, target_path),
+        digest=hashlib.sha1(content.encode("utf-8", errors="ignore")).hexdigest(),
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+    )
+    return content, record
+
+def parse_file(content: str, file_path, timings=None):
+    """(pieces, symbols): pieces are (text, start_line, end_line) to embed."""
+    # One parse feeds both the chunks and the symbol table, so a file's
+    # symbols never depend on how it was chunked
+    with metrics.span("ingest", "parse", timings):
+        tree = parse_python(content, str(file_path))
+        functions = extract_functions(content, str(file_path), tree)
+    with metrics.span("ingest", "symbols", timings):
+        symbols = extract_symbols(content, str(file_path), tree)
+
+    if not functions:
+        return [(chunk_text, None, None) for chunk_text in chunk_fallback(content)], symbols
+    pieces = [(func["code"], func["start_line"], func["end_line"]) for func in functions]
+    return pieces, symbols
+
+def _embed_file(buffer: ChunkBuffer, flush, id_source: IdSource, item, timings,
+                dedup: DedupIndex = None, sizes: ChunkSizes = None) -> int:
+    """
+    Embeds one parsed file into `buffer` (calling `flush` whenever it fills)
+    and returns the number of chunks it produced. With `dedup`, pieces that
+    copy an earlier chunk are recorded as its locations instead; `sizes`
+    collects the estimated token size of every chunk embedded.
+    """
+    file_path, record, pieces, symbols = item
+    file_name = os.path.basename(file_path)
+    display_path = record.display_path
+    kind = text_kind(file_name)
+
+    spans = []      # (chunk_id, start_line, end_line) of every piece, copies included
+    to_embed = []   # (chunk_id, digest, text, start_line, end_line)
+    with metrics.span("ingest", "dedup", timings):
+        for text, start_line, end_line in pieces:
+            digest = content_digest(text)
+            original = dedup.match(text, digest) if dedup is not None else None
+            if original is not None:
+                buffer.add_location(ChunkLocation(
+                    chunk_id=original, file_name=file_name, file_path=display_path,
+                    start_line=start_line, end_line=end_line,
+                ))
+                spans.append((original, start_line, end_line))
+                continue
+            chunk_id = id_source.next_id()
+            if dedup is not None:
+                dedup.add(chunk_id, text, digest)
+            to_embed.append((chunk_id, digest, text, start_line, end_line))
+            spans.append((chunk_id, start_line, end_line))
+
+    # Embedded in slices that fit the buffer, so a huge file can't
+    # outgrow it; the buffer is flushed mid-file when full
+    embedded = 0
+    for start in range(0, len(to_embed), buffer.capacity):
+        batch = to_embed[start:start + buffer.capacity]
+        with metrics.span("ingest", "embed", timings):
+            vectors = embedding_executor.embed([p[2] for p in batch], PRIORITY_INGEST)
+        for vector, (chunk_id, digest, text, start_line, end_line) in zip(vectors, batch):
+            if buffer.full:
+                flush()
+            chunk = Chunk(
+                id=chunk_id,
+                chunk_hash=digest,
+                chunk_type="code",
+                file_name=file_name,
+                file_path=display_path,
+                start_line=start_line,
+                end_line=end_line,
+                content=text
+            )
+            meta = {
+                "file_name": file_name,
+                "file_path": display_path,
+                "chunk_type": "code",
+                "start_line": str(start_line) if start_line else "",
+            }
+            buffer.add(vector, chunk, meta)
+            embedded += 1
+            tokens = estimate_tokens(text, file_name)
+            metrics.chunk_tokens.observe(tokens, kind=kind)
+            if sizes is not None:
+                sizes.add(tokens)
+
+    # Symbol table: link each definition to the chunk that holds it
+    buffer.add_symbols([
+        Symbol(
+            name=sym["name"],
+            qualified_name=sym["qualified_name"],
+            kind=sym["kind"],
+            file_name=file_name,
+            file_path=display_path,
+            start_line=sym["start_line"],
+            end_line=sym["end_line"],
+            chunk_id=_chunk_for_lines(spans, sym["start_line"], sym["end_line"])
+            if sym["kind"] in DEFINITION_KINDS else None
+        )
+        for sym in symbols
+    ])
+    buffer.add_file(record)
+
+    metrics.ingest_items.inc(kind="files")
+    metrics.ingest_items.inc(embedded, kind="chunks")
+    if len(pieces) > embedded:
+        metrics.ingest_items.inc(len(pieces) - embedded, kind="duplicates")
+
+    if buffer.full:
+        flush()
+    return embedded
+
+def head_commit(root: str):
+    """HEAD of the git repo at `root`, or None (not a repo, no commits yet)."""
+    try:
+        return git.Repo(root).head.commit.hexsha
+    except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError, ValueError):
+        return None
+
+def save_repo_state(source: str, root: str, commit=None):
     with Session(engine) as session:
-        for chunk in chunks:
-            session.add(chunk)
-        session.commit()
\ No newline at end of file
+        session.merge(RepoState(
+            key="current", source=source, root=root,
+            commit=commit or head_commit(root), synced_at=datetime.utcnow(),
+        ))
+        session.commit()
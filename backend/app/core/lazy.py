@@ -0,0 +1,113 @@
+#lazy.py
+import time
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+class LazyComponent:
+    """
+    Thread-safe, lazily constructed singleton.
+    The heavy object (model, client, index connection) is only built on first
+    use; attribute access on the proxy is forwarded to it, so call sites like
+    `embedder.embed_text(...)` keep working unchanged.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object]):
+        self._name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._instance = None
+        self._state = "not_loaded"   # not_loaded | loading | ready | failed
+        self._error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+        self._loaded_at: Optional[float] = None
+
+    def get(self):
+        instance = self._instance
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if self._instance is None:
+                self._state = "loading"
+                start = time.perf_counter()
+                try:
+                    self._instance = self._factory()
+                except Exception as e:
+                    self._state = "failed"
+                    self._error = str(e)
+                    self._load_seconds = time.perf_counter() - start
+                    raise
+                self._load_seconds = time.perf_counter() - start
+                self._loaded_at = time.time()
+                self._state = "ready"
+                self._error = None
+                print(f"✅ Loaded {self._name} in {self._load_seconds:.2f}s")
+        return self._instance
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def status(self) -> dict:
+        return {
+            "state": self._state,
+            "load_seconds": round(self._load_seconds, 3) if self._load_seconds is not None else None,
+            "loaded_at": self._loaded_at,
+            "error": self._error,
+        }
+
+    def __getattr__(self, attr):
+        # Dunder lookups (copy, pickle, repr helpers) must not trigger a model load
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"<LazyComponent {self._name} ({self._state})>"
+
+
+# ---------------------------------------------------------
+# REGISTRY (Warm-up + Readiness)
+# ---------------------------------------------------------
+_components: Dict[str, LazyComponent] = {}
+
+def lazy_component(name: str, factory: Callable[[], object]) -> LazyComponent:
+    component = LazyComponent(name, factory)
+    _components[name] = component
+    return component
+
+def warm_up(names: Optional[Iterable[str]] = None, background: bool = True) -> Optional[threading.Thread]:
+    """
+    Loads the given components (default: all registered ones).
+    Failures are logged, not raised, so a missing model or network
+    never prevents the API from starting.
+    """
+    names = list(_components) if names is None else names
+    targets = [_components[n] for n in names if n in _components]
+
+    def _load_all():
+        for component in targets:
+            try:
+                component.get()
+            except Exception as e:
+                print(f"⚠️ Warm-up failed for {component.name}: {e}")
+
+    if not background:
+        _load_all()
+        return None
+
+    thread = threading.Thread(target=_load_all, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def readiness() -> dict:
+    components = {name: c.status() for name, c in _components.items()}
+    return {
+        "ready": all(s["state"] == "ready" for s in components.values()),
+        "components": components,
+    }
@@ -1,7 +1,9 @@
 # llm.py
 import os
-import google.generativeai as genai
+from typing import Optional
 from dotenv import load_dotenv
+from app.core.lazy import lazy_component
+from app.core import metrics
 
 # Load environment variables
 load_dotenv()
@@ -11,12 +13,21 @@ class LLMClient:
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("❌ GEMINI_API_KEY not found in .env file")
-            
+
+        # Imported here: the Gemini SDK takes ~0.5s to import
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
         # Using 1.5-flash for speed/cost, or 1.5-pro for better reasoning
         self.model = genai.GenerativeModel('gemini-2.5-flash')
 
-    def generate_answer(self, context: str, question: str) -> str:
+    def generate_answer(self, context: str, question: str, history: Optional[str] = None) -> str:
+        # Earlier turns of the same chat, so follow-ups can refer back to them
+        history_section = f"""
+        ### PREVIOUS CONVERSATION (most recent last):
+        {history}
+        """ if history else ""
+
         prompt = f"""
         You are an expert Senior Software Engineer and Codebase Assistant.
         Your task is to answer the user's question accurately based **ONLY** on the provided code context.
@@ -39,6 +50,7 @@ class LLMClient:
         4. **References:**
            - Mention specific file names from the context when explaining logic (e.g., "As seen in `src/auth/handler.ts`...").
 
+        {history_section}
         ### CONTEXT:
         {context}
         
@@ -51,8 +63,45 @@ class LLMClient:
         try:
             # We assume a clean response is desired
             response = self.model.generate_content(prompt)
+            _record_usage(response, prompt)
             return response.text
         except Exception as e:
+            metrics.stage_errors.inc(pipeline="rag", stage="llm")
             return f"**Error generating answer:** {str(e)}"
 
-llm_client = LLMClient()
\ No newline at end of file
+    def summarize(self, source: str, kind: str = "file") -> Optional[str]:
+        """
+        A few sentences on what a file or directory is for, used by the
+        hierarchical summary index (SUMMARY_MODE=llm). None on failure.
+        """
+        prompt = f"""
+        You are indexing a codebase for search. Below is an outline of one {kind}
+        (its documentation, imports and definitions, or its files).
+        In 3-5 plain sentences, say what this {kind} is responsible for, its main
+        components, and which other parts of the system it works with.
+        Mention the key names so they can be searched. No Markdown.
+
+        ### OUTLINE:
+        {source}
+        """
+        try:
+            response = self.model.generate_content(prompt)
+            _record_usage(response, prompt)
+            return response.text
+        except Exception as e:
+            metrics.stage_errors.inc(pipeline="ingest", stage="summaries")
+            print(f"⚠️ Summary generation failed, keeping the extractive one: {e}")
+            return None
+
+def _record_usage(response, prompt: str):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    completion_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens is None:
+        # ~4 characters per token when the API doesn't report usage
+        prompt_tokens = len(prompt) // 4
+    if completion_tokens is None:
+        completion_tokens = len(getattr(response, "text", "") or "") // 4
+    metrics.record_tokens(int(prompt_tokens), int(completion_tokens))
+
+llm_client = lazy_component("llm", LLMClient)
\ No newline at end of file
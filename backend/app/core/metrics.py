@@ -0,0 +1,401 @@
+#metrics.py
+"""
+Lightweight instrumentation: counters, histograms and per-request traces.
+
+    with span("rag", "rerank"):
+        ...
+
+times a stage into `codemind_stage_seconds{pipeline,stage}`, counts it in
+`codemind_stage_errors_total` if it raises, and appends it to the current
+request's trace (returned in /chat's `debug` field when asked for).
+GET /metrics renders everything in the Prometheus text format.
+
+Values are per process. Each process also snapshots its values to
+DATA_DIR/metrics/ every few seconds, and /metrics merges the snapshots of all
+live processes, so a scrape of any pre-forked worker covers the whole server.
+When a worker dies its last counter and histogram values are folded into
+DATA_DIR/metrics/retired.json, so totals never go backwards; gauges are dropped.
+"""
+import os
+import glob
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from app.core.coordination import DATA_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: retiring is only guarded by the process lock
+    fcntl = None
+
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+RETIRED_FILE = os.path.join(METRICS_DIR, "retired.json")
+RETIRED_LOCK_FILE = os.path.join(METRICS_DIR, "retired.lock")
+METRICS_SNAPSHOT_INTERVAL_S = float(os.getenv("METRICS_SNAPSHOT_INTERVAL_S", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048)
+
+
+# ---------------------------------------------------------
+# 1. METRIC TYPES
+# ---------------------------------------------------------
+class _Metric:
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Tuple[str, ...],
+                 buckets: Optional[Tuple[float, ...]] = None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind                # "counter" | "histogram" | "gauge"
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values tuple -> float (counter/gauge) or [bucket counts..., sum, count]
+        self.values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, "counter", tuple(labelnames))
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+        _ensure_snapshotter()
+
+
+class Gauge(_Metric):
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, "gauge", tuple(labelnames))
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self.values[self._key(labels)] = float(value)
+        _ensure_snapshotter()
+
+
+class Histogram(_Metric):
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, "histogram", tuple(labelnames), tuple(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+        _ensure_snapshotter()
+
+
+_lock = threading.Lock()
+_registry: Dict[str, _Metric] = {}
+
+def _register(metric: _Metric) -> _Metric:
+    _registry[metric.name] = metric
+    return metric
+
+
+# ---------------------------------------------------------
+# 2. THE METRICS THIS APP EXPORTS
+# ---------------------------------------------------------
+stage_seconds = _register(Histogram(
+    "codemind_stage_seconds", "Duration of one pipeline stage.", ("pipeline", "stage")))
+stage_errors = _register(Counter(
+    "codemind_stage_errors_total", "Stages that raised.", ("pipeline", "stage")))
+request_seconds = _register(Histogram(
+    "codemind_request_seconds", "End-to-end duration of a traced operation.", ("pipeline", "outcome")))
+candidates = _register(Histogram(
+    "codemind_candidates", "Candidates flowing through a retrieval stage.", ("stage",), COUNT_BUCKETS))
+cache_events = _register(Counter(
+    "codemind_cache_events_total", "Cache lookups by cache and result.", ("cache", "result")))
+llm_tokens = _register(Counter(
+    "codemind_llm_tokens_total", "LLM tokens by direction (prompt/completion).", ("direction",)))
+ingest_items = _register(Counter(
+    "codemind_ingest_items_total", "Files, chunks, symbols, commits and collapsed duplicates ingested.", ("kind",)))
+queue_depth = _register(Gauge(
+    "codemind_queue_depth", "Items waiting in (or held by) an internal queue.", ("queue",)))
+chunk_tokens = _register(Histogram(
+    "codemind_chunk_tokens", "Estimated embedder tokens per embedded chunk.", ("kind",), TOKEN_BUCKETS))
+admission_rejected = _register(Counter(
+    "codemind_admission_rejected_total", "Requests turned away by admission control.", ("endpoint", "reason")))
+
+
+# ---------------------------------------------------------
+# 3. TRACES (one per request / ingestion job)
+# ---------------------------------------------------------
+class Trace:
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+        self.counts: Dict[str, int] = {}
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "pipeline": self.pipeline,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": self.spans,
+            "counts": self.counts,
+            "error": self.error,
+        }
+
+
+_current_trace: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("codemind_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace(pipeline: str):
+    """Starts a trace for one operation; yields the Trace."""
+    t = Trace(pipeline)
+    token = _current_trace.set(t)
+    outcome = "ok"
+    try:
+        yield t
+    except Exception as e:
+        outcome = "error"
+        t.error = str(e)
+        raise
+    finally:
+        _current_trace.reset(token)
+        request_seconds.observe(time.perf_counter() - t.started, pipeline=pipeline, outcome=outcome)
+
+@contextmanager
+def span(pipeline: str, stage: str, totals: Optional[Dict[str, float]] = None):
+    """
+    Times one stage. `totals` (optional) accumulates seconds per stage for
+    callers that report a breakdown themselves, e.g. an ingestion job.
+    Don't yield from a generator inside a span: the consumer's time would count.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        stage_errors.inc(pipeline=pipeline, stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, pipeline=pipeline, stage=stage)
+        if totals is not None:
+            totals[stage] = totals.get(stage, 0.0) + elapsed
+        t = _current_trace.get()
+        if t is not None:
+            entry = {"stage": stage, "ms": round(elapsed * 1000, 2)}
+            if failed:
+                entry["error"] = True
+            t.spans.append(entry)
+
+def record_count(stage: str, n: int):
+    """Candidate counts per retrieval stage (histogram + current trace)."""
+    candidates.observe(n, stage=stage)
+    t = _current_trace.get()
+    if t is not None:
+        t.counts[stage] = n
+
+def cache_event(cache: str, hit: bool):
+    result = "hit" if hit else "miss"
+    cache_events.inc(cache=cache, result=result)
+    t = _current_trace.get()
+    if t is not None:
+        field = f"{cache}_cache_{result}"
+        t.counts[field] = t.counts.get(field, 0) + 1
+
+def record_tokens(prompt: int, completion: int):
+    llm_tokens.inc(prompt, direction="prompt")
+    llm_tokens.inc(completion, direction="completion")
+    t = _current_trace.get()
+    if t is not None:
+        t.counts["prompt_tokens"] = prompt
+        t.counts["completion_tokens"] = completion
+
+
+# ---------------------------------------------------------
+# 4. CROSS-PROCESS SNAPSHOTS
+# ---------------------------------------------------------
+_snapshotter: Optional[threading.Thread] = None
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"metrics.{pid}.json")
+
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            name: [[list(key), value] for key, value in metric.values.items()]
+            for name, metric in _registry.items() if metric.values
+        }
+
+def _write_snapshot():
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = _snapshot_path(os.getpid())
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+def _snapshot_loop():
+    while True:
+        time.sleep(METRICS_SNAPSHOT_INTERVAL_S)
+        _write_snapshot()
+
+def _ensure_snapshotter():
+    global _snapshotter
+    if _snapshotter is None or not _snapshotter.is_alive():
+        with _lock:
+            if _snapshotter is None or not _snapshotter.is_alive():
+                _snapshotter = threading.Thread(target=_snapshot_loop, name="metrics-snapshot", daemon=True)
+                _snapshotter.start()
+
+def _after_fork_in_child():
+    # Workers start from zero: the master's pre-fork values belong to the master
+    global _snapshotter, _lock
+    _lock = threading.Lock()
+    _snapshotter = None
+    for metric in _registry.values():
+        metric.values = {}
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _fold(merged: Dict[str, Dict[tuple, object]], data: dict, keep_gauges: bool = True):
+    """Adds one snapshot's values into `merged` (histograms element-wise)."""
+    for name, entries in data.items():
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == "gauge" and not keep_gauges):
+            continue
+        target = merged.setdefault(name, {})
+        for key, value in entries:
+            key = tuple(key)
+            if metric.kind == "histogram":
+                if key in target:
+                    target[key] = [a + b for a, b in zip(target[key], value)]
+                else:
+                    target[key] = list(value)
+            else:
+                target[key] = target.get(key, 0.0) + value
+
+def _as_entries(values: Dict[str, Dict[tuple, object]]) -> dict:
+    return {name: [[list(key), value] for key, value in entries.items()] for name, entries in values.items()}
+
+def _load_retired() -> dict:
+    try:
+        with open(RETIRED_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _retire(path: str):
+    """
+    Folds a dead process's last counters into the retired totals, then removes
+    its snapshot. Runs under a file lock so two scraping workers can't both
+    count the same snapshot.
+    """
+    handle = None
+    try:
+        if fcntl is not None:
+            handle = open(RETIRED_LOCK_FILE, "a+")
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return  # another worker retired it first
+        except ValueError:
+            data = {}
+        retired: Dict[str, Dict[tuple, object]] = {}
+        _fold(retired, _load_retired())
+        _fold(retired, data, keep_gauges=False)
+        tmp_path = RETIRED_FILE + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_as_entries(retired), f)
+        os.replace(tmp_path, RETIRED_FILE)
+        os.remove(path)
+    except OSError:
+        pass
+    finally:
+        if handle is not None:
+            handle.close()
+
+def _merged_values() -> dict:
+    """Own live values, the latest snapshot of every other live process and the retired totals."""
+    _write_snapshot()
+    merged: Dict[str, Dict[tuple, object]] = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics.*.json")):
+        try:
+            pid = int(os.path.basename(path).split(".")[1])
+        except (IndexError, ValueError):
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            _retire(path)
+            continue
+        try:
+            with open(path) as f:
+                data = _snapshot() if pid == os.getpid() else json.load(f)
+        except (OSError, ValueError):
+            continue
+        _fold(merged, data)
+    _fold(merged, _load_retired(), keep_gauges=False)
+    return merged
+
+
+# ---------------------------------------------------------
+# 5. PROMETHEUS TEXT FORMAT
+# ---------------------------------------------------------
+def _labels(names, values, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render_prometheus() -> str:
+    merged = _merged_values()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.kind == "histogram":
+                # Bucket counts are already cumulative (every bucket with value <= bound)
+                for bound, count in zip(metric.buckets, value):
+                    lines.append(f"{name}_bucket{_labels(metric.labelnames, key, ('le', _number(bound)))} {count}")
+                lines.append(f"{name}_bucket{_labels(metric.labelnames, key, ('le', '+Inf'))} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(metric.labelnames, key)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(metric.labelnames, key)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_labels(metric.labelnames, key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -1,44 +1,40 @@
 #parser.py
-from tree_sitter_languages import get_language, get_parser
+import builtins
+from tree_sitter_languages import get_parser
+from app.core.chunk_planner import plan_python_chunks, char_budget
 
-def extract_functions(code: str, filename: str):
+# Calls to builtins (print, len, range...) are pure noise in a symbol table
+_BUILTIN_NAMES = set(dir(builtins))
+
+def parse_python(code: str, filename: str):
+    """The tree-sitter tree of a Python file, or None (other files, parse failure)."""
+    if not filename.endswith(".py"):
+        return None
+    try:
+        return get_parser("python").parse(bytes(code, "utf8"))
+    except Exception as e:
+        print(f"Parse failed for {filename}: {e}")
+        return None
+
+def extract_functions(code: str, filename: str, tree=None):
     """
     Universal Parser.
-    1. Python -> Smart AST splitting (by function).
-    2. Others -> Recursive Text splitting (by chunks of ~1000 chars).
+    1. Python -> Smart AST splitting (by definition, sized by chunk_planner.py).
+    2. Others -> Recursive Text splitting (by chunks of ~CHUNK_MAX_TOKENS).
+    Pass `tree` (parse_python) to reuse a parse shared with extract_symbols.
     """
     
     # --- STRATEGY 1: SMART PARSING (Python) ---
     if filename.endswith(".py"):
         try:
-            language = get_language("python")
-            parser = get_parser("python")
-            tree = parser.parse(bytes(code, "utf8"))
-            
-            query_scm = """
-            (function_definition
-              name: (identifier) @func.name
-            ) @func.def
-            """
+            if tree is None:
+                tree = get_parser("python").parse(bytes(code, "utf8"))
             
-            query = language.query(query_scm)
-            captures = query.captures(tree.root_node)
+            # Whole definitions when they fit the embedder, split at statement
+            # boundaries when they don't, tiny neighbours merged
+            results = plan_python_chunks(tree.root_node, code)
             
-            results = []
-            for node, tag in captures:
-                if tag == "func.def":
-                    func_code = node.text.decode("utf8")
-                    name_node = node.child_by_field_name("name")
-                    func_name = name_node.text.decode("utf8") if name_node else "anonymous"
-                    
-                    results.append({
-                        "name": func_name,
-                        "code": func_code,
-                        "start_line": node.start_point[0] + 1,
-                        "end_line": node.end_point[0] + 1
-                    })
-            
-            # If we found functions, return them.
+            # If we found anything, return it.
             if results:
                 return results
                 
@@ -49,7 +45,8 @@ def extract_functions(code: str, filename: str):
     # This ensures ANY file (JS, TS, HTML, CSS, TXT) is broken down 
     # into digestible pieces for the AI, preventing "context overflow".
     
-    return recursive_text_chunker(code, filename)
+    chunk_size = char_budget(filename)
+    return recursive_text_chunker(code, filename, chunk_size=chunk_size, overlap=chunk_size // 5)
 
 def recursive_text_chunker(text: str, filename: str, chunk_size: int = 1000, overlap: int = 200):
     """
@@ -100,4 +97,85 @@ def recursive_text_chunker(text: str, filename: str, chunk_size: int = 1000, ove
             
         chunk_counter += 1
         
-    return results
\ No newline at end of file
+    return results
+
+# ---------------------------------------------------------
+# SYMBOL EXTRACTION (Definitions + Call Sites)
+# ---------------------------------------------------------
+def extract_symbols(code: str, filename: str, tree=None):
+    """
+    Walks the Python AST and returns every definition and call site.
+    Each symbol is a dict with: name, qualified_name, kind, start_line, end_line.
+    kind is one of "class", "function", "method" or "call".
+    Non-Python files return an empty list (they are text-chunked anyway).
+    """
+    if not filename.endswith(".py"):
+        return []
+
+    if tree is None:
+        tree = parse_python(code, filename)
+        if tree is None:
+            return []
+
+    symbols = []
+
+    # Iterative walk so deeply nested code can't blow the recursion limit.
+    # Each stack entry carries the enclosing scope: (node, scope_names, inside_class)
+    stack = [(tree.root_node, [], False)]
+
+    while stack:
+        node, scope, in_class = stack.pop()
+        child_scope, child_in_class = scope, False
+
+        if node.type in ("class_definition", "function_definition"):
+            name_node = node.child_by_field_name("name")
+            name = name_node.text.decode("utf8") if name_node else "anonymous"
+
+            if node.type == "class_definition":
+                kind = "class"
+            else:
+                kind = "method" if in_class else "function"
+
+            symbols.append({
+                "name": name,
+                "qualified_name": ".".join(scope + [name]),
+                "kind": kind,
+                "start_line": node.start_point[0] + 1,
+                "end_line": node.end_point[0] + 1
+            })
+            child_scope = scope + [name]
+            child_in_class = node.type == "class_definition"
+
+        elif node.type == "call":
+            func_node = node.child_by_field_name("function")
+            name = None
+
+            # For `self.store.search(...)` the name is 'search' and the
+            # qualified name keeps the full dotted expression.
+            if func_node is not None and func_node.type == "attribute":
+                attr = func_node.child_by_field_name("attribute")
+                name = attr.text.decode("utf8") if attr else None
+            elif func_node is not None and func_node.type == "identifier":
+                name = func_node.text.decode("utf8")
+                if name in _BUILTIN_NAMES:
+                    name = None
+
+            if name:
+                symbols.append({
+                    "name": name,
+                    "qualified_name": func_node.text.decode("utf8"),
+                    "kind": "call",
+                    "start_line": node.start_point[0] + 1,
+                    "end_line": node.end_point[0] + 1
+                })
+
+        # Class bodies are wrapped in a 'block' node (and decorators in a
+        # 'decorated_definition'), so propagate the flag through those wrappers
+        if node.type in ("block", "decorated_definition") and in_class:
+            child_in_class = True
+
+        for child in reversed(node.children):
+            stack.append((child, child_scope, child_in_class))
+
+    symbols.sort(key=lambda s: (s["start_line"], s["kind"] == "call"))
+    return symbols
@@ -0,0 +1,237 @@
+#profiling.py
+"""
+Opt-in profiling of one unit of work (a chat request or an ingestion job).
+
+    with profile_session("ingest", job_id, enabled=True) as profile:
+        ...
+
+writes these artifacts to DATA_DIR/profiles/<id>/:
+- profile.prof       cProfile stats of the calling thread (pstats / snakeviz)
+- stats.txt          top functions by cumulative time, readable as is
+- collapsed.txt      wall-clock stack samples of ALL threads in "collapsed"
+                     format (speedscope / flamegraph.pl). This is what shows
+                     the embedding worker, which cProfile can't see.
+- alloc.txt          top allocation sites (tracemalloc) and peak traced memory
+- meta.json          kind, id, duration and the list of artifacts
+
+tracemalloc is process-wide: if two profiled units overlap, each allocation
+report also contains the other's allocations.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+from app.core.coordination import DATA_DIR
+
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+
+ARTIFACTS = ("profile.prof", "stats.txt", "collapsed.txt", "alloc.txt", "meta.json")
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_profile_id(profile_id: str) -> bool:
+    return bool(_ID_PATTERN.match(profile_id or ""))
+
+
+# ---------------------------------------------------------
+# 1. STACK SAMPLER (all threads, wall clock)
+# ---------------------------------------------------------
+class StackSampler:
+    """Samples every thread's Python stack at a fixed interval."""
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(f"thread:{names.get(thread_id, thread_id)}")
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# ---------------------------------------------------------
+# 2. PROFILE SESSION
+# ---------------------------------------------------------
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+def _start_tracemalloc():
+    # Reference-counted: tracing stops when the last overlapping session ends
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class Profile:
+    def __init__(self, kind: str, profile_id: str):
+        self.kind = kind
+        self.id = profile_id
+        self.dir = os.path.join(PROFILES_DIR, profile_id)
+        self.started_at = time.time()
+
+    def summary(self) -> dict:
+        return {"id": self.id, "kind": self.kind, "url": f"/profiles/{self.id}"}
+
+
+@contextmanager
+def profile_session(kind: str, profile_id: str, enabled: bool = True):
+    """
+    Profiles the enclosed work when `enabled`; yields a Profile (or None).
+    Artifacts are written even if the work raises.
+    """
+    if not enabled:
+        yield None
+        return
+    if not valid_profile_id(profile_id):
+        raise ValueError(f"Invalid profile id: {profile_id!r}")
+
+    profile = Profile(kind, profile_id)
+    sampler = StackSampler()
+    profiler = cProfile.Profile()
+    _start_tracemalloc()
+    start = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    error = None
+    try:
+        yield profile
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        profiler.disable()
+        sampler.stop()
+        duration = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _stop_tracemalloc()
+        try:
+            _write_artifacts(profile, profiler, sampler, snapshot, peak, duration, error)
+        except OSError as e:
+            print(f"⚠️ Could not write profile {profile_id}: {e}")
+
+
+def _write_artifacts(profile: Profile, profiler: cProfile.Profile, sampler: StackSampler,
+                     snapshot: tracemalloc.Snapshot, peak: int, duration: float, error: Optional[str]):
+    os.makedirs(profile.dir, exist_ok=True)
+
+    profiler.dump_stats(os.path.join(profile.dir, "profile.prof"))
+
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(60)
+    with open(os.path.join(profile.dir, "stats.txt"), "w") as f:
+        f.write(out.getvalue())
+
+    with open(os.path.join(profile.dir, "collapsed.txt"), "w") as f:
+        f.write(sampler.collapsed())
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    with open(os.path.join(profile.dir, "alloc.txt"), "w") as f:
+        f.write(f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB\n\n")
+        f.write("Top allocation sites (still allocated at the end of the unit of work):\n")
+        for stat in snapshot.statistics("lineno")[:40]:
+            f.write(f"{stat}\n")
+
+    meta = {
+        "id": profile.id,
+        "kind": profile.kind,
+        "started_at": profile.started_at,
+        "duration_s": round(duration, 4),
+        "peak_traced_mb": round(peak / (1024 * 1024), 2),
+        "samples": sum(sampler.samples.values()),
+        "error": error,
+        "artifacts": [name for name in ARTIFACTS if name != "meta.json"],
+    }
+    with open(os.path.join(profile.dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"🔬 Profile {profile.id} ({profile.kind}, {duration:.2f}s) saved to {profile.dir}")
+    _prune()
+
+
+# ---------------------------------------------------------
+# 3. STORED ARTIFACTS
+# ---------------------------------------------------------
+def list_profiles() -> List[dict]:
+    """Metadata of stored profiles, newest first."""
+    profiles = []
+    if not os.path.isdir(PROFILES_DIR):
+        return profiles
+    for name in os.listdir(PROFILES_DIR):
+        meta = get_profile(name)
+        if meta is not None:
+            profiles.append(meta)
+    profiles.sort(key=lambda m: m["started_at"], reverse=True)
+    return profiles
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    if not valid_profile_id(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILES_DIR, profile_id, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def artifact_path(profile_id: str, artifact: str) -> Optional[str]:
+    if not valid_profile_id(profile_id) or artifact not in ARTIFACTS:
+        return None
+    path = os.path.join(PROFILES_DIR, profile_id, artifact)
+    return path if os.path.isfile(path) else None
+
+def _prune():
+    profiles = list_profiles()
+    for meta in profiles[PROFILE_KEEP:]:
+        shutil.rmtree(os.path.join(PROFILES_DIR, meta["id"]), ignore_errors=True)
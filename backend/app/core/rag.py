@@ -1,13 +1,27 @@
+import os
 import re
 from typing import List, Optional, Set
-from flashrank import Ranker, RerankRequest
-from sqlmodel import Session, select, col
-from app.core.embedder import embedder
-from app.core.vector_store import vector_db
+import numpy as np
+from sqlmodel import Session, select, col, func
+from app.core.embedding_executor import embedding_executor
+from app.core.chunk_store import chunk_store
 from app.core.llm import llm_client
+from app.core.symbols import symbol_index
+from app.core.reranker import reranker
+from app.core.candidates import CandidateSet
+from app.core.summaries import summary_index
+from app.core import metrics
+from app.core.conversation import conversation_cache, CONVERSATION_REUSE_SIMILARITY
 from app.db.session import engine
 from app.db.models import Chunk
-import math
+
+# Broad questions (no identifier named) go through the summary index first:
+# the best file/directory summaries pick the modules, then only their chunks
+# are searched, so fewer candidates reach the reranker
+ROUTE_ENABLED = os.getenv("ROUTE_ENABLED", "true").lower() == "true"
+ROUTE_SUMMARIES = int(os.getenv("ROUTE_SUMMARIES", "4"))      # modules routed to
+ROUTE_CANDIDATES = int(os.getenv("ROUTE_CANDIDATES", "20"))   # chunks drilled down to
+ROUTE_MIN_HITS = int(os.getenv("ROUTE_MIN_HITS", "5"))        # fewer: plain search instead
 
 # ---------------------------------------------------------
 # HELPER: Context Expansion Logic (Feature 2)
@@ -42,62 +56,103 @@ def _extract_imports(code_snippets: List[str]) -> Set[str]:
 # EXISTING LOGIC
 # ---------------------------------------------------------
 
-# Sigmoid normalization for raw model scores
-def sigmoid(x: float) -> float:
-    return 1 / (1 + math.exp(-x))
-
-def normalize_score(raw_score: float) -> float:
+def normalize_scores(scores: np.ndarray) -> np.ndarray:
     """
-    Convert raw AI logits/scores into normalized 0-1 scale.
+    Result scores are already 0-1 relevance (cross-encoder probability or
+    calibrated vector similarity, see candidates.py); clip for display.
     """
-    return sigmoid(raw_score)
+    return np.clip(scores, 0.0, 1.0)
 
-# 1. Initialize Reranker
-ranker = Ranker(model_name="ms-marco-MiniLM-L-12-v2", cache_dir="/opt")
+def generate_rag_response(question: str, file_path_filter: Optional[str] = None,
+                          session_id: Optional[str] = None) -> dict:
+    # Earlier turns of this chat (None for a new or evicted session)
+    conversation = conversation_cache.get(session_id)
+    last_turn = conversation.last_turn() if conversation else None
+    if session_id:
+        metrics.cache_event("conversation", conversation is not None)
 
-def generate_rag_response(question: str, file_path_filter: Optional[str] = None) -> dict:
     # --- PHASE 1: Broad Retrieval (FAISS) ---
-    query_vector = embedder.embed_text(question)
-
-    # Get 50 candidates
-    distances, indices = vector_db.search(query_vector, k=50)
-    valid_indices = [int(idx) for idx in indices[0] if idx != -1]
-
-    if not valid_indices:
-        return {"answer": "I found no relevant code to analyze.", "context": []}
-
-    # --- PHASE 2: Metadata Filtering ---
-    with Session(engine) as session:
-        statement = select(Chunk).where(Chunk.id.in_(valid_indices))
-        if file_path_filter:
-            statement = statement.where(col(Chunk.file_path).contains(file_path_filter))
-
-        candidate_chunks = session.exec(statement).all()
-
-    if not candidate_chunks:
-        return {"answer": f"No code found matching filter: '{file_path_filter}'", "context": []}
-
-    # --- PHASE 3: Re-Ranking ---
-    passages = [
-        {
-            "id": c.id,
-            "text": c.content,
-            "meta": {
-                "file_name": c.file_name,
-                "file_path": c.file_path,
-                "start_line": c.start_line,
-                "end_line": c.end_line,
-                "type": getattr(c, "chunk_type", "code") # Safe access
-            },
-        }
-        for c in candidate_chunks
-    ]
+    # Query priority: never waits behind ingestion batches
+    retrieval_text = conversation.retrieval_text(question) if conversation else question
+    with metrics.span("rag", "embed"):
+        query_vector = embedding_executor.embed_query(retrieval_text)
+
+    routes = []
+    if (last_turn and last_turn.results and last_turn.file_filter == file_path_filter
+            and last_turn.similarity(query_vector) >= CONVERSATION_REUSE_SIMILARITY):
+        # Same question again: reuse the previous turn's reranked context
+        metrics.cache_event("conversation_reuse", True)
+        ranked_results = last_turn.results
+    else:
+        # High-precision candidates: definitions of identifiers named in the question
+        with metrics.span("rag", "symbol_lookup"):
+            symbol_ids = [
+                entry["chunk_id"] for entry in symbol_index.definitions_in_text(question)
+                if entry["chunk_id"] is not None
+            ]
+
+        # Broad question: route to the relevant modules, then drill down into their chunks
+        scoped = None
+        if ROUTE_ENABLED and not symbol_ids:
+            with metrics.span("rag", "route"):
+                routes = summary_index.route(query_vector, k=ROUTE_SUMMARIES, file_filter=file_path_filter)
+            if routes:
+                with metrics.span("rag", "drill_down"):
+                    scoped = chunk_store.search_within(query_vector, routes, k=ROUTE_CANDIDATES,
+                                                       file_filter=file_path_filter)
+                if scoped is not None and len(scoped[0]) < ROUTE_MIN_HITS:
+                    scoped = None
+            metrics.record_count("routed", len(routes) if scoped is not None else 0)
+
+        if scoped is not None:
+            hits, vector_scores = scoped
+        else:
+            # Get 50 candidates, with their text and metadata (chunk_store.py)
+            with metrics.span("rag", "vector_search"):
+                hits, vector_scores = chunk_store.search(query_vector, k=50, file_filter=file_path_filter)
+
+        # Passages earlier turns already hold compete again
+        cached = conversation.passages(file_path_filter) if conversation else {}
+        metrics.record_count("vector", len(vector_scores))
+        metrics.record_count("symbol", len(symbol_ids))
+        metrics.record_count("cached", len(cached))
+
+        if not vector_scores and not symbol_ids and not cached:
+            return {"answer": "I found no relevant code to analyze.", "context": []}
 
-    rerank_request = RerankRequest(query=question, passages=passages)
-    ranked_results = ranker.rerank(rerank_request)
+        # --- PHASE 2: Symbol definitions the vector search missed (only the delta) ---
+        extra_ids = [idx for idx in dict.fromkeys(symbol_ids) if idx not in vector_scores and idx not in cached]
+        if extra_ids:
+            with metrics.span("rag", "chunk_lookup"):
+                hits = chunk_store.get(extra_ids, file_path_filter) + hits
+        candidates = [p for p in hits if p["id"] not in cached]
+
+        metrics.record_count("filtered", len(candidates))
+        if not candidates and not cached:
+            if not file_path_filter:
+                return {"answer": "I found no relevant code to analyze.", "context": []}
+            return {"answer": f"No code found matching filter: '{file_path_filter}'", "context": []}
+
+        # --- PHASE 3: Re-Ranking ---
+        # Cached passages are scored against this query: a missing score ranks
+        # like a symbol hit (always first, see candidates.py)
+        unscored = [idx for idx in cached if idx not in vector_scores and idx not in symbol_ids]
+        if unscored:
+            with metrics.span("rag", "rescore_cached"):
+                rescored = chunk_store.similarities(query_vector, unscored)
+            # A chunk gone from the index since that turn gets the lowest score
+            vector_scores = {**vector_scores, **{idx: rescored.get(idx, -1.0) for idx in unscored}}
+        passages = candidates + list(cached.values())
+
+        # Adaptive depth, early exit and batched cross-encoder (see reranker.py);
+        # scores and top-k stay in arrays, only the winners become dicts
+        with metrics.span("rag", "rerank"):
+            scored, top, scores = reranker.rank(retrieval_text, CandidateSet(passages, vector_scores), top_k=5)
+            ranked_results = scored.materialize(top, scores)
 
     # Pick Top 5
     top_results = ranked_results[:5]
+    metrics.record_count("reranked", len(top_results))
 
     # =========================================================
     # 🔥 FEATURE 2: MULTI-FILE REASONING (Context Expansion) 🔥
@@ -114,39 +169,56 @@ def generate_rag_response(question: str, file_path_filter: Optional[str] = None)
 
     if files_to_fetch:
         # print(f"🔍 Multi-File Reasoning: Detected dependencies {files_to_fetch}. Fetching...")
-        with Session(engine) as session:
-            # Fetch up to 1 chunk per detected file (to keep context small but relevant)
-            expansion_query = select(Chunk).where(
-                col(Chunk.file_name).in_(files_to_fetch)
-            )
-            # Limit to avoid token overflow, e.g., max 3 extra files
-            extra_chunks = session.exec(expansion_query).all()
-            
-            # Simple deduplication: take the first chunk found for each file
-            seen_extras = set()
-            for chunk in extra_chunks:
-                if chunk.file_name not in seen_extras and len(expanded_context_items) < 3:
-                    seen_extras.add(chunk.file_name)
-                    
-                    expanded_context_items.append({
-                        "file": chunk.file_name,
-                        "path": chunk.file_path,
-                        "lines": "Dependency", # Mark as dependency
-                        "score": "Linked",     # Mark as linked
-                        "code": chunk.content
-                    })
+        with metrics.span("rag", "expand"):
+            with Session(engine) as session:
+                # Fetch up to 1 chunk per detected file (to keep context small but relevant):
+                # the first chunk of each file, limited to 3 extra files to avoid
+                # token overflow. SQLite does the dedup instead of returning every row
+                first_id = func.min(Chunk.id)
+                expansion_query = (
+                    select(first_id)
+                    .where(col(Chunk.file_name).in_(files_to_fetch))
+                    .group_by(Chunk.file_name)
+                    .order_by(first_id)
+                    .limit(3)
+                )
+                first_per_file = session.exec(expansion_query).all()
+
+            for passage in chunk_store.get(list(first_per_file)):
+                expanded_context_items.append({
+                    "file": passage["meta"]["file_name"],
+                    "path": passage["meta"]["file_path"],
+                    "lines": "Dependency", # Mark as dependency
+                    "score": "Linked",     # Mark as linked
+                    "code": passage["text"]
+                })
     # =========================================================
 
+    metrics.record_count("expanded", len(expanded_context_items))
+
     # --- PHASE 4: Build Rich Context for Frontend ---
     context_data = []
     context_text_for_llm = ""
 
+    # 4.0 Module overviews the question was routed to (architecture before the details)
+    if routes:
+        context_text_for_llm += "\n--- MODULE OVERVIEW ---\n"
+        for route in routes[:2]:
+            context_data.append({
+                "file": os.path.basename(route["path"].rstrip("/")) or route["path"],
+                "path": route["path"],
+                "lines": "Summary",
+                "score": f"{int(max(route['score'], 0.0) * 100)}%",  # cosine similarity
+                "code": route["text"],
+            })
+            context_text_for_llm += f"\n{route['text']}\n"
+
     # 4a. Add Primary Results (Includes Feature 1: Git Logic)
-    for res in top_results:
+    result_scores = np.fromiter((res["score"] for res in top_results), dtype=np.float64, count=len(top_results))
+    match_percents = (normalize_scores(result_scores) * 100).astype(int)
+    for res, percent in zip(top_results, match_percents):
         meta = res["meta"]
-        raw_score = res["score"]
-        normalized = normalize_score(raw_score)
-        match_percent = f"{int(normalized * 100)}%"
+        match_percent = f"{percent}%"
 
         # Handle Line Numbers gracefully (Feature 1 Compatibility)
         if meta.get("start_line") is not None:
@@ -163,11 +235,20 @@ def generate_rag_response(question: str, file_path_filter: Optional[str] = None)
             "score": match_percent,
             "code": res["text"],
         }
+        # Copies collapsed into this chunk at ingestion (dedup.py): one result, every location
+        also_in = [
+            f"{loc['file_path']}:{loc['start_line']}-{loc['end_line']}" if loc.get("start_line") is not None
+            else loc["file_path"]
+            for loc in meta.get("also_in") or []
+        ]
+        if also_in:
+            context_item["also_in"] = also_in
         context_data.append(context_item)
 
         context_text_for_llm += (
             f"\n--- Source: {file_display} (Lines {lines_display}) ---\n"
-            f"{res['text']}\n"
+            + (f"(Same code also in: {', '.join(also_in)})\n" if also_in else "")
+            + f"{res['text']}\n"
         )
 
     # 4b. Add Expanded (Dependency) Results (Feature 2 Logic)
@@ -184,7 +265,11 @@ def generate_rag_response(question: str, file_path_filter: Optional[str] = None)
             )
 
     # --- PHASE 5: Generation ---
-    answer = llm_client.generate_answer(context_text_for_llm, question)
+    history = conversation.history_text() if conversation else None
+    with metrics.span("rag", "generate"):
+        answer = llm_client.generate_answer(context_text_for_llm, question, history=history)
+
+    conversation_cache.record_turn(session_id, question, query_vector, file_path_filter, top_results, answer)
 
     return {
         "answer": answer,
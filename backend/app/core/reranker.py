@@ -0,0 +1,305 @@
+#reranker.py
+import os
+import re
+import time
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from flashrank import Ranker, RerankRequest
+from app.core.lazy import lazy_component
+from app.core.candidates import CandidateSet, top_indices
+
+# ---------------------------------------------------------
+# CONFIGURATION (env overridable)
+# ---------------------------------------------------------
+RERANK_MODEL = os.getenv("RERANK_MODEL", "ms-marco-MiniLM-L-12-v2")
+# Optional cheap first pass (e.g. "ms-marco-TinyBERT-L-2-v2"). Empty = disabled.
+RERANK_FIRST_STAGE_MODEL = os.getenv("RERANK_FIRST_STAGE_MODEL", "")
+RERANK_FIRST_STAGE_KEEP = int(os.getenv("RERANK_FIRST_STAGE_KEEP", "12"))
+# How many vector candidates reach the cross-encoder at all
+RERANK_DEPTH = int(os.getenv("RERANK_DEPTH", "20"))
+# Skip the cross-encoder when the vector top-k is this far ahead of the rest
+RERANK_EARLY_EXIT_MARGIN = float(os.getenv("RERANK_EARLY_EXIT_MARGIN", "0.15"))
+# Passages are cut to roughly this many tokens around the best-matching line
+RERANK_WINDOW_TOKENS = int(os.getenv("RERANK_WINDOW_TOKENS", "160"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# Cross-request batching: wait this long for other requests, cap pairs per ONNX call
+RERANK_BATCH_WINDOW_MS = float(os.getenv("RERANK_BATCH_WINDOW_MS", "4"))
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "64"))
+# Share of the vector similarity in the final score (0 = cross-encoder only)
+RERANK_VECTOR_WEIGHT = float(os.getenv("RERANK_VECTOR_WEIGHT", "0"))
+# Most results taken from one file (0 = no cap)
+RERANK_MAX_PER_FILE = int(os.getenv("RERANK_MAX_PER_FILE", "0"))
+# Vector similarities are reported as 0-1 relevance, like cross-encoder
+# scores: at or below the floor is 0, at or above the ceiling 1 (MiniLM cosines)
+VECTOR_RELEVANCE_FLOOR = float(os.getenv("VECTOR_RELEVANCE_FLOOR", "0.15"))
+VECTOR_RELEVANCE_CEIL = float(os.getenv("VECTOR_RELEVANCE_CEIL", "0.75"))
+
+RERANK_CACHE_DIR = "/opt"
+# See embedder.py: 1 thread keeps the ONNX session fork-safe for the pre-fork server
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+# ---------------------------------------------------------
+# HELPER: Passage Truncation
+# ---------------------------------------------------------
+def _query_terms(question: str) -> set:
+    return {t.lower() for t in _TOKEN_PATTERN.findall(question) if len(t) > 2}
+
+def focus_window(text: str, terms: set, max_tokens: int) -> str:
+    """
+    Returns the slice of `text` (whole lines) around the line that shares the
+    most terms with the query, grown outwards until ~max_tokens are covered.
+    """
+    lines = text.split("\n")
+    token_counts = [len(_TOKEN_PATTERN.findall(line)) for line in lines]
+    if sum(token_counts) <= max_tokens:
+        return text
+
+    best_line = 0
+    best_hits = -1
+    for i, line in enumerate(lines):
+        hits = sum(1 for t in _TOKEN_PATTERN.findall(line) if t.lower() in terms)
+        if hits > best_hits:
+            best_line, best_hits = i, hits
+
+    # Always keep the first line (signature) so the model knows what it's reading
+    budget = max_tokens - token_counts[0]
+    start = end = best_line
+    budget -= token_counts[best_line] if best_line != 0 else 0
+    while budget > 0 and (start > 1 or end < len(lines) - 1):
+        if end < len(lines) - 1:
+            end += 1
+            budget -= token_counts[end]
+        if budget > 0 and start > 1:
+            start -= 1
+            budget -= token_counts[start]
+
+    window = lines[start:end + 1]
+    if start > 1:
+        window = [lines[0], "    ..."] + window
+    elif start == 1:
+        window = [lines[0]] + window
+    return "\n".join(window)
+
+
+# ---------------------------------------------------------
+# CROSS-REQUEST BATCHING
+# ---------------------------------------------------------
+def _score_pairs(ranker: Ranker, pairs: List[List[str]]) -> np.ndarray:
+    """
+    Runs the ONNX cross-encoder over (query, passage) pairs that may come
+    from different queries. Mirrors FlashRank's pairwise path.
+    """
+    encoded = ranker.tokenizer.encode_batch(pairs)
+    input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+    token_type_ids = np.array([e.type_ids for e in encoded], dtype=np.int64)
+    attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+    onnx_input = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if not np.all(token_type_ids == 0):
+        onnx_input["token_type_ids"] = token_type_ids
+
+    logits = ranker.session.run(None, onnx_input)[0]
+    if logits.shape[1] == 1:
+        return 1 / (1 + np.exp(-logits.flatten()))
+    exp_logits = np.exp(logits)
+    return exp_logits[:, 1] / np.sum(exp_logits, axis=1)
+
+
+def _load_ranker(model_name: str) -> Ranker:
+    ranker = Ranker(model_name=model_name, cache_dir=RERANK_CACHE_DIR, max_length=RERANK_MAX_LENGTH)
+    if ONNX_THREADS and getattr(ranker, "session", None) is not None:
+        # FlashRank doesn't expose session options, so rebuild the session
+        import onnxruntime as ort
+        from flashrank.Config import model_file_map
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ONNX_THREADS
+        options.inter_op_num_threads = 1
+        ranker.session = ort.InferenceSession(str(ranker.model_dir / model_file_map[model_name]), sess_options=options)
+    return ranker
+
+
+class _ScoreJob:
+    __slots__ = ("pairs", "scores", "error", "done")
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.scores = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class CrossEncoderBatcher:
+    """
+    Collects scoring jobs from concurrent requests for a few milliseconds and
+    runs them through shared cross-encoder invocations.
+    """
+
+    def __init__(self, ranker: Ranker, window_ms: float = RERANK_BATCH_WINDOW_MS, max_batch: int = RERANK_MAX_BATCH):
+        self.ranker = ranker
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._start_worker()
+        # Threads don't survive fork(): give pre-forked workers their own batcher thread
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._start_worker)
+
+    def _start_worker(self):
+        self._queue: "queue.Queue[_ScoreJob]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._worker.start()
+
+    def score(self, pairs: List[List[str]]) -> np.ndarray:
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        job = _ScoreJob(pairs)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.scores
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            pending = len(jobs[0].pairs)
+            # Gather whatever else arrives within the window
+            deadline = time.monotonic() + self.window
+            while pending < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                pending += len(job.pairs)
+            self._execute(jobs)
+
+    def _execute(self, jobs: List[_ScoreJob]):
+        flat = [pair for job in jobs for pair in job.pairs]
+        try:
+            scores = np.concatenate([
+                _score_pairs(self.ranker, flat[i:i + self.max_batch])
+                for i in range(0, len(flat), self.max_batch)
+            ])
+            offset = 0
+            for job in jobs:
+                job.scores = scores[offset:offset + len(job.pairs)]
+                offset += len(job.pairs)
+        except Exception as e:
+            for job in jobs:
+                job.error = e
+        finally:
+            for job in jobs:
+                job.done.set()
+
+
+# ---------------------------------------------------------
+# RERANKING STAGE
+# ---------------------------------------------------------
+class Reranker:
+    """
+    Adaptive reranking:
+    1. Early exit when vector scores already separate the top-k clearly.
+    2. Only the best `depth` vector candidates reach the cross-encoder.
+    3. Optional light first-stage model prunes before the heavy one.
+    4. Passages are cut to a token window around the best matching line.
+    5. Candidates travel as arrays (candidates.py); only the top-k become dicts.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        first_stage_model: str = RERANK_FIRST_STAGE_MODEL,
+        depth: int = RERANK_DEPTH,
+        early_exit_margin: float = RERANK_EARLY_EXIT_MARGIN,
+        window_tokens: int = RERANK_WINDOW_TOKENS,
+        first_stage_keep: int = RERANK_FIRST_STAGE_KEEP,
+    ):
+        self.depth = depth
+        self.early_exit_margin = early_exit_margin
+        self.window_tokens = window_tokens
+        self.first_stage_keep = first_stage_keep
+
+        self.ranker = _load_ranker(model_name)
+        self.batcher = CrossEncoderBatcher(self.ranker)
+
+        self.first_stage = None
+        if first_stage_model and first_stage_model != model_name:
+            self.first_stage = CrossEncoderBatcher(_load_ranker(first_stage_model))
+
+    def _cross_score(self, batcher: CrossEncoderBatcher, question: str, passages: List[dict], terms: set) -> np.ndarray:
+        if getattr(batcher.ranker, "session", None) is None:
+            # Listwise (LLM) rankers have no ONNX session; fall back to FlashRank itself
+            ranked = batcher.ranker.rerank(RerankRequest(query=question, passages=[dict(p) for p in passages]))
+            by_id = {r["id"]: r["score"] for r in ranked}
+            return np.array([by_id[p["id"]] for p in passages], dtype=np.float32)
+        pairs = [[question, focus_window(p["text"], terms, self.window_tokens)] for p in passages]
+        return batcher.score(pairs)
+
+    def rank(
+        self,
+        question: str,
+        candidates: CandidateSet,
+        top_k: int = 5,
+        depth: Optional[int] = None,
+    ) -> Tuple[CandidateSet, np.ndarray, np.ndarray]:
+        """
+        Scores `candidates` and returns (the candidates that were scored,
+        positions of the best `top_k` among them, final 0-1 scores). Nothing
+        is materialized: see CandidateSet.materialize.
+        """
+        depth = depth or self.depth
+
+        if not np.isnan(candidates.vector).all():
+            # Candidates missing from the vector search (e.g. symbol hits) go first
+            sims = candidates.vector_ranking()
+            order = np.argsort(-sims, kind="stable")
+
+            # --- Early exit: the top-k is clearly ahead of everything else ---
+            if len(order) > top_k and np.isfinite(sims[order[top_k - 1]]):
+                if sims[order[top_k - 1]] - sims[order[top_k]] >= self.early_exit_margin:
+                    # Reported as relevance, on the same 0-1 scale as reranked results
+                    relevance = candidates.relevance(VECTOR_RELEVANCE_FLOOR, VECTOR_RELEVANCE_CEIL)
+                    return candidates, order[:top_k], relevance
+            candidates = candidates.subset(order[:depth])
+        else:
+            candidates = candidates.subset(np.arange(min(depth, len(candidates))))
+
+        terms = _query_terms(question)
+
+        # --- Optional light first stage ---
+        if self.first_stage is not None and len(candidates) > self.first_stage_keep:
+            coarse = self._cross_score(self.first_stage, question, candidates.passages, terms)
+            candidates = candidates.subset(top_indices(coarse, self.first_stage_keep))
+
+        candidates.rerank[:] = self._cross_score(self.batcher, question, candidates.passages, terms)
+        scores = candidates.fused(VECTOR_RELEVANCE_FLOOR, VECTOR_RELEVANCE_CEIL, RERANK_VECTOR_WEIGHT)
+        return candidates, candidates.top(scores, top_k, RERANK_MAX_PER_FILE), scores
+
+    def rerank(
+        self,
+        question: str,
+        passages: List[dict],
+        vector_scores: Optional[Dict[int, float]] = None,
+        top_k: int = 5,
+        depth: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        Returns the best `top_k` passages, sorted by relevance with a "score"
+        (0-1) and "scored_by" key. `vector_scores` maps passage id ->
+        similarity from the vector search.
+        """
+        if not passages:
+            return []
+        candidates, top, scores = self.rank(question, CandidateSet(passages, vector_scores), top_k, depth)
+        return candidates.materialize(top, scores)
+
+
+reranker = lazy_component("reranker", Reranker)
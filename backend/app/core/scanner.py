@@ -54,4 +54,30 @@ def scan_directory(root_path: str) -> Generator[Path, None, None]:
                 continue
 
             # 4. Success - Yield the path
-            yield file_path
\ No newline at end of file
+            yield file_path
+
+def is_scannable(root_path: str, file_path: str, spec: pathspec.PathSpec = None) -> bool:
+    """
+    True if scan_directory(root_path) would yield `file_path` (same rules,
+    checked for one file). Used by incremental sync for changed paths.
+    """
+    root = Path(root_path).resolve()
+    file_path = Path(file_path).resolve()
+    try:
+        relative_path = file_path.relative_to(root)
+    except ValueError:
+        return False
+    if not file_path.is_file():
+        return False
+
+    spec = spec or load_gitignore_patterns(root)
+    directory = root
+    for part in relative_path.parts[:-1]:
+        directory = directory / part
+        if part in ALWAYS_IGNORE or spec.match_file(str(directory)):
+            return False
+
+    filename = file_path.name
+    if filename.startswith(".") or filename.endswith((".pyc", ".lock", ".png", ".jpg")):
+        return False
+    return not spec.match_file(str(relative_path))
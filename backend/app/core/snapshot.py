@@ -0,0 +1,436 @@
+#snapshot.py
+"""
+Portable snapshots of a fully built index: CI ingests once, serving nodes
+import the result instead of re-embedding the repository.
+
+A snapshot is a directory:
+- manifest.json: format version, embedding model + dimension, the repo
+  (source, root, commit), row counts and the size + sha256 of every file
+- index.db: the index tables of the SQLite database (chunk rows, symbols,
+  duplicate locations, ingested files, repo state, ID counters); chat
+  history is left out
+- vectors/vectors.f32 + ids.i64: the local index layout (L2-normalized
+  float32 rows), memory-mappable as they are; deleted rows are compacted out
+- chunk_store/records.bin + records.idx: the live chunk records only
+- summaries/ and file_tree_snapshot.json, when the source had them
+
+Export and import take the ingestion lock, so neither runs next to an
+ingestion or a sync. Import verifies the snapshot first and refuses one built
+with another embedding model (its vectors wouldn't match our queries) unless
+forced. The local vector index gets copies of the files (swapped in like a
+reset, quantized copy rebuilt); a Pinecone index is wiped and re-upserted.
+Vectors go first: if that fails, the database and chunk records still hold
+the previous index and the snapshot is not marked as loaded.
+
+Several nodes sharing one Pinecone index with SNAPSHOT_AUTOLOAD: the first
+one to start uploads the vectors; the others find them in the index
+(VectorStore.holds_vectors) and import only their local files. An explicit
+import always re-uploads.
+
+    python -m app.cli snapshot export|verify|import PATH
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.core.embedder import EMBEDDING_MODEL, EMBEDDING_DIMENSION
+from app.core.vector_store import vector_db, read_vector_files, VECTOR_BACKEND
+from app.core.chunk_store import chunk_store
+from app.core.summaries import summary_index
+from app.core.file_tree import SNAPSHOT_FILE
+from app.core.file_content import register_workspace_root
+from app.core import metrics
+from app.core.coordination import DATA_DIR, IngestionBusyError, ingestion_lock, bump_index_generation
+from app.db.session import engine, init_db
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshots"))
+# Imported on startup unless it is already the loaded snapshot
+SNAPSHOT_AUTOLOAD = os.getenv("SNAPSHOT_AUTOLOAD", "")
+
+SNAPSHOT_FORMAT = "codemind-index-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# Which snapshot the local index came from (SNAPSHOT_AUTOLOAD skips a re-import)
+LOADED_FILE = os.path.join(DATA_DIR, "snapshot.loaded.json")
+
+# Replaced wholesale on import; id_counters is merged instead (IDs are never reused)
+INDEX_TABLES = ("chunk", "symbols", "chunk_locations", "ingested_files", "repo_state")
+COUNTER_TABLE = "id_counters"
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, malformed, or doesn't fit this deployment."""
+
+
+def snapshot_path(name: str) -> str:
+    """A named snapshot under SNAPSHOT_DIR (the API never takes raw paths)."""
+    if not name or name.startswith(".") or not all(c.isalnum() or c in "-_." for c in name):
+        raise SnapshotError(f"Invalid snapshot name: {name!r}")
+    return os.path.join(SNAPSHOT_DIR, name)
+
+def _db_path() -> str:
+    return os.path.abspath(engine.url.database)
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _copy_into_place(src: str, dst: str):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = dst + ".tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+def _read_manifest(path: str) -> dict:
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f"No snapshot at {path} (manifest.json missing)")
+    except ValueError as e:
+        raise SnapshotError(f"Unreadable manifest in {path}: {e}")
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format in {path}")
+    return manifest
+
+
+# ---------------------------------------------------------
+# 1. EXPORT
+# ---------------------------------------------------------
+def _export_database(out_path: str) -> List[int]:
+    """Online backup of the database, minus every non-index table. Returns the chunk IDs."""
+    source = sqlite3.connect(_db_path())
+    target = sqlite3.connect(out_path)
+    try:
+        source.backup(target)
+        tables = [row[0] for row in target.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table in tables:
+            if table not in INDEX_TABLES + (COUNTER_TABLE,) and not table.startswith("sqlite_"):
+                target.execute(f'DROP TABLE "{table}"')
+        target.commit()
+        target.execute("VACUUM")
+        return [row[0] for row in target.execute("SELECT id FROM chunk ORDER BY id")]
+    finally:
+        source.close()
+        target.close()
+
+def _snapshot_counts(db_path: str) -> Dict[str, int]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            for table in INDEX_TABLES
+        }
+    finally:
+        conn.close()
+
+def _repo_state(db_path: str) -> Optional[dict]:
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT source, root, \"commit\", synced_at FROM repo_state WHERE key = 'current'").fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"source": row[0], "root": row[1], "commit": row[2], "synced_at": row[3]}
+
+def export_snapshot(path: str, overwrite: bool = False) -> dict:
+    """
+    Writes the current index to `path` and returns its manifest. The files
+    are built next to it and moved into place at the end, so a failed export
+    never leaves a half-written snapshot behind.
+    """
+    path = os.path.abspath(path)
+    if os.path.exists(path):
+        if not overwrite:
+            raise SnapshotError(f"{path} already exists")
+        if not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+            raise SnapshotError(f"{path} exists and is not a snapshot; refusing to replace it")
+
+    started = time.perf_counter()
+    outcome = "error"
+    timings = {}
+    work_dir = f"{path}.{os.getpid()}.tmp"
+    try:
+        with ingestion_lock():
+            os.makedirs(os.path.join(work_dir, "vectors"))
+            os.makedirs(os.path.join(work_dir, "chunk_store"))
+            db_path = os.path.join(work_dir, "index.db")
+            with metrics.span("snapshot", "database", timings):
+                chunk_ids = _export_database(db_path)
+            with metrics.span("snapshot", "vectors", timings):
+                vectors = vector_db.export_vectors(os.path.join(work_dir, "vectors"), chunk_ids)
+            with metrics.span("snapshot", "content", timings):
+                records = chunk_store.content.export_to(os.path.join(work_dir, "chunk_store"), chunk_ids)
+            if os.path.isfile(os.path.join(summary_index.index_dir, "entries.json")):
+                # Vectors first, like SummaryIndex._write
+                for name in ("vectors.f32", "entries.json"):
+                    _copy_into_place(os.path.join(summary_index.index_dir, name),
+                                     os.path.join(work_dir, "summaries", name))
+            if os.path.isfile(SNAPSHOT_FILE):
+                shutil.copyfile(SNAPSHOT_FILE, os.path.join(work_dir, "file_tree_snapshot.json"))
+
+            with metrics.span("snapshot", "checksums", timings):
+                files = {}
+                for dir_path, _, names in os.walk(work_dir):
+                    for name in sorted(names):
+                        file_path = os.path.join(dir_path, name)
+                        files[os.path.relpath(file_path, work_dir).replace(os.sep, "/")] = {
+                            "bytes": os.path.getsize(file_path),
+                            "sha256": _sha256(file_path),
+                        }
+
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "created_at": datetime.utcnow().isoformat(),
+                "vector_backend": VECTOR_BACKEND,
+                "embedding": {"model": EMBEDDING_MODEL, "dimension": EMBEDDING_DIMENSION},
+                "repo": _repo_state(db_path),
+                "counts": {**_snapshot_counts(db_path), "vectors": vectors, "records": records,
+                           "summaries": len(summary_index)},
+                "files": files,
+            }
+            with open(os.path.join(work_dir, MANIFEST_FILE), "w") as f:
+                json.dump(manifest, f, indent=2)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(work_dir, path)
+        outcome = "ok"
+    finally:
+        if os.path.isdir(work_dir):
+            shutil.rmtree(work_dir)
+        metrics.request_seconds.observe(time.perf_counter() - started, pipeline="snapshot_export", outcome=outcome)
+
+    missing = manifest["counts"]["chunk"] - vectors
+    print(f"📦 Snapshot written to {path}: {vectors} vectors, {records} chunk records"
+          + (f" ({missing} chunks had no vector)" if missing else ""))
+    return {**manifest, "path": path, "timings_ms": {k: round(v * 1000, 1) for k, v in timings.items()}}
+
+
+# ---------------------------------------------------------
+# 2. VERIFY
+# ---------------------------------------------------------
+def verify_snapshot(path: str, checksums: bool = True, check_model: bool = True) -> dict:
+    """
+    {"ok", "errors", "warnings", "manifest"}. Checks every file against the
+    manifest, that the vectors belong to the snapshot's chunk rows, and (with
+    `check_model`) that it was embedded with the model this build queries with.
+    """
+    path = os.path.abspath(path)
+    manifest = _read_manifest(path)
+    errors, warnings = [], []
+
+    for name, expected in manifest.get("files", {}).items():
+        file_path = os.path.join(path, name)
+        if not os.path.isfile(file_path):
+            errors.append(f"{name}: missing")
+        elif os.path.getsize(file_path) != expected["bytes"]:
+            errors.append(f"{name}: {os.path.getsize(file_path)} bytes, manifest says {expected['bytes']}")
+        elif checksums and _sha256(file_path) != expected["sha256"]:
+            errors.append(f"{name}: checksum mismatch")
+    for name in ("index.db", "vectors/vectors.f32", "vectors/ids.i64",
+                 "chunk_store/records.bin", "chunk_store/records.idx"):
+        if name not in manifest.get("files", {}):
+            errors.append(f"{name}: not in the manifest")
+
+    embedding = manifest.get("embedding", {})
+    if check_model and (embedding.get("model") != EMBEDDING_MODEL
+                        or embedding.get("dimension") != EMBEDDING_DIMENSION):
+        errors.append(f"embedded with {embedding.get('model')} ({embedding.get('dimension')}d), "
+                      f"this deployment uses {EMBEDDING_MODEL} ({EMBEDDING_DIMENSION}d)")
+
+    if not errors:
+        try:
+            _, vector_ids = read_vector_files(os.path.join(path, "vectors"), embedding.get("dimension", EMBEDDING_DIMENSION))
+            conn = sqlite3.connect(f"file:{os.path.join(path, 'index.db')}?mode=ro", uri=True)
+            try:
+                chunk_ids = {row[0] for row in conn.execute("SELECT id FROM chunk")}
+            finally:
+                conn.close()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            errors.append(str(e))
+        else:
+            vector_ids = set(vector_ids.tolist())
+            if len(vector_ids) != manifest["counts"].get("vectors"):
+                errors.append(f"{len(vector_ids)} vectors, manifest says {manifest['counts'].get('vectors')}")
+            orphans = len(vector_ids - chunk_ids)
+            if orphans:
+                errors.append(f"{orphans} vectors have no chunk row")
+            unembedded = len(chunk_ids - vector_ids)
+            if unembedded:
+                warnings.append(f"{unembedded} chunks have no vector (not searchable)")
+
+    return {"ok": not errors, "path": path, "errors": errors, "warnings": warnings, "manifest": manifest}
+
+
+# ---------------------------------------------------------
+# 3. IMPORT
+# ---------------------------------------------------------
+def _import_database(snapshot_db: str):
+    """Replaces the index tables in one transaction; chat tables are untouched."""
+    init_db()
+    conn = sqlite3.connect(_db_path(), isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS snapshot", (snapshot_db,))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in INDEX_TABLES:
+                conn.execute(f'DELETE FROM main."{table}"')
+                columns = [row[1] for row in conn.execute(f'PRAGMA snapshot.table_info("{table}")')]
+                ours = {row[1] for row in conn.execute(f'PRAGMA main.table_info("{table}")')}
+                shared = ", ".join(f'"{c}"' for c in columns if c in ours)
+                if shared:
+                    conn.execute(f'INSERT INTO main."{table}" ({shared}) SELECT {shared} FROM snapshot."{table}"')
+            # Never move a counter backwards: IDs handed out here stay unique
+            conn.execute(
+                f"INSERT INTO main.{COUNTER_TABLE} (name, next_id) SELECT name, next_id FROM snapshot.{COUNTER_TABLE} "
+                f"WHERE true ON CONFLICT(name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH DATABASE snapshot")
+    finally:
+        conn.close()
+
+def _vector_metadatas(db_path: str, ids: List[int]) -> List[dict]:
+    """The small filterable metadata ingestion attaches in Pinecone, rebuilt from chunk rows."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = {}
+        for start in range(0, len(ids), 500):
+            block = ids[start:start + 500]
+            rows.update((row[0], row) for row in conn.execute(
+                f"SELECT id, chunk_type, file_name, file_path, start_line FROM chunk "
+                f"WHERE id IN ({','.join('?' * len(block))})", block))
+    finally:
+        conn.close()
+    metadatas = []
+    for chunk_id in ids:
+        _, chunk_type, file_name, file_path, start_line = rows.get(chunk_id, (chunk_id, "code", "", "", None))
+        if chunk_type == "commit":
+            metadatas.append({"file_name": "GIT_LOG", "chunk_type": "commit"})
+        else:
+            metadatas.append({"file_name": file_name, "file_path": file_path, "chunk_type": "code",
+                              "start_line": str(start_line) if start_line else ""})
+    return metadatas
+
+def import_snapshot(path: str, force: bool = False, reuse_vectors: bool = False) -> dict:
+    """
+    Replaces the current index with the snapshot at `path`. `force` accepts
+    a snapshot embedded with a different model (checksums are still enforced).
+    `reuse_vectors` keeps a Pinecone index that already holds the snapshot.
+    """
+    path = os.path.abspath(path)
+    report = verify_snapshot(path, check_model=not force)
+    if not report["ok"]:
+        raise SnapshotError(f"Snapshot {path} failed verification: " + "; ".join(report["errors"]))
+    manifest = report["manifest"]
+
+    started = time.perf_counter()
+    outcome = "error"
+    timings = {}
+    try:
+        with ingestion_lock():
+            snapshot_db = os.path.join(path, "index.db")
+            vectors_dir = os.path.join(path, "vectors")
+            try:
+                with metrics.span("snapshot", "vectors", timings):
+                    if reuse_vectors and VECTOR_BACKEND != "local" and vector_db.holds_vectors(vectors_dir):
+                        print("📦 Pinecone index already holds this snapshot's vectors")
+                        vectors = manifest["counts"].get("vectors", 0)
+                    else:
+                        vectors = vector_db.import_vectors(
+                            vectors_dir, metadatas=lambda ids: _vector_metadatas(snapshot_db, ids))
+            except Exception:
+                print("❌ Vector import failed; the database still holds the previous index. Import again.")
+                raise
+            with metrics.span("snapshot", "database", timings):
+                _import_database(snapshot_db)
+            with metrics.span("snapshot", "content", timings):
+                chunk_store.content.load_from(os.path.join(path, "chunk_store"))
+
+            if "summaries/entries.json" in manifest["files"]:
+                for name in ("vectors.f32", "entries.json"):
+                    _copy_into_place(os.path.join(path, "summaries", name),
+                                     os.path.join(summary_index.index_dir, name))
+            else:
+                summary_index.reset()
+            if "file_tree_snapshot.json" in manifest["files"]:
+                _copy_into_place(os.path.join(path, "file_tree_snapshot.json"), SNAPSHOT_FILE)
+
+            repo = manifest.get("repo") or {}
+            if repo.get("root") and os.path.isdir(repo["root"]):
+                # Serve file contents when the checkout exists on this node too
+                register_workspace_root(repo["root"])
+
+            os.makedirs(DATA_DIR, exist_ok=True)
+            tmp_path = LOADED_FILE + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"path": path, "manifest_sha256": _sha256(os.path.join(path, MANIFEST_FILE)),
+                           "imported_at": datetime.utcnow().isoformat()}, f)
+            os.replace(tmp_path, LOADED_FILE)
+            bump_index_generation()
+        outcome = "ok"
+    finally:
+        metrics.request_seconds.observe(time.perf_counter() - started, pipeline="snapshot_import", outcome=outcome)
+
+    print(f"📦 Snapshot imported from {path}: {vectors} vectors")
+    return {
+        "path": path,
+        "repo": manifest.get("repo"),
+        "counts": manifest["counts"],
+        "vectors": vectors,
+        "warnings": report["warnings"],
+        "timings_ms": {k: round(v * 1000, 1) for k, v in timings.items()},
+    }
+
+def loaded_snapshot() -> Optional[dict]:
+    try:
+        with open(LOADED_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def list_snapshots() -> List[dict]:
+    snapshots = []
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return snapshots
+    for name in sorted(os.listdir(SNAPSHOT_DIR)):
+        try:
+            manifest = _read_manifest(os.path.join(SNAPSHOT_DIR, name))
+        except SnapshotError:
+            continue
+        snapshots.append({"name": name, "created_at": manifest["created_at"],
+                          "repo": manifest.get("repo"), "counts": manifest["counts"]})
+    return snapshots
+
+def autoload_snapshot():
+    """
+    Startup hook for SNAPSHOT_AUTOLOAD: imports it unless it is what's loaded
+    already. Of several workers starting together one imports, the others find
+    the lock busy and pick the new index up through the generation bump.
+    """
+    if not SNAPSHOT_AUTOLOAD:
+        return
+    path = os.path.abspath(SNAPSHOT_AUTOLOAD)
+    loaded = loaded_snapshot()
+    try:
+        if loaded and loaded.get("manifest_sha256") == _sha256(os.path.join(path, MANIFEST_FILE)):
+            print(f"📦 Snapshot {path} already loaded")
+            return
+        import_snapshot(path, reuse_vectors=True)
+    except IngestionBusyError:
+        print("📦 Snapshot autoload skipped: another worker holds the ingestion lock")
+    except (OSError, SnapshotError) as e:
+        print(f"❌ Snapshot autoload failed: {e}")
@@ -0,0 +1,348 @@
+#summaries.py
+"""
+Hierarchical summaries for repository-level questions ("how does auth work?").
+
+At the end of every ingestion/sync each file and each directory gets a short
+summary, embedded into a small index of its own (DATA_DIR/summaries/):
+- file: module docstring / header comment, imports and the signatures of its
+  definitions with the first line of their docstrings (extractive), computed
+  while the file is parsed and kept in IngestedFile.summary;
+- directory: its files and subdirectories with one line each, built from the
+  file summaries.
+With SUMMARY_MODE=llm the extractive text is rewritten by the LLM client; a
+summary is only re-summarized (and re-embedded) when its source text changes.
+
+rag.py routes broad questions to the best matching summaries first and then
+searches only those modules' chunks (see chunk_store.search_within).
+
+Files: entries.json (kind, path, digest, text per row) and vectors.f32 (one
+normalized row per entry). Both are replaced atomically, vectors first, and
+readers reload when entries.json changes.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlmodel import Session, select
+from app.core.coordination import DATA_DIR
+from app.core.embedding_executor import embedding_executor, PRIORITY_INGEST
+from app.core.symbols import DEFINITION_KINDS
+from app.core import metrics
+from app.db.session import engine
+from app.db.models import IngestedFile
+
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "extractive").lower()  # extractive | llm | off
+SUMMARY_DIR = os.getenv("SUMMARY_DIR", os.path.join(DATA_DIR, "summaries"))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1500"))
+SUMMARY_MAX_DEFINITIONS = int(os.getenv("SUMMARY_MAX_DEFINITIONS", "25"))
+SUMMARY_DIR_MAX_ENTRIES = int(os.getenv("SUMMARY_DIR_MAX_ENTRIES", "40"))
+SUMMARY_EMBED_BATCH = 64
+
+EMBEDDING_DIM = 384
+
+_DOCSTRING_PATTERN = re.compile(r'^\s*(?:[rRbBuU]{0,2})("""|\'\'\')(.*?)\1', re.S)
+_FILENAME_PATTERN = re.compile(r'^\s*[\w.-]+\.\w+\s*$')
+_BLOCK_COMMENT_PATTERN = re.compile(r'^\s*/\*\*?(.*?)\*/', re.S)
+_IMPORT_PATTERN = re.compile(
+    r'^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+)|import\s.*?from\s+[\'"]([^\'"]+)[\'"]'
+    r'|(?:const|let|var)\s+\w+\s*=\s*require\([\'"]([^\'"]+)[\'"]\))',
+    re.M,
+)
+
+
+# ---------------------------------------------------------
+# 1. EXTRACTIVE SUMMARIES
+# ---------------------------------------------------------
+def _first_paragraph(text: str, limit: int = 300) -> str:
+    paragraph = text.strip().split("\n\n")[0]
+    return " ".join(paragraph.split())[:limit]
+
+def _leading_doc(content: str) -> str:
+    """
+    Module docstring or leading /** */ block (after any header comment lines),
+    else the leading # / // comment lines themselves.
+    """
+    lines = content.lstrip("\ufeff").splitlines()
+    comments = []
+    index = 0
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(("#!", "# -*-")):
+            continue
+        if stripped.startswith(("#", "//")):
+            comments.append(stripped.lstrip("#/ "))
+        elif stripped:
+            break
+    rest = "\n".join(lines[index:index + 200])
+    match = _DOCSTRING_PATTERN.match(rest)
+    if match:
+        return _first_paragraph(match.group(2))
+    match = _BLOCK_COMMENT_PATTERN.match(rest)
+    if match:
+        return _first_paragraph(match.group(1).replace("*", " "))
+    # A lone "#file.py" header says nothing the path doesn't
+    comments = [c for c in comments if not _FILENAME_PATTERN.match(c)]
+    return _first_paragraph("\n".join(comments))
+
+def _doc_after(lines: List[str], index: int) -> str:
+    """First line of the docstring / comment right below a definition line."""
+    for line in lines[index + 1:index + 4]:
+        stripped = line.strip().lstrip("rRbBuU")
+        for quote in ('"""', "'''"):
+            if stripped.startswith(quote):
+                return stripped[3:].split(quote)[0].strip()[:120]
+        if stripped.startswith(("//", "#", "*", "/*")):
+            return stripped.lstrip("/#* ")[:120]
+        if stripped:
+            return ""
+    return ""
+
+def file_summary(content: str, display_path: str, symbols: List[dict]) -> str:
+    """
+    Extractive summary of one file, from what parsing already produced
+    (no LLM): its doc, imports and definitions.
+    """
+    parts = [f"File {display_path}"]
+    doc = _leading_doc(content)
+    if doc:
+        parts.append(doc)
+
+    imports = []
+    for match in _IMPORT_PATTERN.finditer(content[:20000]):
+        name = next(group for group in match.groups() if group)
+        if name not in imports:
+            imports.append(name)
+    if imports:
+        parts.append("Imports: " + ", ".join(imports[:15]))
+
+    lines = content.splitlines()
+    definitions = [s for s in symbols if s["kind"] in DEFINITION_KINDS]
+    # Classes and top-level functions first, then methods
+    definitions.sort(key=lambda s: (s["kind"] == "method", s["start_line"]))
+    entries = []
+    for sym in definitions[:SUMMARY_MAX_DEFINITIONS]:
+        index = sym["start_line"] - 1
+        signature = " ".join(lines[index].split())[:160] if 0 <= index < len(lines) else sym["qualified_name"]
+        doc_line = _doc_after(lines, index) if 0 <= index < len(lines) else ""
+        entries.append(f"- {signature}" + (f" — {doc_line}" if doc_line else ""))
+    if entries:
+        parts.append("Defines:\n" + "\n".join(entries))
+    elif not doc:
+        # No structure to show (docs, configs): the opening text stands in
+        parts.append(" ".join(content.split())[:400])
+    return "\n".join(parts)[:SUMMARY_MAX_CHARS]
+
+def _headline(summary: str) -> str:
+    """One line for a directory listing: the file's doc, else its first definitions."""
+    lines = summary.splitlines()[1:]
+    for line in lines:
+        if line and not line.startswith(("Imports:", "Defines:", "- ")):
+            return line[:120]
+    names = [line[2:].split("(")[0].split(" — ")[0].split()[-1].rstrip(":{") for line in lines if line.startswith("- ")]
+    return ", ".join(names[:6])[:120]
+
+def directory_summaries(files: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    Summaries for every directory holding ingested files, from the
+    (display_path, file summary) pairs; keyed by directory path.
+    """
+    if not files:
+        return {}
+    root = os.path.commonpath([os.path.dirname(path) for path, _ in files])
+    children_files = defaultdict(list)
+    children_dirs = defaultdict(set)
+    for path, summary in files:
+        directory = os.path.dirname(path)
+        children_files[directory].append((os.path.basename(path), _headline(summary)))
+        # Register every ancestor up to the common root
+        while directory != root and len(directory) > len(root):
+            parent = os.path.dirname(directory)
+            children_dirs[parent].add(os.path.basename(directory))
+            directory = parent
+
+    summaries = {}
+    for directory in set(children_files) | set(children_dirs):
+        subdirs = sorted(children_dirs.get(directory, ()))
+        listed = sorted(children_files.get(directory, ()))
+        parts = [f"Directory {directory or '/'}: {len(listed)} files"
+                 + (f", subdirectories: {', '.join(subdirs[:20])}" if subdirs else "")]
+        for name, headline in listed[:SUMMARY_DIR_MAX_ENTRIES]:
+            parts.append(f"- {name}" + (f": {headline}" if headline else ""))
+        if len(listed) > SUMMARY_DIR_MAX_ENTRIES:
+            parts.append(f"- ... {len(listed) - SUMMARY_DIR_MAX_ENTRIES} more files")
+        summaries[directory] = "\n".join(parts)[:SUMMARY_MAX_CHARS]
+    return summaries
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+# ---------------------------------------------------------
+# 2. SUMMARY INDEX
+# ---------------------------------------------------------
+class SummaryIndex:
+    def __init__(self, index_dir: str = SUMMARY_DIR):
+        self.index_dir = index_dir
+        self._entries_path = os.path.join(self.index_dir, "entries.json")
+        self._vectors_path = os.path.join(self.index_dir, "vectors.f32")
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._entries: List[dict] = []
+        self._vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self._root = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self._entries_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _ensure_loaded(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            entries, vectors, root = [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32), None
+            if stamp is not None:
+                try:
+                    with open(self._entries_path) as f:
+                        data = json.load(f)
+                    entries, root = data["entries"], data.get("root")
+                    vectors = np.fromfile(self._vectors_path, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+                    if len(vectors) < len(entries):
+                        raise ValueError("vectors file is behind its entries")
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"⚠️ Summary index not readable yet: {e}")
+                    return
+            self._entries, self._vectors, self._root = entries, vectors[:len(entries)], root
+            self._stamp = stamp
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        self._ensure_loaded()
+        kinds = defaultdict(int)
+        for entry in self._entries:
+            kinds[entry["kind"]] += 1
+        return {"mode": SUMMARY_MODE, "root": self._root, **kinds}
+
+    def route(self, query_vector: np.ndarray, k: int = 4, file_filter: Optional[str] = None) -> List[dict]:
+        """
+        The k summaries closest to the query, best first, as
+        {"kind", "path", "text", "score", "root"} ("root" marks the top-level
+        directory, whose scope is the whole repository).
+        """
+        self._ensure_loaded()
+        entries, vectors, root = self._entries, self._vectors, self._root
+        if not entries:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32).flatten()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = vectors @ query
+        if file_filter:
+            needle = file_filter.lower()
+            allowed = np.array([needle in entry["path"].lower() for entry in entries])
+            scores = np.where(allowed, scores, -np.inf)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**entries[i], "score": float(scores[i]), "root": entries[i]["path"] == root}
+            for i in top
+        ]
+
+    def rebuild(self, timings=None, pipeline: str = "ingest") -> dict:
+        """
+        Recomputes directory summaries from the IngestedFile rows and embeds
+        whatever text changed; unchanged summaries keep their vectors (and
+        their LLM rewrite). Called by the ingestion/sync writer.
+        """
+        if SUMMARY_MODE == "off":
+            return {}
+        self._ensure_loaded()
+        with metrics.span(pipeline, "summaries", timings):
+            with Session(engine) as session:
+                files = [(row.display_path, row.summary) for row in session.exec(select(IngestedFile)).all()
+                         if row.summary]
+            files.sort()
+            sources = [("file", path, summary) for path, summary in files]
+            directories = directory_summaries(files)
+            sources += [("dir", path, text) for path, text in sorted(directories.items())]
+            root = min(directories, key=len) if directories else None
+
+            # Reuse by (kind, path, source digest)
+            previous = {
+                (entry["kind"], entry["path"], entry["digest"]): (entry, self._vectors[i])
+                for i, entry in enumerate(self._entries)
+            }
+            entries, vectors, pending = [], [], []
+            for kind, path, source in sources:
+                digest = _digest(source)
+                reused = previous.get((kind, path, digest))
+                if reused is not None:
+                    entries.append(reused[0])
+                    vectors.append(reused[1])
+                    continue
+                entries.append({"kind": kind, "path": path, "digest": digest, "text": source})
+                vectors.append(None)
+                pending.append(len(entries) - 1)
+
+            if SUMMARY_MODE == "llm" and pending:
+                _rewrite_with_llm([entries[i] for i in pending])
+            for start in range(0, len(pending), SUMMARY_EMBED_BATCH):
+                batch = pending[start:start + SUMMARY_EMBED_BATCH]
+                embedded = embedding_executor.embed([entries[i]["text"] for i in batch], PRIORITY_INGEST)
+                for i, vector in zip(batch, embedded):
+                    vectors[i] = vector
+
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            self._write(entries, matrix, root)
+
+        stats = {"files": len(files), "directories": len(directories), "embedded": len(pending)}
+        print(f"🗺️ Summaries: {stats['files']} files, {stats['directories']} directories "
+              f"({stats['embedded']} new or changed)")
+        return stats
+
+    def _write(self, entries: List[dict], matrix: np.ndarray, root: Optional[str]):
+        # Vectors first: a reader that sees the new entries always finds their rows
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_vectors = self._vectors_path + ".tmp"
+        matrix.tofile(tmp_vectors)
+        os.replace(tmp_vectors, self._vectors_path)
+        tmp_entries = self._entries_path + ".tmp"
+        with open(tmp_entries, "w") as f:
+            json.dump({"root": root, "entries": entries}, f)
+        os.replace(tmp_entries, self._entries_path)
+        self._ensure_loaded()
+
+    def reset(self):
+        with self._lock:
+            for path in (self._entries_path, self._vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._entries, self._vectors, self._root = [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32), None
+            self._stamp = None
+
+def _rewrite_with_llm(entries: List[dict]):
+    """SUMMARY_MODE=llm: replaces the extractive text; keeps it if the call fails."""
+    from app.core.llm import llm_client
+    for entry in entries:
+        kind = "directory" if entry["kind"] == "dir" else "file"
+        summary = llm_client.summarize(entry["text"], kind)
+        if summary:
+            entry["text"] = f"{kind.title()} {entry['path']}\n{summary.strip()}"[:SUMMARY_MAX_CHARS]
+
+
+summary_index = SummaryIndex()
@@ -0,0 +1,185 @@
+#symbols.py
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+from sqlmodel import Session, select
+from app.db.session import engine
+from app.db.models import Symbol
+from app.core.coordination import index_generation, is_ingesting_here
+
+DEFINITION_KINDS = {"class", "function", "method"}
+
+# Identifiers that "look like code" inside a natural-language question:
+# `backticked`, dotted.names, snake_case, CamelCase or call() syntax.
+_BACKTICK_PATTERN = re.compile(r'`([^`]+)`')
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*(?:\(\))?')
+
+
+def _looks_like_code(token: str) -> bool:
+    return (
+        "." in token
+        or "_" in token
+        or token.endswith("()")
+        or any(c.isupper() for c in token[1:])
+    )
+
+
+class SymbolIndex:
+    """
+    In-memory symbol table mirrored from the `symbols` SQLite table.
+    Lookups are plain dict hits, so navigation questions never touch
+    the embedder, the vector store or the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, List[dict]] = defaultdict(list)
+        self._by_qualified: Dict[str, List[dict]] = defaultdict(list)
+        self._loaded = False
+        self._generation = None
+
+    # ---------------------------------------------------------
+    # LOADING / MUTATION
+    # ---------------------------------------------------------
+    @staticmethod
+    def _to_entry(row: Symbol) -> dict:
+        return {
+            "name": row.name,
+            "qualified_name": row.qualified_name,
+            "kind": row.kind,
+            "file": row.file_name,
+            "path": row.file_path,
+            "start_line": row.start_line,
+            "end_line": row.end_line,
+            "chunk_id": row.chunk_id,
+        }
+
+    def _index_entry(self, entry: dict):
+        self._by_name[entry["name"]].append(entry)
+        if entry["kind"] in DEFINITION_KINDS:
+            self._by_qualified[entry["qualified_name"]].append(entry)
+
+    def _ensure_loaded(self):
+        # Reload when another worker finished an ingestion (the writer itself
+        # keeps its copy current through add()/reset())
+        generation = index_generation()
+        if self._loaded and (generation == self._generation or is_ingesting_here()):
+            return
+        with self._lock:
+            if self._loaded and generation == self._generation:
+                return
+            self._by_name.clear()
+            self._by_qualified.clear()
+            try:
+                with Session(engine) as session:
+                    rows = session.exec(select(Symbol)).all()
+            except Exception as e:
+                # Table doesn't exist yet (nothing ingested)
+                print(f"⚠️ Symbol table not available yet: {e}")
+                rows = []
+            for row in rows:
+                self._index_entry(self._to_entry(row))
+            self._loaded = True
+            self._generation = generation
+
+    def add(self, rows: List[Symbol]):
+        """
+        Registers freshly committed Symbol rows (called from ingestion).
+        """
+        with self._lock:
+            if not self._loaded:
+                # The lazy load will pick these rows up from SQLite
+                return
+            for row in rows:
+                self._index_entry(self._to_entry(row))
+
+    def remove_files(self, paths):
+        """
+        Drops every entry of the given files (Symbol.file_path values);
+        incremental sync re-adds the new ones through add().
+        """
+        paths = set(paths)
+        with self._lock:
+            if not self._loaded or not paths:
+                return
+            for table in (self._by_name, self._by_qualified):
+                for key in list(table):
+                    kept = [e for e in table[key] if e["path"] not in paths]
+                    if kept:
+                        table[key] = kept
+                    else:
+                        del table[key]
+
+    def reset(self):
+        with self._lock:
+            self._by_name.clear()
+            self._by_qualified.clear()
+            # The DB table was wiped alongside, so memory is authoritative again
+            self._loaded = True
+
+    # ---------------------------------------------------------
+    # QUERIES
+    # ---------------------------------------------------------
+    def _definitions(self, symbol: str) -> List[dict]:
+        if "." in symbol:
+            exact = self._by_qualified.get(symbol)
+            if exact:
+                return list(exact)
+            # Allow partial qualification, matching whole trailing segments
+            # ("Inner.run" matches "Outer.Inner.run" but not "MyInner.run")
+            last = symbol.rsplit(".", 1)[-1]
+            return [
+                e for e in self._by_name.get(last, [])
+                if e["kind"] in DEFINITION_KINDS
+                and ("." + e["qualified_name"]).endswith("." + symbol)
+            ]
+        return [e for e in self._by_name.get(symbol, []) if e["kind"] in DEFINITION_KINDS]
+
+    def lookup(self, symbol: str, kind: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        Returns definitions and call sites for a (optionally dotted) symbol name.
+        """
+        self._ensure_loaded()
+        symbol = symbol.strip().rstrip("()")
+        last = symbol.rsplit(".", 1)[-1]
+
+        definitions = self._definitions(symbol)
+        references = [e for e in self._by_name.get(last, []) if e["kind"] == "call"]
+
+        if kind:
+            definitions = [e for e in definitions if e["kind"] == kind]
+            if kind != "call":
+                references = []
+
+        return {
+            "symbol": symbol,
+            "definitions": definitions[:limit],
+            "references": references[:limit],
+            "total_references": len(references),
+        }
+
+    def definitions_in_text(self, text: str, limit: int = 10) -> List[dict]:
+        """
+        Finds code-like identifiers in a question and returns their definitions.
+        Used by the RAG pipeline as a high-precision candidate source.
+        """
+        self._ensure_loaded()
+        tokens = _BACKTICK_PATTERN.findall(text)
+        tokens += [t for t in _IDENTIFIER_PATTERN.findall(text) if _looks_like_code(t)]
+
+        results = []
+        seen = set()
+        for token in tokens:
+            token = token.strip().rstrip("()")
+            if not token or token in seen:
+                continue
+            seen.add(token)
+            for entry in self._definitions(token):
+                results.append(entry)
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+symbol_index = SymbolIndex()
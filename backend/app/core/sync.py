@@ -0,0 +1,441 @@
+#sync.py
+"""
+Incremental updates: re-indexes only the files that changed since the last
+ingestion or sync, instead of wiping and re-embedding the whole repository.
+
+What changed is worked out from, in order of preference:
+- explicit paths (POST /sync {"paths": [...]}, e.g. from an editor hook)
+- git: `git diff old..HEAD` for new commits (after a fetch + fast-forward for
+  cloned URLs), `git diff HEAD` and untracked files for the working tree
+- stat: files whose size/mtime differ from the IngestedFile records, plus new
+  files from a directory scan (non-git trees, or when the old commit is gone)
+Known files whose size/mtime changed are always rechecked, so edits that were
+reverted in the working tree are picked up too.
+
+A changed file whose text digest is unchanged only gets its record refreshed.
+Otherwise its new chunks are embedded and written first and the old ones
+deleted after, so searches never see the file missing. New chunks that copy an
+indexed one (same digest, dedup.py) become its locations; a deleted chunk
+that other files still copy moves to one of those copies instead. Commits pulled in since
+the last sync are added to the git history chunks.
+
+Triggers: the POST /sync endpoint (git post-commit/post-merge hooks or a
+push webhook can call it) and RepoWatcher, a polling watcher enabled with
+SYNC_WATCH_INTERVAL_S.
+"""
+import os
+import time
+import uuid
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+import git
+from sqlmodel import Session, SQLModel, select, delete
+from app.core.ingestion import (
+    read_file, parse_file, display_path_for, _embed_file, _flush_buffers,
+    process_git_history_generator, save_repo_state,
+)
+from app.core.ingest_buffer import ChunkBuffer
+from app.core.dedup import DedupIndex, DEDUP_ENABLED
+from app.core.chunk_planner import ChunkSizes
+from app.core.summaries import summary_index, file_summary, SUMMARY_MODE
+from app.core.scanner import scan_directory, is_scannable, load_gitignore_patterns
+from app.core.chunk_store import chunk_store
+from app.core.symbols import symbol_index
+from app.core.file_tree import directory_snapshot
+from app.core import metrics
+from app.core.profiling import profile_session
+from app.core.coordination import IdSource, IngestionBusyError, ingestion_lock, bump_index_generation
+from app.db.session import engine
+from app.db.models import Chunk, Symbol, IngestedFile, RepoState, ChunkLocation
+
+# Seconds between polls of the ingested tree (0 = no background watcher)
+SYNC_WATCH_INTERVAL_S = float(os.getenv("SYNC_WATCH_INTERVAL_S", "0"))
+# Most new commits embedded by one sync
+SYNC_MAX_COMMITS = int(os.getenv("SYNC_MAX_COMMITS", "200"))
+
+
+class SyncError(Exception):
+    """Nothing to sync against (no ingestion yet, or its root is gone)."""
+
+
+def _is_remote(source: str) -> bool:
+    return source.startswith("http") or source.startswith("git@")
+
+
+# ---------------------------------------------------------
+# 1. CHANGE DETECTION
+# ---------------------------------------------------------
+def _open_repo(root: str) -> Optional[git.Repo]:
+    try:
+        return git.Repo(root)
+    except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+        return None
+
+def _resolve_paths(root: str, paths: Iterable[str]) -> Set[str]:
+    """Explicit paths (absolute, or relative to the ingested root) inside the root."""
+    root_path = Path(root).resolve()
+    resolved = set()
+    for path in paths:
+        candidate = Path(path)
+        candidate = (candidate if candidate.is_absolute() else root_path / candidate).resolve()
+        try:
+            candidate.relative_to(root_path)
+        except ValueError:
+            continue
+        resolved.add(str(candidate))
+    return resolved
+
+def _name_status_paths(repo: git.Repo, *args) -> Set[str]:
+    # --no-renames: a rename shows up as delete + add, which is what we index.
+    # -z: "status\0path\0" pairs, paths unquoted
+    output = repo.git.diff("--name-status", "--no-renames", "-z", *args)
+    work_dir = Path(repo.working_tree_dir).resolve()
+    fields = [field for field in output.split("\0") if field]
+    return {str(work_dir / path) for path in fields[1::2]}
+
+def git_changes(repo: git.Repo, state: RepoState):
+    """
+    (changed paths, new HEAD). Paths are None when git can't tell (old commit
+    unreachable, e.g. after a force push): the caller falls back to a stat scan.
+    """
+    if _is_remote(state.source):
+        # A cloned URL: bring the clone up to date with its upstream first
+        repo.remotes.origin.fetch()
+        repo.git.reset("--hard", "@{u}")
+
+    try:
+        head = repo.head.commit.hexsha
+    except ValueError:  # no commits yet
+        head = None
+
+    work_dir = Path(repo.working_tree_dir).resolve()
+    changed = set()
+    if state.commit and head and state.commit != head:
+        try:
+            changed |= _name_status_paths(repo, f"{state.commit}..{head}")
+        except git.exc.GitCommandError as e:
+            print(f"⚠️ Can't diff against {state.commit[:12]} ({e}); falling back to a stat scan")
+            return None, head
+    elif head and not state.commit:
+        # The last ingestion happened before the repo had a commit
+        return None, head
+    if head:
+        changed |= _name_status_paths(repo, "HEAD")
+    changed |= {str(work_dir / path) for path in repo.untracked_files}
+    return changed, head
+
+def stat_changes(root: str, known: Dict[str, IngestedFile], scan: bool = True) -> Set[str]:
+    """
+    Known files whose size/mtime changed or that are gone, plus (with `scan`)
+    files under the root that were never ingested.
+    """
+    changed = set()
+    for path, record in known.items():
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            changed.add(path)
+            continue
+        if stat.st_size != record.size or stat.st_mtime_ns != record.mtime_ns:
+            changed.add(path)
+    if scan:
+        for file_path in scan_directory(root):
+            if str(file_path) not in known:
+                changed.add(str(file_path))
+    return changed
+
+def _load_state():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        state = session.get(RepoState, "current")
+        known = {record.path: record for record in session.exec(select(IngestedFile)).all()}
+    return state, known
+
+
+# ---------------------------------------------------------
+# 2. SYNC (GENERATOR)
+# ---------------------------------------------------------
+def sync_generator(paths: Optional[List[str]] = None, profile: bool = False):
+    """
+    Yields status updates like ingest_codebase_generator and shares its lock:
+    a sync never runs next to an ingestion or another sync.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    job_id = uuid.uuid4().hex[:16]
+    try:
+        with ingestion_lock(), profile_session("sync", job_id, enabled=profile) as job_profile:
+            for update in _sync_steps(paths):
+                if update.get("status") == "complete":
+                    outcome = "ok"
+                    update["job_id"] = job_id
+                    if job_profile is not None:
+                        update["profile"] = job_profile.summary()
+                yield update
+    except IngestionBusyError as e:
+        outcome = "busy"
+        yield {"status": "error", "code": "busy", "message": str(e)}
+    finally:
+        metrics.request_seconds.observe(time.perf_counter() - started, pipeline="sync", outcome=outcome)
+
+def _sync_steps(paths: Optional[List[str]]):
+    timings = {}
+    state, known = _load_state()
+    if state is None:
+        yield {"status": "error", "code": "not_ingested", "message": "Nothing ingested yet: run /ingest first"}
+        return
+    root = state.root
+    if not os.path.isdir(root):
+        yield {"status": "error", "code": "not_ingested", "message": f"Ingested root is gone: {root}"}
+        return
+
+    yield {"status": "scanning", "message": f"Looking for changes in {root}..."}
+
+    repo = _open_repo(root)
+    head = state.commit
+    with metrics.span("sync", "changes", timings):
+        if paths:
+            changed = _resolve_paths(root, paths)
+        else:
+            changed = None
+            if repo is not None:
+                try:
+                    changed, head = git_changes(repo, state)
+                except git.exc.GitCommandError as e:
+                    yield {"status": "error", "message": f"Git update failed: {e}"}
+                    return
+            if changed is None:
+                changed = stat_changes(root, known)
+            else:
+                changed |= stat_changes(root, known, scan=False)
+
+    yield {"status": "info", "total_files": len(changed), "message": f"{len(changed)} changed files to check"}
+
+    id_source = IdSource()
+    buffer = ChunkBuffer()
+    spec = load_gitignore_patterns(Path(root).resolve())
+    updated, removed, unchanged = [], [], 0
+    stale_chunks, stale_symbols, stale_locations = [], [], []
+    touched = []
+
+    # Exact copies are matched against the index too, except the chunks of
+    # the files being replaced
+    changed_paths = {display_path_for(path, root) for path in changed}
+    dedup = DedupIndex(
+        existing=lambda digest: chunk_store.find_by_digest(digest, changed_paths)
+    ) if DEDUP_ENABLED else None
+    sizes = ChunkSizes()
+
+    def flush():
+        if buffer.empty:
+            return
+        metrics.ingest_items.inc(len(buffer.symbols), kind="symbols")
+        with metrics.span("sync", "flush", timings):
+            _flush_buffers(*buffer.batch())
+        buffer.clear()
+
+    for i, path in enumerate(sorted(changed)):
+        record = known.get(path)
+        yield {
+            "status": "processing_file",
+            "file": os.path.basename(path),
+            "progress": int(((i + 1) / max(len(changed), 1)) * 100)
+        }
+        try:
+            if not is_scannable(root, path, spec):
+                if record is not None:
+                    _collect_stale(record.display_path, stale_chunks, stale_symbols, stale_locations)
+                    removed.append(record)
+                continue
+
+            content, new_record = read_file(path, root, timings)
+            if record is not None and record.digest == new_record.digest:
+                # Touched (or reverted) but the indexed text is the same
+                new_record.summary = record.summary
+                touched.append(new_record)
+                unchanged += 1
+                continue
+
+            pieces, symbols = parse_file(content, path, timings)
+            if SUMMARY_MODE != "off":
+                new_record.summary = file_summary(content, new_record.display_path, symbols)
+            if record is not None:
+                _collect_stale(record.display_path, stale_chunks, stale_symbols, stale_locations)
+            symbol_index.remove_files([new_record.display_path])
+            _embed_file(buffer, flush, id_source, (path, new_record, pieces, symbols), timings, dedup, sizes)
+            updated.append(new_record.display_path)
+        except Exception as e:
+            print(f"❌ Error syncing {path}: {e}")
+    flush()
+
+    # New rows are in; now drop what they replace
+    with metrics.span("sync", "delete", timings):
+        with Session(engine) as session:
+            if stale_locations:
+                session.exec(delete(ChunkLocation).where(ChunkLocation.id.in_(stale_locations)))
+                session.commit()
+        chunk_store.delete(_promote_copies(stale_chunks))
+        symbol_index.remove_files([record.display_path for record in removed])
+        with Session(engine) as session:
+            if stale_symbols:
+                session.exec(delete(Symbol).where(Symbol.id.in_(stale_symbols)))
+            if removed:
+                session.exec(delete(IngestedFile).where(IngestedFile.path.in_([r.path for r in removed])))
+            for record in touched:
+                session.merge(record)
+            session.commit()
+
+    commits = 0
+    if repo is not None and head and state.commit and head != state.commit and not paths:
+        for update in process_git_history_generator(root, id_source, limit=SYNC_MAX_COMMITS,
+                                                    timings=timings, rev=f"{state.commit}..{head}"):
+            commits += 1
+            yield update
+
+    added = any(path not in known for path in changed if os.path.isfile(path))
+    if removed or added:
+        with metrics.span("sync", "snapshot", timings):
+            directory_snapshot.capture(root)
+    if removed or updated:
+        summary_index.rebuild(timings, pipeline="sync")
+    # Explicit paths leave `head` at the last commit synced, so the next full
+    # sync still diffs from there
+    save_repo_state(state.source, root, head)
+    bump_index_generation()
+
+    print(f"✅ Sync: {len(updated)} updated, {len(removed)} removed, {unchanged} unchanged, {commits} commits")
+    yield {
+        "status": "complete",
+        "message": "Sync Complete!",
+        "progress": 100,
+        "updated": len(updated),
+        "removed": len(removed),
+        "unchanged": unchanged,
+        "commits": commits,
+        "duplicates": dedup.duplicates if dedup else 0,
+        "chunk_sizes": sizes.to_dict(),
+        "commit": head,
+        "timings_ms": {stage: round(sec * 1000, 1) for stage, sec in timings.items()},
+    }
+
+def _collect_stale(display_path: str, chunk_ids: list, symbol_ids: list, location_ids: list):
+    with Session(engine) as session:
+        chunk_ids.extend(session.exec(
+            select(Chunk.id).where(Chunk.file_path == display_path, Chunk.chunk_type == "code")
+        ).all())
+        symbol_ids.extend(session.exec(
+            select(Symbol.id).where(Symbol.file_path == display_path)
+        ).all())
+        location_ids.extend(session.exec(
+            select(ChunkLocation.id).where(ChunkLocation.file_path == display_path)
+        ).all())
+
+def _promote_copies(chunk_ids: List[int]) -> List[int]:
+    """
+    Moves each stale chunk that other files still copy to its first remaining
+    copy; returns the chunks nothing refers to any more.
+    """
+    if not chunk_ids:
+        return []
+    with Session(engine) as session:
+        copies = session.exec(
+            select(ChunkLocation).where(ChunkLocation.chunk_id.in_(chunk_ids)).order_by(ChunkLocation.id)
+        ).all()
+    promoted = set()
+    for copy in copies:
+        if copy.chunk_id not in promoted:
+            chunk_store.relocate(copy.chunk_id, copy)
+            promoted.add(copy.chunk_id)
+    return [chunk_id for chunk_id in chunk_ids if chunk_id not in promoted]
+
+def sync_codebase(paths: Optional[List[str]] = None, profile: bool = False) -> dict:
+    """Blocking wrapper; raises like ingest_codebase. Returns the "complete" update."""
+    last = {}
+    for update in sync_generator(paths, profile=profile):
+        if update.get("status") == "error":
+            if update.get("code") == "busy":
+                raise IngestionBusyError(update["message"])
+            if update.get("code") == "not_ingested":
+                raise SyncError(update["message"])
+            raise RuntimeError(update["message"])
+        last = update
+    return last
+
+def sync_status() -> dict:
+    state, known = _load_state()
+    if state is None:
+        return {"ingested": False}
+    return {
+        "ingested": True,
+        "source": state.source,
+        "root": state.root,
+        "commit": state.commit,
+        "synced_at": state.synced_at.isoformat(),
+        "files": len(known),
+        "watching": repo_watcher.running,
+        "watch_interval_s": SYNC_WATCH_INTERVAL_S,
+    }
+
+
+# ---------------------------------------------------------
+# 3. WATCHER (polling)
+# ---------------------------------------------------------
+class RepoWatcher:
+    """
+    Polls the ingested tree every `interval` seconds with the cheap stat check
+    and syncs exactly the changed paths. Polling (not inotify) keeps it
+    dependency-free and works on network mounts and in containers; a busy
+    lock (ingestion running, or another worker's sync) just skips the round.
+    Cloned URLs only change upstream: use POST /sync from a push webhook.
+    """
+
+    def __init__(self, interval: float = SYNC_WATCH_INTERVAL_S):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.interval <= 0 or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="repo-watcher", daemon=True)
+        self._thread.start()
+        print(f"👀 Watching the ingested repo every {self.interval:g}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+
+    def poll_once(self) -> Optional[dict]:
+        state, known = _load_state()
+        if state is None or _is_remote(state.source) or not os.path.isdir(state.root):
+            return None
+        repo = _open_repo(state.root)
+        head = repo.head.commit.hexsha if repo is not None and repo.head.is_valid() else state.commit
+        changed = stat_changes(state.root, known)
+        if not changed and head == state.commit:
+            return None
+        # A moved HEAD goes through the git diff (and picks up the new commits)
+        try:
+            return sync_codebase(paths=None if head != state.commit else sorted(changed))
+        except IngestionBusyError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.poll_once()
+                if result:
+                    print(f"👀 Synced {result['updated']} updated / {result['removed']} removed files")
+            except Exception as e:
+                print(f"⚠️ Watcher round failed: {e}")
+
+
+repo_watcher = RepoWatcher()
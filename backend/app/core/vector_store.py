@@ -1,14 +1,48 @@
 import os
+import json
 import time
+import random
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
+from app.core.lazy import lazy_component
+from app.core.coordination import DATA_DIR, allocate_ids
+from app.core import metrics
 
 load_dotenv()
 
+# "pinecone" (default, cloud) or "local" (memory-mapped files under DATA_DIR)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(DATA_DIR, "vector_index"))
+# Local backend: "none" scans float32, "float16"/"int8" scan a compact copy and
+# rescore the best LOCAL_RESCORE_FACTOR * k candidates in full precision
+LOCAL_VECTOR_QUANTIZATION = os.getenv("LOCAL_VECTOR_QUANTIZATION", "none").lower()
+LOCAL_RESCORE_FACTOR = int(os.getenv("LOCAL_RESCORE_FACTOR", "4"))
+QUANTIZATIONS = ("none", "float16", "int8")
+# Pinecone: decimals kept per component in upserts (0 sends full float repr),
+# or PINECONE_GRPC=true to upsert over gRPC (needs the pinecone[grpc] extra)
+PINECONE_UPSERT_DECIMALS = int(os.getenv("PINECONE_UPSERT_DECIMALS", "6"))
+PINECONE_GRPC = os.getenv("PINECONE_GRPC", "false").lower() == "true"
+# Data-plane URL of the index (e.g. http://localhost:5081 for a mock server);
+# set, it skips the control plane (list/create index) entirely
+PINECONE_HOST = os.getenv("PINECONE_HOST", "")
+# Parallel upserts: requests in flight, vectors/bytes per request, retries
+PINECONE_UPSERT_WORKERS = int(os.getenv("PINECONE_UPSERT_WORKERS", "4"))
+PINECONE_UPSERT_MAX_VECTORS = int(os.getenv("PINECONE_UPSERT_MAX_VECTORS", "100"))
+PINECONE_UPSERT_MAX_BYTES = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", str(1536 * 1024)))  # API limit: 2 MB
+PINECONE_UPSERT_RETRIES = int(os.getenv("PINECONE_UPSERT_RETRIES", "4"))
+PINECONE_UPSERT_BACKOFF_S = float(os.getenv("PINECONE_UPSERT_BACKOFF_S", "0.5"))
+_CHARS_PER_COMPONENT = PINECONE_UPSERT_DECIMALS + 5 if PINECONE_UPSERT_DECIMALS > 0 else 22
+
 class PineconeIndexWrapper:
     def __init__(self, pinecone_index):
         self._index = pinecone_index
+        self._pool = None
+        self._pool_pid = None
+        # Only a progress figure now: IDs never come from this counter
         try:
             self._local_count = self._index.describe_index_stats().total_vector_count
         except:
@@ -21,31 +55,136 @@ class PineconeIndexWrapper:
     def ntotal(self):
         return self._local_count
 
-    # 🔥 FIX: Now accepts 'metadatas' argument
-    def add(self, vectors, metadatas=None):
-        start_id = self._local_count
+    # IDs come from the central allocator (coordination.py), shared with the
+    # SQLite chunk rows. Callers that don't pass them get fresh ones from it,
+    # never from a count that may lag behind the index.
+    def add(self, vectors, metadatas=None, ids=None):
+        if ids is None:
+            ids = allocate_ids(len(vectors))
         to_upsert = []
         
-        for i, vector in enumerate(vectors):
-            uid = str(start_id + i)
-            vec_list = vector.tolist() if hasattr(vector, 'tolist') else vector
-            
+        # One conversion for the whole batch. Rounding shortens the JSON body
+        # (~9 instead of ~20 chars per component) far below cosine noise.
+        vectors = np.asarray(vectors, dtype=np.float64)
+        if PINECONE_UPSERT_DECIMALS > 0:
+            vectors = np.round(vectors, PINECONE_UPSERT_DECIMALS)
+        vec_lists = vectors.tolist()
+
+        for i, vec_list in enumerate(vec_lists):
             # 🔥 FIX: Attach metadata if it exists
             meta = metadatas[i] if metadatas is not None else {}
             
             # Pinecone Format: (id, vector, metadata)
-            to_upsert.append((uid, vec_list, meta))
+            to_upsert.append((str(ids[i]), vec_list, meta))
         
-        batch_size = 100
-        for i in range(0, len(to_upsert), batch_size):
-            self._index.upsert(vectors=to_upsert[i : i + batch_size])
-            
-        self._local_count += len(vectors)
+        self._upsert_parallel(_payload_batches(to_upsert))
+        self._local_count += len(to_upsert)
+
+    def _executor(self):
+        # Recreated after a fork: the parent's worker threads don't exist here
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=PINECONE_UPSERT_WORKERS, thread_name_prefix="pinecone-upsert")
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _upsert_parallel(self, batches):
+        """
+        Upserts batches concurrently with at most 2 x PINECONE_UPSERT_WORKERS
+        in flight, so a huge call doesn't queue every payload in memory.
+        Raises the first failure once the in-flight batches have settled.
+        """
+        pool = self._executor()
+        in_flight = set()
+        error = None
+        for batch in batches:
+            if len(in_flight) >= 2 * PINECONE_UPSERT_WORKERS:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                error = error or _first_error(done)
+                if error:
+                    break
+            in_flight.add(pool.submit(self._upsert_with_retry, batch))
+        done, _ = wait(in_flight)
+        error = error or _first_error(done)
+        if error:
+            raise error
+
+    def _upsert_with_retry(self, batch):
+        for attempt in range(PINECONE_UPSERT_RETRIES + 1):
+            try:
+                return self._index.upsert(vectors=batch)
+            except Exception as e:
+                if attempt == PINECONE_UPSERT_RETRIES or not _is_retryable(e):
+                    metrics.stage_errors.inc(pipeline="ingest", stage="upsert")
+                    raise
+                delay = PINECONE_UPSERT_BACKOFF_S * (2 ** attempt) * (0.5 + random.random())
+                print(f"⚠️ Pinecone upsert failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
 
     def reset_tracker(self):
         self._local_count = 0
 
 
+def _payload_batches(records):
+    """
+    Splits (id, values, metadata) records into upsert requests that stay under
+    both PINECONE_UPSERT_MAX_VECTORS and PINECONE_UPSERT_MAX_BYTES. Sizes are
+    estimated from the JSON the REST client will send.
+    """
+    batch = []
+    batch_bytes = 0
+    for record in records:
+        uid, values, meta = record
+        size = len(uid) + len(json.dumps(meta, default=str)) + len(values) * _CHARS_PER_COMPONENT + 64
+        if batch and (len(batch) >= PINECONE_UPSERT_MAX_VECTORS or batch_bytes + size > PINECONE_UPSERT_MAX_BYTES):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(record)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+def _is_retryable(error: Exception) -> bool:
+    # Throttling and server errors are transient; other 4xx won't improve
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if status is None:
+        return True  # connection reset, timeout, ...
+    return status == 429 or status >= 500
+
+def _first_error(futures):
+    for future in futures:
+        if future.exception() is not None:
+            return future.exception()
+    return None
+
+
+def read_vector_files(src_dir: str, dimension: int = 384):
+    """
+    Memory-maps a snapshot's vectors.f32 (N x dimension float32) and ids.i64,
+    the same layout as the local index (see snapshot.py).
+    """
+    vectors_path = os.path.join(src_dir, "vectors.f32")
+    ids_path = os.path.join(src_dir, "ids.i64")
+    rows = os.path.getsize(ids_path) // 8
+    if rows * dimension * 4 != os.path.getsize(vectors_path):
+        raise ValueError(f"{vectors_path} doesn't hold {rows} vectors of dimension {dimension}")
+    if rows == 0:
+        return np.zeros((0, dimension), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return (np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, dimension)),
+            np.memmap(ids_path, dtype=np.int64, mode="r", shape=(rows,)))
+
+def _pinecone_client(api_key):
+    # gRPC sends vectors as packed protobuf floats instead of JSON text
+    if PINECONE_GRPC:
+        try:
+            from pinecone.grpc import PineconeGRPC
+            print("🌲 Using Pinecone gRPC transport")
+            return PineconeGRPC(api_key=api_key)
+        except ImportError:
+            print("⚠️ PINECONE_GRPC is set but pinecone[grpc] is not installed; using REST.")
+    return Pinecone(api_key=api_key)
+
+
 class VectorStore:
     def __init__(self, index_name: str = "codebase-rag"):
         self.dimension = 384
@@ -55,9 +194,13 @@ class VectorStore:
         if not api_key:
             print("⚠️ PINECONE_API_KEY missing.")
         
-        print(f"🌲 Connecting to Pinecone Index: {self.index_name}")
-        self.pc = Pinecone(api_key=api_key)
+        self.pc = _pinecone_client(api_key)
+        if PINECONE_HOST:
+            print(f"🌲 Connecting to Pinecone Index at {PINECONE_HOST}")
+            self.index = PineconeIndexWrapper(self.pc.Index(host=PINECONE_HOST))
+            return
 
+        print(f"🌲 Connecting to Pinecone Index: {self.index_name}")
         existing_indexes = [i.name for i in self.pc.list_indexes()]
         if self.index_name not in existing_indexes:
             self.pc.create_index(
@@ -71,8 +214,8 @@ class VectorStore:
         self.index = PineconeIndexWrapper(self.pc.Index(self.index_name))
 
     # 🔥 FIX: Added 'metadatas' parameter here too
-    def add_vectors(self, vectors: np.ndarray, metadatas: list = None):
-        self.index.add(vectors, metadatas)
+    def add_vectors(self, vectors: np.ndarray, metadatas: list = None, ids: list = None):
+        self.index.add(vectors, metadatas, ids)
         return self.index.ntotal
 
     def save(self):
@@ -95,15 +238,492 @@ class VectorStore:
             
         return np.array([distances], dtype='float32'), np.array([indices], dtype='int64')
 
-    def reset(self):
+    def search_subset(self, query_vector: np.ndarray, ids, k: int = 5):
+        """
+        Top k among the given IDs only (routed drill-down). Pinecone can't
+        restrict a query to IDs, so their vectors are fetched and scored here.
+        """
+        ids = [str(i) for i in ids]
+        query = np.asarray(query_vector, dtype=np.float32).flatten()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        found_ids, found_vectors = [], []
+        for start in range(0, len(ids), 1000):
+            fetched = self.index.fetch(ids=ids[start:start + 1000])
+            for uid, record in fetched.vectors.items():
+                found_ids.append(int(uid))
+                found_vectors.append(record.values)
+        if not found_ids:
+            return np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64")
+        vectors = np.asarray(found_vectors, dtype=np.float32)
+        scores = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        top = np.argsort(-scores)[:k]
+        return np.array([scores[top]], dtype="float32"), np.array([[found_ids[i] for i in top]], dtype="int64")
+
+    def search_files(self, query_vector: np.ndarray, file_paths, k: int = 5):
+        """
+        Top k among the chunks whose metadata file_path is one of `file_paths`
+        (routed drill-down): one filtered query, no vector values transferred.
+        """
+        results = self.index.query(vector=query_vector.flatten().tolist(), top_k=k, include_values=False,
+                                   filter={"file_path": {"$in": list(file_paths)}})
+        matches = results["matches"]
+        return (np.array([[m["score"] for m in matches]], dtype="float32"),
+                np.array([[int(m["id"]) for m in matches]], dtype="int64"))
+
+    def update_metadata(self, chunk_id: int, metadata: dict):
+        """Rewrites fields of one vector's filterable metadata (a chunk that moved files)."""
+        self.index.update(id=str(chunk_id), set_metadata=metadata)
+
+    def delete(self, ids):
+        # The delete API takes at most 1000 IDs per call
+        ids = [str(i) for i in ids]
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[start:start + 1000])
+
+    def export_vectors(self, out_dir: str, ids) -> int:
+        """
+        Fetches the vectors of `ids` into out_dir/vectors.f32 + ids.i64,
+        L2-normalized like the local index. IDs Pinecone doesn't know are skipped.
+        """
+        ids = [str(i) for i in ids]
+        written = 0
+        with open(os.path.join(out_dir, "vectors.f32"), "wb") as vectors_file, \
+                open(os.path.join(out_dir, "ids.i64"), "wb") as ids_file:
+            for start in range(0, len(ids), 1000):
+                fetched = self.index.fetch(ids=ids[start:start + 1000])
+                if not fetched.vectors:
+                    continue
+                found_ids = np.array([int(uid) for uid in fetched.vectors], dtype=np.int64)
+                vectors = np.asarray([record.values for record in fetched.vectors.values()], dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                vectors_file.write(vectors.tobytes())
+                ids_file.write(found_ids.tobytes())
+                written += len(found_ids)
+        return written
+
+    def import_vectors(self, src_dir: str, metadatas=None) -> int:
+        """
+        Replaces the index with a snapshot's vectors. `metadatas(ids)` rebuilds
+        the small filterable metadata, which snapshots don't carry.
+        """
+        vectors, ids = read_vector_files(src_dir, self.dimension)
         print("🧹 Wiping Cloud Vector Memory...")
+        self._wipe()  # raises: upserting over a half-wiped index would mix two snapshots
+        for start in range(0, len(ids), 1000):
+            block_ids = ids[start:start + 1000].tolist()
+            self.index.add(np.asarray(vectors[start:start + 1000]),
+                           metadatas(block_ids) if metadatas else None, block_ids)
+        return len(ids)
+
+    def holds_vectors(self, src_dir: str, sample: int = 50) -> bool:
+        """
+        True if the index already holds a snapshot's vectors: same count, and
+        the first and last `sample` IDs present (another node imported it).
+        """
+        _, ids = read_vector_files(src_dir, self.dimension)
+        if self.index.describe_index_stats().total_vector_count != len(ids):
+            return False
+        probe = np.unique(np.concatenate([ids[:sample], ids[-sample:]])).tolist() if len(ids) else []
+        return not probe or len(self.index.fetch(ids=[str(i) for i in probe]).vectors) == len(probe)
+
+    def _wipe(self):
         try:
             self.index.delete(delete_all=True)
-            self.index.reset_tracker()
         except Exception as e:
-            if "not found" in str(e).lower() or "404" in str(e):
-                self.index.reset_tracker()
+            if not ("not found" in str(e).lower() or "404" in str(e)):
+                raise
+        self.index.reset_tracker()
+
+    def reset(self):
+        print("🧹 Wiping Cloud Vector Memory...")
+        try:
+            self._wipe()
+        except Exception as e:
+            print(f"Error resetting index: {e}")
+
+
+class LocalVectorStore:
+    """
+    Brute-force cosine index stored as two append-only raw files:
+    vectors.f32 (N x 384 float32, L2-normalized) and ids.i64 (N int64).
+
+    Readers memory-map the files read-only, so every worker process shares a
+    single copy through the OS page cache. Only the ingestion writer appends;
+    other workers notice the bigger files on their next search and remap.
+
+    With quantization a third file holds a compact copy that searches scan:
+    - float16: vectors.f16 (N x 384 float16), half the bytes;
+    - int8:    vectors.i8, a header of 384 float32 per-dimension scales
+               followed by N x 384 int8 rows, a quarter of the bytes.
+    Only the top candidates are rescored against vectors.f32, so those pages
+    are touched on demand and the float32 file need not stay resident.
+
+    Deletes (incremental sync) append IDs to deleted.i64; searches skip those
+    rows until the next full ingestion rewrites the index.
+    """
+
+    INT8_HEADROOM = 1.25      # scale growth per requantization, see _rewrite_quantized
+    SCORE_BLOCK_ROWS = 1024   # rows dequantized at a time while scoring (stays in cache)
+    COPY_BLOCK_ROWS = 65536   # rows per step when rebuilding the quantized file
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR, quantization: str = LOCAL_VECTOR_QUANTIZATION,
+                 rescore_factor: int = LOCAL_RESCORE_FACTOR):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.dimension = 384
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.index_dir = index_dir
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._vectors_path = os.path.join(self.index_dir, "vectors.f32")
+        self._ids_path = os.path.join(self.index_dir, "ids.i64")
+        self._deleted_path = os.path.join(self.index_dir, "deleted.i64")
+        self._quant_path = {
+            "float16": os.path.join(self.index_dir, "vectors.f16"),
+            "int8": os.path.join(self.index_dir, "vectors.i8"),
+        }.get(quantization)
+
+        self._lock = threading.Lock()
+        self._pending_vectors = []
+        self._pending_ids = []
+        self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._quantized = None
+        self._quant_stale = False
+        self._scales = None
+        self._deleted = None  # bool mask over rows, None when nothing is deleted
+        self._stamp = None
+
+        print(f"📂 Using local vector index: {self.index_dir}"
+              + (f" ({quantization} + rescoring)" if self._quant_path else ""))
+        self._remap()
+        if self._quant_stale:
+            # Index written without (or before a change of) quantization
+            with self._lock:
+                self._rewrite_quantized(np.zeros((0, self.dimension), dtype=np.float32))
+                self._remap()
+
+    @property
+    def index(self):
+        # Compatibility with code that reads vector_db.index.ntotal
+        return self
+
+    @property
+    def ntotal(self):
+        return len(self._ids) + sum(len(ids) for ids in self._pending_ids)
+
+    def footprint(self) -> dict:
+        """Bytes scanned per search vs bytes of the full-precision copy."""
+        self._remap()
+        full = int(self._vectors.nbytes)
+        scanned = int(self._quantized.nbytes) if self._quantized is not None else full
+        return {"rows": len(self._ids), "scanned_bytes": scanned, "float32_bytes": full}
+
+    def _file_stamp(self):
+        try:
+            ids_stat = os.stat(self._ids_path)
+            vec_stat = os.stat(self._vectors_path)
+        except FileNotFoundError:
+            return None
+        quant = None
+        if self._quant_path and os.path.exists(self._quant_path):
+            quant_stat = os.stat(self._quant_path)
+            quant = (quant_stat.st_ino, quant_stat.st_size)
+        deleted = None
+        if os.path.exists(self._deleted_path):
+            deleted_stat = os.stat(self._deleted_path)
+            deleted = (deleted_stat.st_ino, deleted_stat.st_size)
+        return (ids_stat.st_ino, ids_stat.st_size, vec_stat.st_ino, vec_stat.st_size, quant, deleted)
+
+    def _quant_header_bytes(self):
+        return self.dimension * 4 if self.quantization == "int8" else 0
+
+    def _quant_rows(self, size):
+        header = self._quant_header_bytes()
+        item = 2 if self.quantization == "float16" else 1
+        return max(0, size - header) // (self.dimension * item) if size >= header else 0
+
+    def _remap(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._quantized = None
+        self._quant_stale = False
+        self._deleted = None
+        if stamp is None:
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self._ids = np.zeros(0, dtype=np.int64)
+            return
+
+        # Rows fully present in every file (a writer may be mid-append)
+        row_bytes = self.dimension * 4
+        rows = min(stamp[1] // 8, stamp[3] // row_bytes)
+        if self._quant_path:
+            # A missing or short copy means searches fall back to float32
+            # until the constructor (or the next save) rebuilds it
+            if stamp[4] is not None and self._quant_rows(stamp[4][1]) >= rows:
+                self._map_quantized(rows)
             else:
-                print(f"Error resetting index: {e}")
+                self._quant_stale = rows > 0
+        if rows == 0:
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self._ids = np.zeros(0, dtype=np.int64)
+            return
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        self._ids = np.memmap(self._ids_path, dtype=np.int64, mode="r", shape=(rows,))
+        if stamp[5] is not None and stamp[5][1] >= 8:
+            deleted = np.fromfile(self._deleted_path, dtype=np.int64, count=stamp[5][1] // 8)
+            self._deleted = np.isin(self._ids, deleted)
+
+    def _map_quantized(self, rows):
+        header = self._quant_header_bytes()
+        self._scales = None
+        if self.quantization == "int8" and os.path.getsize(self._quant_path) >= header:
+            self._scales = np.fromfile(self._quant_path, dtype=np.float32, count=self.dimension)
+        if rows == 0 or (self.quantization == "int8" and self._scales is None):
+            self._quantized = np.zeros((0, self.dimension), dtype=np.int8)
+            return
+        dtype = np.float16 if self.quantization == "float16" else np.int8
+        self._quantized = np.memmap(self._quant_path, dtype=dtype, mode="r", offset=header,
+                                    shape=(rows, self.dimension))
+
+    # ---------------------------------------------------------
+    # Quantization
+    # ---------------------------------------------------------
+    def _quantize_rows(self, vectors: np.ndarray, scales=None) -> np.ndarray:
+        if self.quantization == "float16":
+            return vectors.astype(np.float16)
+        q = np.rint(vectors / scales * 127.0)
+        return np.clip(q, -127, 127).astype(np.int8)
+
+    def _needs_new_scales(self, vectors: np.ndarray) -> bool:
+        if self.quantization != "int8" or len(vectors) == 0:
+            return False
+        return self._scales is None or bool((np.abs(vectors).max(axis=0) > self._scales).any())
+
+    def _rewrite_quantized(self, new_vectors: np.ndarray):
+        """
+        Rebuilds the quantized file from vectors.f32 plus `new_vectors` (not yet
+        on disk). For int8 the per-dimension scales grow with headroom, so this
+        happens a handful of times per index, not on every save.
+        """
+        existing = self._vectors
+        if self.quantization == "int8":
+            peak = np.abs(new_vectors).max(axis=0) if len(new_vectors) else np.zeros(self.dimension, np.float32)
+            for start in range(0, len(existing), self.COPY_BLOCK_ROWS):
+                peak = np.maximum(peak, np.abs(existing[start:start + self.COPY_BLOCK_ROWS]).max(axis=0))
+            old = self._scales if self._scales is not None else np.zeros(self.dimension, np.float32)
+            scales = np.where(peak > old, np.minimum(peak * self.INT8_HEADROOM, 1.0), old)
+            scales = np.maximum(scales, 1e-6).astype(np.float32)
+        else:
+            scales = None
+
+        tmp_path = f"{self._quant_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            if scales is not None:
+                f.write(scales.tobytes())
+            for start in range(0, len(existing), self.COPY_BLOCK_ROWS):
+                block = np.asarray(existing[start:start + self.COPY_BLOCK_ROWS])
+                f.write(self._quantize_rows(block, scales).tobytes())
+            f.write(self._quantize_rows(new_vectors, scales).tobytes())
+        os.replace(tmp_path, self._quant_path)
+        self._scales = scales
+
+    def add_vectors(self, vectors: np.ndarray, metadatas: list = None, ids: list = None):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        if ids is None:
+            start = self.ntotal
+            ids = range(start, start + len(vectors))
+
+        with self._lock:
+            self._pending_vectors.append(vectors)
+            self._pending_ids.append(np.asarray(list(ids), dtype=np.int64))
+        return self.ntotal
+
+    def save(self):
+        """
+        Appends pending rows. Vectors (full, then quantized) are written before
+        IDs so a concurrent reader never sees an ID without its vector.
+        """
+        with self._lock:
+            if not self._pending_ids:
+                return
+            vectors = np.vstack(self._pending_vectors)
+            ids = np.concatenate(self._pending_ids)
+            self._pending_vectors = []
+            self._pending_ids = []
+
+            if self._quant_path:
+                self._remap()
+                if self._quant_stale or self._needs_new_scales(vectors) or not os.path.exists(self._quant_path):
+                    self._rewrite_quantized(vectors)
+                else:
+                    with open(self._quant_path, "ab") as f:
+                        f.write(self._quantize_rows(vectors, self._scales).tobytes())
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._ids_path, "ab") as f:
+                f.write(ids.tobytes())
+            self._remap()
+
+    def search(self, query_vector: np.ndarray, k: int = 5):
+        self._remap()
+        vectors, ids, quantized, deleted = self._vectors, self._ids, self._quantized, self._deleted
+        if len(ids) == 0:
+            return np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64")
+
+        query = np.asarray(query_vector, dtype=np.float32).flatten()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        if quantized is None or len(quantized) < len(ids):
+            scores = np.asarray(vectors @ query)
+            if deleted is not None:
+                scores[deleted] = -np.inf
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            if deleted is not None:
+                top = top[~deleted[top]]
+            return np.array([scores[top]], dtype="float32"), np.array([ids[top]], dtype="int64")
+
+        # Approximate scores over the compact copy, dequantized block by block
+        # into one reused float32 buffer so the matmul still goes through BLAS
+        weights = query if self.quantization == "float16" else query * (self._scales / 127.0)
+        scores = np.empty(len(ids), dtype=np.float32)
+        buffer = np.empty((self.SCORE_BLOCK_ROWS, self.dimension), dtype=np.float32)
+        for start in range(0, len(ids), self.SCORE_BLOCK_ROWS):
+            block = quantized[start:start + self.SCORE_BLOCK_ROWS]
+            rows = buffer[:len(block)]
+            np.copyto(rows, block, casting="unsafe")
+            scores[start:start + len(block)] = rows @ weights
+        if deleted is not None:
+            scores[deleted] = -np.inf
+
+        k = min(k, len(scores))
+        candidates = min(len(scores), max(k, k * self.rescore_factor))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if deleted is not None:
+            top = top[~deleted[top]]
+        if self.rescore_factor > 0:
+            top.sort()  # ascending rows: sequential reads from the float32 file
+            top_scores = np.asarray(vectors[top]) @ query
+        else:
+            top_scores = scores[top]
+        order = np.argsort(-top_scores)[:k]
+        return np.array([top_scores[order]], dtype="float32"), np.array([ids[top[order]]], dtype="int64")
+
+    def search_subset(self, query_vector: np.ndarray, ids, k: int = 5):
+        """Top k among the given IDs only, scored exactly on the float32 rows."""
+        self._remap()
+        vectors, all_ids, deleted = self._vectors, self._ids, self._deleted
+        wanted = np.asarray(list(ids), dtype=np.int64)
+        if len(all_ids) == 0 or len(wanted) == 0:
+            return np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64")
+        mask = np.isin(all_ids, wanted)
+        if deleted is not None:
+            mask &= ~deleted
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64")
+
+        query = np.asarray(query_vector, dtype=np.float32).flatten()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = np.asarray(vectors[rows]) @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return np.array([scores[top]], dtype="float32"), np.array([all_ids[rows[top]]], dtype="int64")
+
+    def reset(self):
+        """
+        Swaps in fresh empty files. Replacing (not truncating) keeps existing
+        memory maps in other workers valid until they remap.
+        """
+        print("🧹 Wiping Local Vector Memory...")
+        with self._lock:
+            self._pending_vectors = []
+            self._pending_ids = []
+            paths = (self._ids_path, self._vectors_path, self._deleted_path) \
+                + ((self._quant_path,) if self._quant_path else ())
+            for path in paths:
+                tmp_path = path + ".tmp"
+                open(tmp_path, "wb").close()
+                os.replace(tmp_path, path)
+            self._scales = None
+            self._remap()
+
+    def update_metadata(self, chunk_id: int, metadata: dict):
+        pass  # no metadata here: the content store holds it
+
+    def delete(self, ids):
+        """Hides rows by ID. Pending (unsaved) rows are dropped directly."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(ids) == 0:
+            return
+        with self._lock:
+            for i, pending in enumerate(self._pending_ids):
+                keep = ~np.isin(pending, ids)
+                self._pending_ids[i] = pending[keep]
+                self._pending_vectors[i] = self._pending_vectors[i][keep]
+            with open(self._deleted_path, "ab") as f:
+                f.write(ids.tobytes())
+            self._remap()
+
+    # ---------------------------------------------------------
+    # Snapshots (snapshot.py)
+    # ---------------------------------------------------------
+    def export_vectors(self, out_dir: str, ids) -> int:
+        """
+        Copies the rows of `ids` to out_dir/vectors.f32 + ids.i64 block by
+        block. Deleted rows are compacted out, so the copy has no deleted.i64.
+        """
+        wanted = np.asarray(list(ids), dtype=np.int64)
+        self._remap()
+        with self._lock:
+            vectors, all_ids, deleted = self._vectors, self._ids, self._deleted
+        written = 0
+        with open(os.path.join(out_dir, "vectors.f32"), "wb") as vectors_file, \
+                open(os.path.join(out_dir, "ids.i64"), "wb") as ids_file:
+            for start in range(0, len(all_ids), self.COPY_BLOCK_ROWS):
+                block_ids = np.asarray(all_ids[start:start + self.COPY_BLOCK_ROWS])
+                keep = np.isin(block_ids, wanted)
+                if deleted is not None:
+                    keep &= ~deleted[start:start + self.COPY_BLOCK_ROWS]
+                vectors_file.write(np.asarray(vectors[start:start + self.COPY_BLOCK_ROWS])[keep].tobytes())
+                ids_file.write(block_ids[keep].tobytes())
+                written += int(keep.sum())
+        return written
+
+    def import_vectors(self, src_dir: str, metadatas=None) -> int:
+        """
+        Swaps in a snapshot's files. They are copied, never linked: later
+        appends would otherwise write through into the snapshot. The IDs file
+        (and the quantized copy) is emptied first, so other workers see an
+        empty index rather than new vectors under old IDs; the quantized copy
+        is rebuilt from the new vectors.
+        """
+        read_vector_files(src_dir, self.dimension)  # validates the sizes
+        with self._lock:
+            self._pending_vectors = []
+            self._pending_ids = []
+            for path in (self._ids_path, self._deleted_path) + ((self._quant_path,) if self._quant_path else ()):
+                tmp_path = path + ".tmp"
+                open(tmp_path, "wb").close()
+                os.replace(tmp_path, path)
+            for name, path in (("vectors.f32", self._vectors_path), ("ids.i64", self._ids_path)):
+                tmp_path = path + ".tmp"
+                shutil.copyfile(os.path.join(src_dir, name), tmp_path)
+                os.replace(tmp_path, path)
+            self._scales = None
+            self._remap()
+            if self._quant_path:
+                self._rewrite_quantized(np.zeros((0, self.dimension), dtype=np.float32))
+                self._remap()
+        return len(self._ids)
 
-vector_db = VectorStore()
\ No newline at end of file
+# Connecting (and possibly creating the index) happens on first use
+vector_db = lazy_component("vector_store", lambda: LocalVectorStore() if VECTOR_BACKEND == "local" else VectorStore())
\ No newline at end of file
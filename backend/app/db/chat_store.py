@@ -0,0 +1,196 @@
+# chat_store.py
+"""
+Pluggable storage backends ("sinks") for chat history.
+- SupabaseChatStore: the hosted Postgres (or any PostgREST-compatible server,
+  e.g. a fake one in tests, by pointing SUPABASE_URL at it).
+- SQLiteChatStore: the local ChatSession/ChatMessage tables in assistant.db.
+
+Inserts are idempotent, because the writer retries a batch whose outcome it
+never saw. Sessions upsert on their id. Messages carry a client-generated
+`client_id` and are skipped when it already exists. On Supabase this needs
+migrations/supabase/001_chat_messages_client_id.sql; a project without it
+gets plain inserts (and a warning) instead of failing every write.
+
+Each store's `is_permanent(error)` tells the writer which failures no retry
+will fix (bad rows, schema errors), so it parks those rows instead of
+retrying them forever.
+
+Reads are keyset-paginated: `after` is the (created_at, id) of the last row of
+the previous page, so a page costs the same however deep it is.
+"""
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError, DataError, CompileError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from app.db.session import engine, init_db, supabase
+from app.db.models import ChatSession, ChatMessage
+
+SESSIONS_TABLE = "chat_sessions"
+MESSAGES_TABLE = "chat_messages"
+
+# Column projection: the sidebar only needs titles, never message bodies
+SESSION_LIST_COLUMNS = ("id", "title", "created_at")
+MESSAGE_COLUMNS = ("id", "session_id", "role", "content", "created_at")
+
+Cursor = Tuple[str, object]  # (created_at ISO string, id)
+
+# PostgREST answers for a chat_messages table without the client_id migration:
+# unknown column (SQLSTATE / schema cache) and no unique index to upsert on
+_MISSING_CLIENT_ID = ("42703", "PGRST204")
+_NO_CLIENT_ID_INDEX = ("42P10",)
+
+
+class SupabaseChatStore:
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+        # "upsert" until the table turns out to predate the client_id migration
+        self._message_mode = "upsert"
+
+    def insert(self, table: str, rows: List[dict]):
+        if not rows:
+            return
+        if table == SESSIONS_TABLE:
+            # Upsert: a retried batch must not fail on an already-created session
+            self.client.table(table).upsert(rows).execute()
+            return
+        if self._message_mode == "upsert":
+            try:
+                self.client.table(table).upsert(rows, on_conflict="client_id", ignore_duplicates=True).execute()
+                return
+            except Exception as e:
+                code = getattr(e, "code", None)
+                if code not in _MISSING_CLIENT_ID + _NO_CLIENT_ID_INDEX:
+                    raise
+                self._message_mode = "insert" if code in _NO_CLIENT_ID_INDEX else "insert_without_id"
+                print(f"⚠️ {table} lacks a unique client_id column ({code}); using plain inserts, so a retried "
+                      f"write may duplicate messages. Run migrations/supabase/001_chat_messages_client_id.sql")
+        if self._message_mode == "insert_without_id":
+            rows = [{k: v for k, v in row.items() if k != "client_id"} for row in rows]
+        self.client.table(table).insert(rows).execute()
+
+    @staticmethod
+    def is_permanent(error: Exception) -> bool:
+        """Rejections a retry can't fix: data, constraint and schema errors (SQLSTATE 22/23/42, PGRST2xx)."""
+        code = str(getattr(error, "code", "") or "")
+        return code[:2] in ("22", "23", "42") or code.startswith("PGRST2")
+
+    def list_sessions(self, user_id: str, limit: int, after: Optional[Cursor] = None) -> List[dict]:
+        """Newest first."""
+        query = self.client.table(SESSIONS_TABLE)\
+            .select(",".join(SESSION_LIST_COLUMNS))\
+            .eq("user_id", user_id)
+        if after:
+            created_at, key = after
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{key}")')
+        return query.order("created_at", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit)\
+            .execute().data
+
+    def list_messages(self, session_id: str, limit: int, after: Optional[Cursor] = None) -> List[dict]:
+        """Oldest first."""
+        query = self.client.table(MESSAGES_TABLE)\
+            .select(",".join(MESSAGE_COLUMNS))\
+            .eq("session_id", session_id)
+        if after:
+            created_at, key = after
+            query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{key}")')
+        return query.order("created_at", desc=False)\
+            .order("id", desc=False)\
+            .limit(limit)\
+            .execute().data
+
+    def list_messages_batch(self, session_ids: List[str], limit: int) -> Dict[str, List[dict]]:
+        # PostgREST has no per-group LIMIT: run the per-session queries concurrently
+        with ThreadPoolExecutor(max_workers=min(8, len(session_ids) or 1)) as pool:
+            pages = pool.map(lambda sid: self.list_messages(sid, limit), session_ids)
+            return dict(zip(session_ids, pages))
+
+
+class SQLiteChatStore:
+    name = "sqlite"
+
+    def __init__(self):
+        init_db()
+
+    def insert(self, table: str, rows: List[dict]):
+        if not rows:
+            return
+        with Session(engine) as session:
+            for row in rows:
+                row = dict(row)
+                if isinstance(row.get("created_at"), str):
+                    row["created_at"] = datetime.fromisoformat(row["created_at"])
+                if table == SESSIONS_TABLE:
+                    # merge() makes session inserts idempotent on retry
+                    session.merge(ChatSession(**row))
+                elif row.get("client_id"):
+                    session.execute(
+                        sqlite_insert(ChatMessage.__table__).values(**row)
+                        .on_conflict_do_nothing(index_elements=["client_id"])
+                    )
+                else:
+                    session.add(ChatMessage(**row))  # spooled before client ids existed
+            session.commit()
+
+    @staticmethod
+    def is_permanent(error: Exception) -> bool:
+        """Rows the tables reject (constraints, bad values or keys); a locked database is transient."""
+        return isinstance(error, (IntegrityError, DataError, CompileError, TypeError, ValueError))
+
+    def list_sessions(self, user_id: str, limit: int, after: Optional[Cursor] = None) -> List[dict]:
+        """Newest first."""
+        statement = select(ChatSession.id, ChatSession.title, ChatSession.created_at)\
+            .where(ChatSession.user_id == user_id)
+        if after:
+            created_at, key = datetime.fromisoformat(after[0]), after[1]
+            statement = statement.where(or_(
+                ChatSession.created_at < created_at,
+                and_(ChatSession.created_at == created_at, ChatSession.id < key),
+            ))
+        statement = statement.order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).limit(limit)
+        with Session(engine) as session:
+            rows = session.exec(statement).all()
+        return [dict(zip(SESSION_LIST_COLUMNS, (r[0], r[1], r[2].isoformat()))) for r in rows]
+
+    def list_messages(self, session_id: str, limit: int, after: Optional[Cursor] = None,
+                      session: Optional[Session] = None) -> List[dict]:
+        """Oldest first."""
+        statement = select(ChatMessage.id, ChatMessage.session_id, ChatMessage.role,
+                           ChatMessage.content, ChatMessage.created_at)\
+            .where(ChatMessage.session_id == session_id)
+        if after:
+            created_at, key = datetime.fromisoformat(after[0]), after[1]
+            statement = statement.where(or_(
+                ChatMessage.created_at > created_at,
+                and_(ChatMessage.created_at == created_at, ChatMessage.id > key),
+            ))
+        statement = statement.order_by(ChatMessage.created_at, ChatMessage.id).limit(limit)
+        if session is None:
+            with Session(engine) as session:
+                rows = session.exec(statement).all()
+        else:
+            rows = session.exec(statement).all()
+        return [dict(zip(MESSAGE_COLUMNS, (*r[:4], r[4].isoformat()))) for r in rows]
+
+    def list_messages_batch(self, session_ids: List[str], limit: int) -> Dict[str, List[dict]]:
+        with Session(engine) as session:
+            return {sid: self.list_messages(sid, limit, session=session) for sid in session_ids}
+
+
+def create_chat_store() -> Optional[object]:
+    """
+    CHAT_HISTORY_SINK: "supabase" (default when configured), "sqlite" or "none".
+    """
+    choice = os.getenv("CHAT_HISTORY_SINK", "supabase" if supabase else "none").lower()
+    if choice == "sqlite":
+        return SQLiteChatStore()
+    if choice == "supabase" and supabase:
+        return SupabaseChatStore(supabase)
+    return None
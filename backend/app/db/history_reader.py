@@ -0,0 +1,169 @@
+#history_reader.py
+"""
+Read side of chat history: keyset-paginated pages served from a short-TTL
+cache. /chat invalidates a user's (and a session's) entries when it writes,
+and rows still queued in the write-behind writer are flushed before a read
+that would otherwise miss them.
+
+The cache is per process; with several workers the TTL bounds how stale
+another worker's copy can get.
+"""
+import os
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from app.core import metrics
+from app.db.history_writer import get_history_writer
+
+HISTORY_CACHE_TTL_S = float(os.getenv("HISTORY_CACHE_TTL_S", "30"))
+HISTORY_CACHE_ENTRIES = int(os.getenv("HISTORY_CACHE_ENTRIES", "1024"))
+
+
+# ---------------------------------------------------------
+# 1. OPAQUE CURSORS
+# ---------------------------------------------------------
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]):
+    """(created_at, id) of the last row of the previous page. Raises ValueError."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, key = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(key, (str, int)):
+        raise ValueError("Invalid cursor")
+    return created_at, key
+
+def _page(rows: List[dict], limit: int) -> dict:
+    # Stores are asked for limit + 1 rows: the extra one only signals "more"
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {"items": rows, "next_cursor": encode_cursor(rows[-1]) if has_more and rows else None}
+
+
+# ---------------------------------------------------------
+# 2. TTL CACHE (invalidated per user / per session)
+# ---------------------------------------------------------
+class HistoryCache:
+    """
+    Keys are ("sessions", user_id, cursor, limit) or
+    ("messages", session_id, cursor, limit); key[1] is what invalidates them.
+    """
+
+    def __init__(self, ttl: float = HISTORY_CACHE_TTL_S, max_entries: int = HISTORY_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str] = None, session_id: Optional[str] = None):
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if (key[0] == "sessions" and key[1] == user_id)
+                or (key[0] == "messages" and key[1] == session_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+
+
+history_cache = HistoryCache()
+
+
+# ---------------------------------------------------------
+# 3. QUERIES
+# ---------------------------------------------------------
+def _store_for_read(user_id: Optional[str] = None, session_ids=()):
+    writer = get_history_writer()
+    if writer is None:
+        return None
+    if writer.has_pending(user_id=user_id, session_ids=set(session_ids)):
+        writer.flush()
+    return writer.store
+
+def list_sessions(user_id: str, cursor: Optional[str] = None, limit: int = 50) -> dict:
+    """One page of a user's sessions (id, title, created_at), newest first."""
+    after = decode_cursor(cursor)
+    key = ("sessions", user_id, cursor, limit)
+    cached = history_cache.get(key)
+    metrics.cache_event("history", cached is not None)
+    if cached is not None:
+        return cached
+
+    store = _store_for_read(user_id=user_id)
+    if store is None:
+        return {"items": [], "next_cursor": None}
+    page = _page(store.list_sessions(user_id, limit + 1, after), limit)
+    history_cache.put(key, page)
+    return page
+
+def list_messages(session_id: str, cursor: Optional[str] = None, limit: int = 200) -> dict:
+    """One page of a session's messages, oldest first."""
+    after = decode_cursor(cursor)
+    key = ("messages", session_id, cursor, limit)
+    cached = history_cache.get(key)
+    metrics.cache_event("history", cached is not None)
+    if cached is not None:
+        return cached
+
+    store = _store_for_read(session_ids=[session_id])
+    if store is None:
+        return {"items": [], "next_cursor": None}
+    page = _page(store.list_messages(session_id, limit + 1, after), limit)
+    history_cache.put(key, page)
+    return page
+
+def list_messages_batch(session_ids: List[str], limit: int = 50) -> Dict[str, dict]:
+    """First page of messages for several sessions in one call."""
+    session_ids = list(dict.fromkeys(session_ids))
+    pages: Dict[str, dict] = {}
+    missing = []
+    for session_id in session_ids:
+        cached = history_cache.get(("messages", session_id, None, limit))
+        metrics.cache_event("history", cached is not None)
+        if cached is not None:
+            pages[session_id] = cached
+        else:
+            missing.append(session_id)
+
+    if missing:
+        store = _store_for_read(session_ids=missing)
+        fetched = store.list_messages_batch(missing, limit + 1) if store else {}
+        for session_id in missing:
+            page = _page(fetched.get(session_id, []), limit)
+            if store is not None:
+                history_cache.put(("messages", session_id, None, limit), page)
+            pages[session_id] = page
+
+    return {session_id: pages[session_id] for session_id in session_ids}
+
+def invalidate(user_id: Optional[str] = None, session_id: Optional[str] = None):
+    """Called by /chat after queueing rows for this user/session."""
+    history_cache.invalidate(user_id=user_id, session_id=session_id)
@@ -0,0 +1,282 @@
+#history_writer.py
+"""
+Write-behind persistence for chat history.
+
+/chat used to make up to three blocking Supabase round trips per request after
+the answer was ready. Rows are now queued in memory, appended to a small local
+spool file (so a restart doesn't lose them), and a background thread inserts
+them in batches - one call per table - on size or interval, with retries.
+A batch the sink rejects for good (its `is_permanent(error)`) is moved to
+chat_parked.jsonl for inspection instead of blocking the queue forever.
+"""
+import os
+import glob
+import json
+import time
+import threading
+from typing import List, Optional
+from app.core.coordination import DATA_DIR
+from app.db.chat_store import SESSIONS_TABLE, MESSAGES_TABLE, create_chat_store
+
+# ---------------------------------------------------------
+# CONFIGURATION (env overridable)
+# ---------------------------------------------------------
+CHAT_FLUSH_BATCH = int(os.getenv("CHAT_FLUSH_BATCH", "50"))
+CHAT_FLUSH_INTERVAL_S = float(os.getenv("CHAT_FLUSH_INTERVAL_S", "1.0"))
+CHAT_FLUSH_RETRIES = int(os.getenv("CHAT_FLUSH_RETRIES", "3"))
+
+# Sessions go first: messages reference them
+TABLE_ORDER = (SESSIONS_TABLE, MESSAGES_TABLE)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ChatHistoryWriter:
+    """
+    Batches chat-history inserts across requests.
+    Each process owns one spool file (chat_spool.<pid>.jsonl) holding every
+    row not yet confirmed by the sink. Spools left behind by dead processes
+    are adopted on start, so rows survive crashes and restarts.
+    """
+
+    def __init__(self, store, spool_dir: str = DATA_DIR,
+                 max_batch: int = CHAT_FLUSH_BATCH,
+                 flush_interval: float = CHAT_FLUSH_INTERVAL_S,
+                 retries: int = CHAT_FLUSH_RETRIES):
+        self.store = store
+        self.spool_dir = spool_dir
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._reset_state()
+        # Pre-forked workers get their own spool and flush thread
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        self.spool_path = os.path.join(self.spool_dir, f"chat_spool.{os.getpid()}.jsonl")
+        self.parked_path = os.path.join(self.spool_dir, "chat_parked.jsonl")
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._worker = None
+        self._closed = False
+
+    # ---------------------------------------------------------
+    # PUBLIC API
+    # ---------------------------------------------------------
+    def enqueue(self, table: str, row: dict):
+        """Queues one row. Returns immediately; the row is spooled to disk."""
+        record = {"table": table, "row": row}
+        with self._cond:
+            self._ensure_started()
+            self._append_spool([record])
+            self._pending.append(record)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def has_pending(self, user_id: Optional[str] = None, session_ids=()) -> bool:
+        """True if unsent rows would change this user's sessions or these sessions' messages."""
+        with self._cond:
+            for record in self._pending:
+                row = record["row"]
+                if record["table"] == SESSIONS_TABLE and user_id and row.get("user_id") == user_id:
+                    return True
+                if record["table"] == MESSAGES_TABLE and row.get("session_id") in session_ids:
+                    return True
+        return False
+
+    def flush(self) -> bool:
+        """
+        Sends everything queued so far. Returns True when nothing is left.
+        Rows that still fail after retries stay queued (and spooled); rows
+        the sink rejects for good are parked.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._pending)
+            if not batch:
+                return True
+
+            done = set()
+            for table in TABLE_ORDER:
+                records = [r for r in batch if r["table"] == table]
+                for i in range(0, len(records), self.max_batch):
+                    chunk = records[i:i + self.max_batch]
+                    if not self._insert_with_retry(table, [r["row"] for r in chunk]):
+                        break
+                    done.update(id(r) for r in chunk)
+                else:
+                    continue
+                break  # a failed table stops the flush; later tables may depend on it
+
+            with self._cond:
+                self._pending = [r for r in self._pending if id(r) not in done]
+                self._rewrite_spool()
+                return not self._pending
+
+    def close(self):
+        """Stops the background thread and makes a final flush attempt."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            worker.join(timeout=self.flush_interval + 5)
+        if not self.flush():
+            print(f"⚠️ {self.pending()} chat rows left in {self.spool_path} for the next start")
+
+    # ---------------------------------------------------------
+    # INTERNALS
+    # ---------------------------------------------------------
+    def _insert_with_retry(self, table: str, rows: List[dict]) -> bool:
+        """True once the rows have left the queue: inserted, or parked as permanently rejected."""
+        is_permanent = getattr(self.store, "is_permanent", None)
+        for attempt in range(self.retries + 1):
+            try:
+                self.store.insert(table, rows)
+                return True
+            except Exception as e:
+                if is_permanent is not None and is_permanent(e):
+                    self._park(table, rows, e)
+                    return True
+                if attempt == self.retries:
+                    print(f"⚠️ Chat history insert into {table} failed ({len(rows)} rows): {e}")
+                    return False
+                time.sleep(min(0.2 * (2 ** attempt), 5.0))
+        return False
+
+    def _park(self, table: str, rows: List[dict], error: Exception):
+        print(f"❌ Chat history insert into {table} rejected ({len(rows)} rows parked in {self.parked_path}): {error}")
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            with open(self.parked_path, "a") as f:
+                for row in rows:
+                    f.write(json.dumps({"table": table, "row": row, "error": str(error)}, default=str) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write parked chat rows: {e}")
+
+    def _ensure_started(self):
+        # Called with self._cond held
+        if self._worker is not None and self._worker.is_alive():
+            return
+        if self._worker is None:
+            self._recover_spools()
+        self._worker = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+                has_work = bool(self._pending)
+            if has_work:
+                self.flush()
+
+    def _append_spool(self, records: List[dict]):
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            with open(self.spool_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write chat spool: {e}")
+
+    def _rewrite_spool(self):
+        # Called with self._cond held: no append can interleave
+        try:
+            if not self._pending:
+                if os.path.exists(self.spool_path):
+                    os.remove(self.spool_path)
+                return
+            tmp_path = self.spool_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for record in self._pending:
+                    f.write(json.dumps(record, default=str) + "\n")
+            os.replace(tmp_path, self.spool_path)
+        except OSError as e:
+            print(f"⚠️ Could not rewrite chat spool: {e}")
+
+    @staticmethod
+    def _read_spool(path: str) -> List[dict]:
+        records = []
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass  # torn last line from a crash
+        except OSError:
+            pass
+        return records
+
+    def _recover_spools(self):
+        """
+        Loads rows a previous process left unsent: our own spool (same pid
+        after a container restart) and those of processes that no longer run.
+        """
+        recovered = self._read_spool(self.spool_path)
+        self._pending.extend(recovered)
+
+        my_pid = os.getpid()
+        for path in glob.glob(os.path.join(self.spool_dir, "chat_spool.*.jsonl")):
+            try:
+                owner = int(os.path.basename(path).split(".")[1])
+            except (IndexError, ValueError):
+                continue
+            if owner == my_pid or _pid_alive(owner):
+                continue
+            # rename() is atomic: only one live worker adopts each orphan
+            claimed = os.path.join(self.spool_dir, f"chat_spool.{my_pid}.from{owner}.jsonl")
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            records = self._read_spool(claimed)
+            self._append_spool(records)
+            self._pending.extend(records)
+            recovered.extend(records)
+            os.remove(claimed)
+
+        if recovered:
+            print(f"📼 Recovered {len(recovered)} unsent chat rows from spool")
+            self._cond.notify()
+
+
+# ---------------------------------------------------------
+# SINGLETON (created on first use: the sink may open the DB)
+# ---------------------------------------------------------
+_writer: Optional[ChatHistoryWriter] = None
+_writer_lock = threading.Lock()
+_writer_resolved = False
+
+def get_history_writer() -> Optional[ChatHistoryWriter]:
+    """The process-wide writer, or None when no chat-history sink is configured."""
+    global _writer, _writer_resolved
+    if not _writer_resolved:
+        with _writer_lock:
+            if not _writer_resolved:
+                store = create_chat_store()
+                _writer = ChatHistoryWriter(store) if store else None
+                _writer_resolved = True
+    return _writer
+
+def shutdown_history_writer():
+    if _writer is not None:
+        _writer.close()
@@ -1,4 +1,6 @@
+import uuid
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 from datetime import datetime
 
@@ -17,14 +19,77 @@ class Chunk(SQLModel, table=True):
     start_line: Optional[int] = Field(default=None) 
     end_line: Optional[int] = Field(default=None)
     
-    content: str 
+    # Text lives in the chunk store (chunk_store.py); rows written before it
+    # existed still carry it here
+    content: str = Field(default="")
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# --- DUPLICATE LOCATIONS (see core/dedup.py) ---
+
+class ChunkLocation(SQLModel, table=True):
+    __tablename__ = "chunk_locations"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # The embedded representative this copy was collapsed into
+    chunk_id: int = Field(index=True)
+    file_name: str
+    file_path: str = Field(index=True)
+    start_line: Optional[int] = Field(default=None)
+    end_line: Optional[int] = Field(default=None)
+
+# --- SYMBOL TABLE (Definitions + Call Sites) ---
+
+class Symbol(SQLModel, table=True):
+    __tablename__ = "symbols"
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    name: str = Field(index=True)            # e.g. "search"
+    qualified_name: str = Field(index=True)  # e.g. "VectorStore.search"
+
+    # "class", "function", "method" or "call"
+    kind: str = Field(index=True)
+
+    file_name: str
+    file_path: str
+    start_line: int
+    end_line: int
+
+    # The code chunk that holds this symbol (definitions only)
+    chunk_id: Optional[int] = Field(default=None)
+
+# --- INCREMENTAL SYNC (see core/sync.py) ---
+
+class IngestedFile(SQLModel, table=True):
+    __tablename__ = "ingested_files"
+    path: str = Field(primary_key=True)       # absolute path on disk
+    display_path: str = Field(index=True)     # Chunk.file_path / Symbol.file_path of its rows
+    digest: str                               # sha1 of the text that was indexed
+    size: int
+    mtime_ns: int
+    # Extractive file summary for the hierarchical index (see core/summaries.py)
+    summary: str = Field(default="")
+
+class RepoState(SQLModel, table=True):
+    __tablename__ = "repo_state"
+    key: str = Field(default="current", primary_key=True)
+    source: str                               # what /ingest was given (path or git URL)
+    root: str                                 # the directory that was scanned
+    commit: Optional[str] = Field(default=None)  # HEAD at the last ingest/sync (git repos)
+    synced_at: datetime = Field(default_factory=datetime.utcnow)
+
+# --- CENTRAL ID ALLOCATION (see core/coordination.py) ---
+
+class IdCounter(SQLModel, table=True):
+    __tablename__ = "id_counters"
+    name: str = Field(primary_key=True)
+    next_id: int = Field(default=0)
+
 # --- NEW MODELS FOR CHAT HISTORY ---
 
 class ChatSession(SQLModel, table=True):
     __tablename__ = "chat_sessions"
+    # Keyset pagination of a user's sessions, newest first
+    __table_args__ = (Index("ix_chat_sessions_user_created", "user_id", "created_at"),)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     user_id: str = Field(index=True)
     title: Optional[str] = None
@@ -32,7 +97,10 @@ class ChatSession(SQLModel, table=True):
 
 class ChatMessage(SQLModel, table=True):
     __tablename__ = "chat_messages"
+    __table_args__ = (Index("ix_chat_messages_session_created", "session_id", "created_at"),)
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Generated by /chat: makes inserts idempotent when the writer retries
+    client_id: Optional[str] = Field(default=None, unique=True, index=True)
     session_id: str = Field(foreign_key="chat_sessions.id", index=True)
     role: str # "user" or "assistant"
     content: str
@@ -1,21 +1,58 @@
 # session.py
 from sqlmodel import create_engine, SQLModel, Session
+from sqlalchemy.exc import OperationalError
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+
+try:
+    from supabase import create_client, Client
+except ImportError:  # batch jobs (app/cli.py) don't need it installed
+    create_client, Client = None, None
 
 # ==========================================
 # 1. SQLITE SETUP (Existing Logic Preserved)
 # ==========================================
 
 # This creates 'assistant.db' in the backend root folder
-sqlite_file_name = "assistant.db"
+# (SQLITE_PATH points it elsewhere, e.g. one database per CLI ingestion)
+sqlite_file_name = os.getenv("SQLITE_PATH", "assistant.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
 engine = create_engine(sqlite_url)
 
+# SQLite connections must not cross fork() (pre-fork server, app/server.py):
+# a child drops the pooled connections it inherited, without closing them
+# under the parent, and opens its own
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+# Columns added to tables after their first release. create_all() never alters
+# an existing table, so older databases get them here: (table, column, type,
+# statement to run once the column exists)
+ADDED_COLUMNS = [
+    ("chat_messages", "client_id", "VARCHAR",
+     "CREATE UNIQUE INDEX IF NOT EXISTS ix_chat_messages_client_id ON chat_messages (client_id)"),
+    ("ingested_files", "summary", "VARCHAR NOT NULL DEFAULT ''", None),
+]
+
+def _add_missing_columns():
+    with engine.begin() as connection:
+        for table, column, column_type, then in ADDED_COLUMNS:
+            existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if existing and column not in existing:
+                try:
+                    connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                except OperationalError as e:
+                    if "duplicate column" not in str(e).lower():  # another process was first
+                        raise
+                print(f"🛠️ Added column {table}.{column}")
+            if then:
+                connection.exec_driver_sql(then)
+
 def init_db():
+    from app.db import models  # noqa: F401  (registers every table on the metadata)
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
 
 # ==========================================
 # 2. SUPABASE SETUP (New Addition)
@@ -28,7 +65,9 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 supabase: Client = None
 
-if SUPABASE_URL and SUPABASE_KEY:
+if create_client is None:
+    print("⚠️ Warning: supabase package not installed. Chat history features will be disabled.")
+elif SUPABASE_URL and SUPABASE_KEY:
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         print("✅ Supabase client initialized successfully.")
@@ -1,7 +1,15 @@
+import os
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import endpoints
 from app.db.session import init_db  # <--- Import the DB init function
+from app.core.lazy import warm_up, readiness
+from app.db.history_writer import shutdown_history_writer, get_history_writer
+from app.core import metrics
+from app.core.embedding_executor import embedding_executor
+from app.core.sync import repo_watcher
+from app.core.snapshot import autoload_snapshot
 
 app = FastAPI(title="Codebase Assistant API")
 
@@ -28,7 +36,33 @@ app.add_middleware(
 # 🔥 CRITICAL: Initialize Database on Startup
 @app.on_event("startup")
 def on_startup():
-    init_db()
+    # Pre-fork workers (app/server.py): the master created the tables, and
+    # once-per-server work runs in worker slot 0 only
+    prefork_slot = os.getenv("PREFORK_WORKER")
+    if prefork_slot is None:
+        init_db()
+
+    # Serving nodes can start from a snapshot built elsewhere (SNAPSHOT_AUTOLOAD)
+    if prefork_slot in (None, "0"):
+        autoload_snapshot()
+
+    # Models and clients load lazily; optionally start loading them in the
+    # background so the first request doesn't pay for it.
+    # WARMUP_COMPONENTS: "all" (default), "none", or e.g. "embedder,reranker"
+    warmup = os.getenv("WARMUP_COMPONENTS", "all").strip().lower()
+    if warmup != "none":
+        names = None if warmup == "all" else [n.strip() for n in warmup.split(",") if n.strip()]
+        warm_up(names, background=True)
+
+    # Incremental re-indexing of the ingested tree (SYNC_WATCH_INTERVAL_S > 0)
+    if prefork_slot in (None, "0"):
+        repo_watcher.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Push queued chat history out before exiting (leftovers stay spooled)
+    shutdown_history_writer()
+    repo_watcher.stop()
 
 # Include the router containing all your endpoints (Chat, Ingest, WebSocket)
 app.include_router(endpoints.router)
@@ -37,6 +71,26 @@ app.include_router(endpoints.router)
 def read_root():
     return {"status": "online"}
 
+@app.get("/ready")
+def read_ready():
+    """
+    Readiness probe: per-component load state and timing.
+    Returns 503 until every heavy component has loaded.
+    """
+    report = readiness()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Prometheus text format: stage latencies, candidate counts, caches, tokens, queues."""
+    pending = embedding_executor.pending()
+    metrics.queue_depth.set(pending["query"], queue="embed_query")
+    metrics.queue_depth.set(pending["ingest"], queue="embed_ingest")
+    writer = get_history_writer()
+    if writer is not None:
+        metrics.queue_depth.set(writer.pending(), queue="chat_history")
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
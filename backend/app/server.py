@@ -0,0 +1,133 @@
+#server.py
+"""
+Multi-worker (pre-fork) serving mode.
+
+The master process loads the embedding model, the reranker and (for the local
+backend) the memory-mapped vector index once, then forks N uvicorn workers that
+share those pages copy-on-write instead of each loading its own copy.
+Network clients (Pinecone, Gemini, Supabase) are created per worker after the
+fork, and ingestion stays single-writer through coordination.ingestion_lock().
+Workers see PREFORK_WORKER=<slot>: the master has created the tables, and only
+slot 0 runs the once-per-server startup work (snapshot autoload, repo watcher).
+
+Usage (from backend/):
+    python -m app.server --workers 4 --port 8000
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+
+# Single-threaded ONNX sessions have no thread pool to lose across fork()
+os.environ.setdefault("ONNX_THREADS", "1")
+
+import uvicorn
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _run_worker(app, sock: socket.socket, log_level: str):
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        # Never fall back into the master's supervision loop
+        os._exit(0)
+
+def _preload_components() -> list:
+    from app.core.vector_store import VECTOR_BACKEND
+    default = "embedder,reranker" + (",vector_store" if VECTOR_BACKEND == "local" else "")
+    return [n.strip() for n in os.getenv("PREFORK_PRELOAD", default).split(",") if n.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked workers sharing loaded models.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("❌ Pre-fork mode needs os.fork(); run uvicorn directly on this platform.")
+        return 1
+
+    from app.main import app
+    from app.core.lazy import warm_up
+    from app.db.session import init_db
+
+    # Create tables once here; workers skip init_db in their startup hook
+    # (the pooled SQLite connection this opens is dropped in each child, see session.py)
+    init_db()
+
+    # 1. Load shared, read-only state ONCE in the master
+    print(f"🧠 Preloading {', '.join(_preload_components())} before forking...")
+    warm_up(_preload_components(), background=False)
+
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the workers don't write to (and un-share) these pages
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind_socket(args.host, args.port)
+    print(f"🚀 Serving on {args.host}:{args.port} with {args.workers} workers")
+
+    children = {}
+    shutting_down = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.environ["PREFORK_WORKER"] = str(slot)
+            _run_worker(app, sock, args.log_level)
+        children[pid] = (time.time(), slot)
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for slot in range(args.workers):
+        spawn(slot)
+
+    # 2. Supervise: restart crashed workers until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        child = children.pop(pid, None)
+        if child is None or shutting_down:
+            continue
+        started, slot = child
+        print(f"⚠️ Worker {pid} exited with status {status}, restarting...")
+        if time.time() - started < 1:
+            time.sleep(1)  # don't spin on a worker that crashes at boot
+        spawn(slot)  # same slot: slot 0 keeps the repo watcher
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
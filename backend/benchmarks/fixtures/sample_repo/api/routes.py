@@ -0,0 +1,36 @@
+from auth.tokens import verify_token
+from inventory.models import Inventory
+from orders.checkout import CheckoutError, create_order
+from utils.cache import LRUCache
+
+inventory = Inventory()
+search_cache = LRUCache(capacity=256)
+
+
+def handle_search(query: str) -> dict:
+    """GET /search?q=... - cached title/author search."""
+    cached = search_cache.get(query)
+    if cached is not None:
+        return cached
+    result = {"results": [b.__dict__ for b in inventory.search_titles(query)]}
+    search_cache.put(query, result)
+    return result
+
+
+def handle_checkout(headers: dict, body: dict) -> tuple:
+    """POST /checkout - authenticates the bearer token, then places the order."""
+    try:
+        user_id = verify_token(headers.get("Authorization", "").removeprefix("Bearer "))
+    except ValueError as e:
+        return 401, {"error": str(e)}
+    try:
+        order = create_order(inventory, body["cart"], body["card_token"], body["email"],
+                             body.get("country", "US"), body.get("member", False))
+    except CheckoutError as e:
+        return 400, {"error": str(e)}
+    return 201, {"order": order, "user": user_id}
+
+
+def handle_low_stock_report() -> dict:
+    """GET /admin/low-stock - books that need restocking."""
+    return {"books": [{"isbn": b.isbn, "stock": b.stock} for b in inventory.low_stock()]}
@@ -0,0 +1,41 @@
+import hashlib
+import hmac
+import os
+import time
+import base64
+import json
+
+SECRET = os.environ.get("BOOKSHOP_SECRET", "dev-secret").encode()
+TOKEN_TTL_SECONDS = 3600
+
+
+def hash_password(password: str, salt: bytes = None) -> str:
+    """PBKDF2-SHA256 password hash stored as salt$hash."""
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 200_000)
+    return salt.hex() + "$" + digest.hex()
+
+
+def check_password(password: str, stored: str) -> bool:
+    salt_hex, _ = stored.split("$", 1)
+    return hmac.compare_digest(hash_password(password, bytes.fromhex(salt_hex)), stored)
+
+
+def issue_token(user_id: str) -> str:
+    """Signed session token that expires after TOKEN_TTL_SECONDS."""
+    payload = json.dumps({"sub": user_id, "exp": int(time.time()) + TOKEN_TTL_SECONDS}).encode()
+    signature = hmac.new(SECRET, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(payload).decode() + "." + base64.urlsafe_b64encode(signature).decode()
+
+
+def verify_token(token: str) -> str:
+    """Returns the user id of a valid token; raises ValueError if it is forged or expired."""
+    payload_b64, signature_b64 = token.split(".", 1)
+    payload = base64.urlsafe_b64decode(payload_b64)
+    expected = hmac.new(SECRET, payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature_b64)):
+        raise ValueError("bad signature")
+    claims = json.loads(payload)
+    if claims["exp"] < time.time():
+        raise ValueError("token expired")
+    return claims["sub"]
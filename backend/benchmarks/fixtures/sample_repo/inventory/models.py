@@ -0,0 +1,41 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class Book:
+    isbn: str
+    title: str
+    author: str
+    price_cents: int
+    stock: int = 0
+    tags: List[str] = field(default_factory=list)
+
+
+class Inventory:
+    """In-memory catalogue of books keyed by ISBN."""
+
+    def __init__(self):
+        self._books: Dict[str, Book] = {}
+
+    def add_book(self, book: Book) -> None:
+        if book.isbn in self._books:
+            self._books[book.isbn].stock += book.stock
+        else:
+            self._books[book.isbn] = book
+
+    def remove_stock(self, isbn: str, quantity: int) -> None:
+        book = self._books[isbn]
+        if book.stock < quantity:
+            raise ValueError(f"Only {book.stock} copies of {isbn} left")
+        book.stock -= quantity
+
+    def find_by_isbn(self, isbn: str) -> Optional[Book]:
+        return self._books.get(isbn)
+
+    def search_titles(self, text: str) -> List[Book]:
+        needle = text.lower()
+        return [b for b in self._books.values() if needle in b.title.lower() or needle in b.author.lower()]
+
+    def low_stock(self, threshold: int = 3) -> List[Book]:
+        return sorted((b for b in self._books.values() if b.stock <= threshold), key=lambda b: b.stock)
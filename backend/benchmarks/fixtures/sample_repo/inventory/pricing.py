@@ -0,0 +1,23 @@
+from typing import Iterable
+
+TAX_RATES = {"US": 0.07, "DE": 0.19, "FR": 0.20, "IN": 0.12}
+MEMBER_DISCOUNT = 0.10
+
+
+def apply_discount(price_cents: int, percent: float) -> int:
+    """Returns the price after a percentage discount, never below zero."""
+    if not 0 <= percent <= 100:
+        raise ValueError("discount percent must be between 0 and 100")
+    return max(0, round(price_cents * (1 - percent / 100)))
+
+
+def compute_tax(amount_cents: int, country: str) -> int:
+    """Sales tax for a country code; unknown countries pay no tax."""
+    return round(amount_cents * TAX_RATES.get(country.upper(), 0.0))
+
+
+def total_price(line_prices: Iterable[int], country: str, is_member: bool = False) -> int:
+    subtotal = sum(line_prices)
+    if is_member:
+        subtotal = apply_discount(subtotal, MEMBER_DISCOUNT * 100)
+    return subtotal + compute_tax(subtotal, country)
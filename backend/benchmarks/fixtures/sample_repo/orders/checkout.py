@@ -0,0 +1,49 @@
+import uuid
+from typing import Dict, List
+
+from inventory.models import Inventory
+from inventory.pricing import total_price
+from orders.notifications import send_order_email
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def validate_cart(inventory: Inventory, cart: Dict[str, int]) -> List[str]:
+    """Returns a list of problems (unknown ISBNs, not enough stock); empty if the cart is fine."""
+    problems = []
+    for isbn, quantity in cart.items():
+        book = inventory.find_by_isbn(isbn)
+        if book is None:
+            problems.append(f"unknown book {isbn}")
+        elif book.stock < quantity:
+            problems.append(f"only {book.stock} left of {book.title}")
+    return problems
+
+
+def charge_payment(card_token: str, amount_cents: int) -> str:
+    """Charges the card through the payment gateway and returns a transaction id."""
+    if not card_token.startswith("tok_"):
+        raise CheckoutError("invalid card token")
+    if amount_cents <= 0:
+        raise CheckoutError("nothing to charge")
+    return f"txn_{uuid.uuid4().hex[:12]}"
+
+
+def create_order(inventory: Inventory, cart: Dict[str, int], card_token: str,
+                 email: str, country: str, is_member: bool = False) -> dict:
+    problems = validate_cart(inventory, cart)
+    if problems:
+        raise CheckoutError("; ".join(problems))
+
+    prices = [inventory.find_by_isbn(isbn).price_cents * qty for isbn, qty in cart.items()]
+    amount = total_price(prices, country, is_member)
+    transaction_id = charge_payment(card_token, amount)
+
+    for isbn, qty in cart.items():
+        inventory.remove_stock(isbn, qty)
+
+    order = {"id": uuid.uuid4().hex, "items": cart, "amount_cents": amount, "transaction": transaction_id}
+    send_order_email(email, order)
+    return order
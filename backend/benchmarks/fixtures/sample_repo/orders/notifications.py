@@ -0,0 +1,29 @@
+import smtplib
+from email.message import EmailMessage
+
+SENDER = "orders@bookshop.example"
+
+ORDER_TEMPLATE = """Thanks for your order {id}!
+
+Items: {item_count}
+Total: ${amount:.2f}
+"""
+
+
+def render_template(order: dict) -> str:
+    return ORDER_TEMPLATE.format(
+        id=order["id"],
+        item_count=sum(order["items"].values()),
+        amount=order["amount_cents"] / 100,
+    )
+
+
+def send_order_email(to_address: str, order: dict, host: str = "localhost") -> None:
+    """Sends the order confirmation email over SMTP."""
+    message = EmailMessage()
+    message["From"] = SENDER
+    message["To"] = to_address
+    message["Subject"] = f"Order {order['id']} confirmed"
+    message.set_content(render_template(order))
+    with smtplib.SMTP(host) as smtp:
+        smtp.send_message(message)
@@ -0,0 +1,21 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Least-recently-used cache with a fixed number of entries."""
+
+    def __init__(self, capacity: int = 128):
+        self.capacity = capacity
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
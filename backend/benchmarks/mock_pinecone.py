@@ -0,0 +1,255 @@
+"""
+Local mock of the Pinecone data-plane REST API, for exercising the upsert
+pipeline (vector_store.PineconeIndexWrapper) without a cloud index.
+
+Implements the calls the app makes: POST /vectors/upsert, POST /query (with
+$eq/$in metadata filters), POST /vectors/update, POST /vectors/delete,
+GET /vectors/fetch and /describe_index_stats, plus GET /_stats with what the
+server saw (requests, injected failures, peak concurrency, largest body,
+fetched vectors).
+Faults can be injected to check retries and batching:
+
+    --fail-rate 0.2     answer that fraction of upserts with 429/503
+    --fail-statuses 429 only with these statuses (the client itself retries 5xx)
+    --latency-ms 50     delay every upsert (makes concurrency visible)
+    --max-body 2097152  reject bodies above this size with 413, like Pinecone
+
+Run it and point the app at it:
+    python benchmarks/mock_pinecone.py --port 5081
+    PINECONE_HOST=http://localhost:5081 PINECONE_API_KEY=mock uvicorn app.main:app
+
+or let it check the wrapper end to end (exit code 1 on failure):
+    python benchmarks/mock_pinecone.py --self-test --fail-rate 0.2 --latency-ms 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MockIndex:
+    def __init__(self, fail_rate=0.0, latency_ms=0.0, max_body=2 * 1024 * 1024, seed=0,
+                 fail_statuses=(429, 503)):
+        self.fail_rate = fail_rate
+        self.fail_statuses = tuple(fail_statuses)
+        self.latency = latency_ms / 1000.0
+        self.max_body = max_body
+        self.vectors = {}
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.stats = {"upsert_requests": 0, "upserted": 0, "injected_failures": 0,
+                      "rejected_too_large": 0, "in_flight": 0, "max_in_flight": 0, "max_body_bytes": 0,
+                      "queries": 0, "fetched": 0}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def upsert(self, body: dict, size: int):
+        with self.lock:
+            self.stats["upsert_requests"] += 1
+            self.stats["max_body_bytes"] = max(self.stats["max_body_bytes"], size)
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            fail = self.random.random() < self.fail_rate
+        try:
+            time.sleep(self.latency)
+            if size > self.max_body:
+                self.count("rejected_too_large")
+                return 413, {"code": 3, "message": f"Request size {size} exceeds the limit"}
+            if fail:
+                self.count("injected_failures")
+                return self.random.choice(self.fail_statuses), {"code": 8, "message": "Injected failure"}
+            with self.lock:
+                for record in body.get("vectors", []):
+                    self.vectors[record["id"]] = (np.asarray(record["values"], dtype=np.float32),
+                                                  record.get("metadata") or {})
+                self.stats["upserted"] += len(body.get("vectors", []))
+            return 200, {"upsertedCount": len(body.get("vectors", []))}
+        finally:
+            self.count("in_flight", -1)
+
+    @staticmethod
+    def _matches(metadata: dict, flt: dict) -> bool:
+        for field, condition in (flt or {}).items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(field)
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        return True
+
+    def query(self, body: dict):
+        self.count("queries")
+        with self.lock:
+            items = [item for item in self.vectors.items() if self._matches(item[1][1], body.get("filter"))]
+        if not items:
+            return 200, {"matches": [], "namespace": ""}
+        query = np.asarray(body["vector"], dtype=np.float32)
+        matrix = np.stack([v for _, (v, _) in items])
+        scores = matrix @ query / np.maximum(np.linalg.norm(matrix, axis=1) * np.linalg.norm(query), 1e-12)
+        top = np.argsort(-scores)[:body.get("topK", 10)]
+        matches = []
+        for i in top:
+            match = {"id": items[i][0], "score": float(scores[i])}
+            if body.get("includeMetadata"):
+                match["metadata"] = items[i][1][1]
+            matches.append(match)
+        return 200, {"matches": matches, "namespace": ""}
+
+    def update(self, body: dict):
+        with self.lock:
+            if body["id"] not in self.vectors:
+                return 404, {"message": f"Vector {body['id']} not found"}
+            values, metadata = self.vectors[body["id"]]
+            self.vectors[body["id"]] = (values, {**metadata, **(body.get("setMetadata") or {})})
+        return 200, {}
+
+    def delete(self, body: dict):
+        with self.lock:
+            if body.get("deleteAll"):
+                self.vectors.clear()
+            for uid in body.get("ids", []):
+                self.vectors.pop(uid, None)
+        return 200, {}
+
+    def fetch(self, ids):
+        with self.lock:
+            found = {uid: self.vectors[uid] for uid in ids if uid in self.vectors}
+            self.stats["fetched"] += len(found)
+        return 200, {"vectors": {uid: {"id": uid, "values": values.tolist(), "metadata": metadata}
+                                 for uid, (values, metadata) in found.items()}, "namespace": ""}
+
+    def describe(self):
+        with self.lock:
+            total = len(self.vectors)
+        return 200, {"namespaces": {"": {"vectorCount": total}} if total else {},
+                     "dimension": 384, "indexFullness": 0.0, "totalVectorCount": total}
+
+
+def make_handler(index: MockIndex):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload):
+            raw = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path.startswith("/describe_index_stats"):
+                return self._reply(*index.describe())
+            if self.path.startswith("/vectors/fetch"):
+                return self._reply(*index.fetch(parse_qs(urlparse(self.path).query).get("ids", [])))
+            if self.path == "/_stats":
+                with index.lock:
+                    return self._reply(200, dict(index.stats, stored=len(index.vectors)))
+            self._reply(404, {"message": "Not found"})
+
+        def do_POST(self):
+            size = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(size) or b"{}")
+            if self.path == "/vectors/upsert":
+                return self._reply(*index.upsert(body, size))
+            if self.path == "/query":
+                return self._reply(*index.query(body))
+            if self.path == "/vectors/update":
+                return self._reply(*index.update(body))
+            if self.path == "/vectors/delete":
+                return self._reply(*index.delete(body))
+            if self.path.startswith("/describe_index_stats"):
+                return self._reply(*index.describe())
+            self._reply(404, {"message": "Not found"})
+
+    return Handler
+
+def serve(index: MockIndex, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(index))
+    threading.Thread(target=server.serve_forever, name="mock-pinecone", daemon=True).start()
+    return server
+
+
+# ---------------------------------------------------------
+# SELF TEST: the real wrapper against this server
+# ---------------------------------------------------------
+def self_test(index: MockIndex, port: int, rows: int) -> int:
+    os.environ["PINECONE_HOST"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("PINECONE_API_KEY", "mock")
+    os.environ.setdefault("PINECONE_UPSERT_BACKOFF_S", "0.05")
+    os.environ["VECTOR_BACKEND"] = "pinecone"
+    os.environ["WARMUP_COMPONENTS"] = "none"
+    sys.path.insert(0, BACKEND_DIR)
+    from app.core.vector_store import VectorStore
+
+    store = VectorStore()
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((rows, 384)).astype(np.float32)
+    # Large metadata forces size-based splits below the vector-count limit
+    metadatas = [{"file_name": f"f{i}.py", "content": "x" * rng.integers(100, 4000)} for i in range(rows)]
+
+    start = time.perf_counter()
+    store.add_vectors(vectors, metadatas, ids=list(range(1000, 1000 + rows)))
+    elapsed = time.perf_counter() - start
+    _, found = store.search(vectors[5], k=1)
+    _, subset = store.search_subset(vectors[5], [1003, 1005, 1007], k=1)
+
+    stats = dict(index.stats, stored=len(index.vectors))
+    print(f"Upserted {rows} vectors in {elapsed:.2f}s: {json.dumps(stats)}")
+    checks = {
+        "every vector stored": stats["stored"] == rows,
+        "ids kept": set(index.vectors) == {str(i) for i in range(1000, 1000 + rows)},
+        "no request over the size limit": stats["rejected_too_large"] == 0,
+        "requests ran concurrently": stats["max_in_flight"] > 1 or stats["upsert_requests"] == 1,
+        "query finds the vector": int(found[0][0]) == 1005,
+        "subset search finds the vector": int(subset[0][0]) == 1005,
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return 0 if all(checks.values()) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=5081)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--max-body", type=int, default=2 * 1024 * 1024)
+    parser.add_argument("--fail-statuses", type=int, nargs="+", default=[429, 503])
+    parser.add_argument("--seed", type=int, default=7, help="seed for the injected failures")
+    parser.add_argument("--self-test", action="store_true", help="upsert through the app's wrapper and verify")
+    parser.add_argument("--rows", type=int, default=2000, help="vectors upserted by --self-test")
+    args = parser.parse_args()
+
+    index = MockIndex(args.fail_rate, args.latency_ms, args.max_body, args.seed, args.fail_statuses)
+    server = serve(index, args.port)
+    if args.self_test:
+        try:
+            return self_test(index, args.port, args.rows)
+        finally:
+            server.shutdown()
+
+    print(f"🌲 Mock Pinecone index on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
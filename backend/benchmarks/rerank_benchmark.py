@@ -0,0 +1,112 @@
+"""
+Latency / quality benchmark for the reranking stage.
+
+Runs a fixed question set against the currently ingested codebase and compares
+the adaptive Reranker configurations with the old behaviour (all 50 candidates,
+full passages, MiniLM-L-12). Quality is measured as overlap@5 with that baseline.
+
+Usage (from backend/):
+    python benchmarks/rerank_benchmark.py
+    python benchmarks/rerank_benchmark.py --concurrency 8
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.getcwd())
+
+from flashrank import Ranker, RerankRequest
+from app.core.embedder import embedder
+from app.core.chunk_store import chunk_store
+from app.core.reranker import Reranker, RERANK_CACHE_DIR
+
+QUESTIONS = [
+    "How does ingestion store vectors and metadata?",
+    "Where is the git commit history processed?",
+    "How are search results re-ranked?",
+    "How does the parser split Python files into functions?",
+    "Which files are ignored by the directory scanner?",
+    "How is the chat history saved for a user?",
+    "How is the answer generated from the retrieved context?",
+    "How are dependencies of the top results expanded?",
+    "How does the websocket report ingestion progress?",
+    "Where is the vector index reset before a new ingestion?",
+]
+
+TOP_K = 5
+
+CONFIGS = {
+    "adaptive (depth 20)": dict(depth=20),
+    "adaptive (depth 10)": dict(depth=10),
+    "two-stage TinyBERT -> MiniLM": dict(depth=30, first_stage_model="ms-marco-TinyBERT-L-2-v2", first_stage_keep=10),
+    "TinyBERT only": dict(depth=20, model_name="ms-marco-TinyBERT-L-2-v2"),
+}
+
+
+def load_candidates(question):
+    # Hits are passed through as-is: RERANK_MAX_PER_FILE needs each passage's "meta"
+    return chunk_store.search(embedder.embed_text(question), k=50)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per question")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel requests (exercises batching)")
+    args = parser.parse_args()
+
+    print("Loading candidates...")
+    candidates = {q: load_candidates(q) for q in QUESTIONS}
+    candidates = {q: c for q, c in candidates.items() if c[0]}
+    if not candidates:
+        print("No candidates found. Ingest a codebase first.")
+        return 1
+
+    # --- Baseline: the old rag.py behaviour ---
+    baseline_ranker = Ranker(model_name="ms-marco-MiniLM-L-12-v2", cache_dir=RERANK_CACHE_DIR)
+    baseline_top = {}
+    baseline_latency = []
+    for q, (passages, _) in candidates.items():
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            ranked = baseline_ranker.rerank(RerankRequest(query=q, passages=[dict(p) for p in passages]))
+            baseline_latency.append((time.perf_counter() - start) * 1000)
+        baseline_top[q] = {r["id"] for r in ranked[:TOP_K]}
+
+    rows = [("baseline (50 x full, MiniLM-L-12)", baseline_latency, 1.0)]
+
+    for name, kwargs in CONFIGS.items():
+        reranker = Reranker(**kwargs)
+        latencies = []
+        overlaps = []
+
+        def run(q):
+            passages, scores = candidates[q]
+            start = time.perf_counter()
+            ranked = reranker.rerank(q, passages, vector_scores=scores, top_k=TOP_K)
+            elapsed = (time.perf_counter() - start) * 1000
+            overlap = len({r["id"] for r in ranked[:TOP_K]} & baseline_top[q]) / TOP_K
+            return elapsed, overlap
+
+        work = [q for q in candidates for _ in range(args.repeat)]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for elapsed, overlap in pool.map(run, work):
+                latencies.append(elapsed)
+                overlaps.append(overlap)
+        rows.append((name, latencies, statistics.mean(overlaps)))
+
+    print(f"\n{'config':<36} {'p50 ms':>8} {'p95 ms':>8} {'overlap@5':>10}")
+    for name, latencies, quality in rows:
+        print(f"{name:<36} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} {quality:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Offline retrieval benchmark and regression check.
+
+Ingests the pinned fixture repo (benchmarks/fixtures/sample_repo) into a
+throwaway data directory with the local vector backend, then runs the labelled
+questions in benchmarks/fixtures/questions.json through generate_rag_response
+with a stub LLM. No Pinecone, Gemini or Supabase is touched; the embedding and
+reranking models are the real ones.
+
+Reports:
+- quality: recall@1/3/5 and MRR (a context item is relevant when it comes from
+  the labelled file and defines the labelled symbol);
+- latency: p50/p95/p99 per RAG stage and end to end;
+- ingestion: files/s, chunks/s and peak RSS;
+and compares them with the stored baseline (benchmarks/baselines/retrieval.json).
+
+Usage (from backend/):
+    python benchmarks/retrieval_benchmark.py
+    python benchmarks/retrieval_benchmark.py --save-baseline
+    python benchmarks/retrieval_benchmark.py --fail-on-regression --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+FIXTURE_REPO = os.path.join(BENCH_DIR, "fixtures", "sample_repo")
+QUESTIONS_FILE = os.path.join(BENCH_DIR, "fixtures", "questions.json")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baselines", "retrieval.json")
+
+RECALL_AT = (1, 3, 5)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class StubLLM:
+    """Stands in for Gemini: generation cost and network are out of scope."""
+
+    def generate_answer(self, context, question, history=None):
+        return f"(stub answer, {len(context)} chars of context)"
+
+
+def isolate(workdir):
+    """
+    Points every store at `workdir`. Must run before any app import: data
+    paths and the vector backend are read at import time.
+    """
+    os.environ["CODEMIND_DATA_DIR"] = workdir
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["CHAT_HISTORY_SINK"] = "none"
+    os.environ["WARMUP_COMPONENTS"] = "none"
+    os.chdir(workdir)  # assistant.db is created in the working directory
+    sys.path.insert(0, BACKEND_DIR)
+
+
+# ---------------------------------------------------------
+# 1. INGESTION
+# ---------------------------------------------------------
+def run_ingestion(repo_path):
+    from sqlmodel import Session, select, func
+    from app.core.ingestion import ingest_codebase_generator
+    from app.db.session import engine
+    from app.db.models import Chunk
+
+    files = 0
+    timings = {}
+    start = time.perf_counter()
+    for update in ingest_codebase_generator(repo_path):
+        if update.get("status") == "error":
+            raise RuntimeError(update["message"])
+        if update.get("status") == "info":
+            files = update.get("total_files", 0)
+        if update.get("status") == "complete":
+            timings = update.get("timings_ms", {})
+    elapsed = time.perf_counter() - start
+
+    with Session(engine) as session:
+        chunks = session.exec(select(func.count()).select_from(Chunk)).one()
+
+    return {
+        "seconds": round(elapsed, 3),
+        "files": files,
+        "chunks": chunks,
+        "files_per_s": round(files / elapsed, 2) if elapsed else None,
+        "chunks_per_s": round(chunks / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stage_ms": timings,
+    }
+
+
+# ---------------------------------------------------------
+# 2. QUESTIONS
+# ---------------------------------------------------------
+def is_relevant(item, target):
+    return item["file"] == target["file"] and f"def {target['symbol']}(" in item["code"]
+
+def first_relevant_rank(context, targets):
+    primary = [c for c in context if c.get("lines") != "Dependency"]
+    for rank, item in enumerate(primary, start=1):
+        if any(is_relevant(item, t) for t in targets):
+            return rank, primary
+    return None, primary
+
+def run_questions(questions, repeat):
+    from app.core import metrics, rag
+    rag.llm_client = StubLLM()
+
+    per_question = []
+    stage_ms = {}
+    total_ms = []
+    for case in questions:
+        ranks = []
+        for _ in range(repeat):
+            with metrics.trace("benchmark") as t:
+                result = rag.generate_rag_response(case["question"])
+            trace = t.to_dict()
+            total_ms.append(trace["total_ms"])
+            for s in trace["spans"]:
+                stage_ms.setdefault(s["stage"], []).append(s["ms"])
+            rank, primary = first_relevant_rank(result.get("context", []), case["relevant"])
+            ranks.append(rank)
+
+        # Retrieval is deterministic: score the last run, time all of them
+        found = {
+            k: sum(any(is_relevant(item, t) for item in primary[:k]) for t in case["relevant"]) / len(case["relevant"])
+            for k in RECALL_AT
+        }
+        per_question.append({"question": case["question"], "rank": ranks[-1], "recall": found})
+
+    quality = {f"recall@{k}": round(sum(q["recall"][k] for q in per_question) / len(per_question), 4) for k in RECALL_AT}
+    quality["mrr"] = round(sum(1 / q["rank"] for q in per_question if q["rank"]) / len(per_question), 4)
+
+    latency = {"total": _percentiles(total_ms)}
+    for stage, values in stage_ms.items():
+        latency[stage] = _percentiles(values)
+
+    return quality, latency, per_question
+
+def _percentiles(values):
+    return {f"p{p}": round(percentile(values, p), 2) for p in (50, 95, 99)}
+
+
+# ---------------------------------------------------------
+# 3. BASELINE COMPARISON
+# ---------------------------------------------------------
+def compare(report, baseline, quality_tolerance, latency_tolerance):
+    """Prints current vs baseline; returns the list of regressions."""
+    rows = []
+    regressions = []
+
+    for name, value in report["quality"].items():
+        base = baseline["quality"].get(name)
+        rows.append((name, base, value))
+        if base is not None and value < base - quality_tolerance:
+            regressions.append(f"{name} dropped {base:.3f} -> {value:.3f}")
+
+    for stage in ("total",) + tuple(sorted(k for k in report["latency"] if k != "total")):
+        value = report["latency"][stage]["p95"]
+        base = baseline["latency"].get(stage, {}).get("p95")
+        rows.append((f"{stage} p95 ms", base, value))
+        if stage == "total" and base and value > base * (1 + latency_tolerance):
+            regressions.append(f"total p95 latency rose {base:.1f} -> {value:.1f} ms")
+
+    for name in ("files_per_s", "chunks_per_s", "peak_rss_mb"):
+        value = report["ingestion"].get(name)
+        base = baseline["ingestion"].get(name)
+        rows.append((name, base, value))
+        if name == "files_per_s" and base and value and value < base * (1 - latency_tolerance):
+            regressions.append(f"ingestion throughput fell {base:.1f} -> {value:.1f} files/s")
+
+    print(f"\n{'metric':<28} {'baseline':>10} {'current':>10} {'delta':>9}")
+    for name, base, value in rows:
+        if base is None or value is None:
+            print(f"{name:<28} {'-':>10} {value if value is not None else '-':>10} {'':>9}")
+        else:
+            delta = f"{(value - base) / base * 100:+.1f}%" if base else ""
+            print(f"{name:<28} {base:>10.3f} {value:>10.3f} {delta:>9}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per question (latency samples)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if worse than the baseline")
+    parser.add_argument("--quality-tolerance", type=float, default=0.02, help="allowed absolute drop in recall/MRR")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25, help="allowed relative p95/throughput change")
+    parser.add_argument("--output", help="also write the full report as JSON here")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary data directory")
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE) as f:
+        questions = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix="codemind-bench-")
+    repo_path = os.path.join(workdir, "sample_repo")
+    shutil.copytree(FIXTURE_REPO, repo_path)
+    isolate(workdir)
+
+    try:
+        from app.core import rag  # noqa: F401  (registers the lazy components)
+        from app.core.lazy import warm_up, readiness
+
+        # Model loading is reported separately from steady-state throughput
+        print("🧠 Loading models...")
+        warm_up(["embedder", "reranker"], background=False)
+        components = readiness()["components"]
+        failed = [n for n in ("embedder", "reranker") if components[n]["state"] != "ready"]
+        if failed:
+            print(f"❌ Could not load {', '.join(failed)}: {components[failed[0]]['error']}")
+            return 2
+        load_seconds = {n: components[n]["load_seconds"] for n in ("embedder", "reranker")}
+
+        print(f"📥 Ingesting fixture repo ({repo_path})...")
+        ingestion = run_ingestion(repo_path)
+
+        print(f"❓ Running {len(questions)} questions x {args.repeat}...")
+        quality, latency, per_question = run_questions(questions, args.repeat)
+    finally:
+        os.chdir(BACKEND_DIR)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "repeat": args.repeat,
+        "model_load_seconds": load_seconds,
+        "ingestion": ingestion,
+        "quality": quality,
+        "latency": latency,
+        "questions": per_question,
+    }
+
+    print(f"\nIngestion: {ingestion['files']} files, {ingestion['chunks']} chunks in {ingestion['seconds']}s "
+          f"({ingestion['files_per_s']} files/s, {ingestion['chunks_per_s']} chunks/s), peak RSS {ingestion['peak_rss_mb']} MB")
+    print("Quality:   " + ", ".join(f"{k}={v:.3f}" for k, v in quality.items()))
+    missed = [q["question"] for q in per_question if not q["rank"]]
+    if missed:
+        print("Missed:    " + "; ".join(missed))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Baseline saved to {BASELINE_FILE}")
+        return 0
+
+    if not os.path.exists(BASELINE_FILE):
+        print("\nNo baseline yet: run with --save-baseline to record one.")
+        return 0
+
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.quality_tolerance, args.latency_tolerance)
+    if regressions:
+        print("\n⚠️ Regressions:\n  - " + "\n  - ".join(regressions))
+        return 1 if args.fail_on_regression else 0
+    print("\n✅ No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Quantized local vector storage: memory footprint, search latency and recall.
+
+Builds a LocalVectorStore per storage mode in a throwaway directory from
+synthetic clustered, L2-normalized 384-d vectors (embeddings of code are far
+from uniform, so uniform noise would flatter the quantizers), then compares
+each mode's top-k against exact float32 search:
+
+- none            float32 scan (reference)
+- float16         float16 scan + float32 rescoring of the top candidates
+- int8            int8 scan (per-dimension scales) + float32 rescoring
+- int8-norescore  int8 scan only, to show what rescoring buys
+
+It also reports the Pinecone upsert size per vector for the JSON body with and
+without rounding (PINECONE_UPSERT_DECIMALS) and for gRPC's packed floats.
+
+Usage (from backend/):
+    python benchmarks/vector_quantization_benchmark.py
+    python benchmarks/vector_quantization_benchmark.py --rows 200000 --queries 500 --rescore-factor 8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+DIMENSION = 384
+MODES = (("none", None), ("float16", None), ("int8", None), ("int8-norescore", 0))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def normalize(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def synthetic_corpus(rows, queries, seed):
+    """Clustered vectors plus queries that sit near (but not on) corpus rows."""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((max(8, rows // 200), DIMENSION)))
+    assignment = rng.integers(0, len(centers), rows)
+    corpus = normalize(centers[assignment] + 0.35 * rng.standard_normal((rows, DIMENSION)) / np.sqrt(DIMENSION) * 4)
+    picks = rng.integers(0, rows, queries)
+    query_set = normalize(corpus[picks] + 0.5 * rng.standard_normal((queries, DIMENSION)) / np.sqrt(DIMENSION) * 4)
+    return corpus, query_set
+
+
+# ---------------------------------------------------------
+# 1. LOCAL STORE MODES
+# ---------------------------------------------------------
+def run_mode(LocalVectorStore, workdir, mode, rescore_factor, corpus, queries, k, batch):
+    quantization = mode.split("-")[0]
+    index_dir = os.path.join(workdir, mode)
+    store = LocalVectorStore(index_dir=index_dir, quantization=quantization, rescore_factor=rescore_factor)
+
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), batch):
+        store.add_vectors(corpus[offset:offset + batch], ids=range(offset, min(offset + batch, len(corpus))))
+        store.save()
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    results = []
+    for query in queries:
+        t0 = time.perf_counter()
+        _, ids = store.search(query, k=k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.append(ids[0])
+
+    footprint = store.footprint()
+    disk = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir))
+    return {
+        "build_s": round(build_seconds, 3),
+        "scanned_mb": round(footprint["scanned_bytes"] / (1024 * 1024), 2),
+        "disk_mb": round(disk / (1024 * 1024), 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }, results
+
+def recall(results, truth, k):
+    return round(float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)])), 4)
+
+
+# ---------------------------------------------------------
+# 2. PINECONE UPSERT PAYLOAD
+# ---------------------------------------------------------
+def upsert_bytes(corpus, decimals):
+    sample = corpus[:200].astype(np.float64)
+    full = len(json.dumps(sample.tolist())) / len(sample)
+    rounded = len(json.dumps(np.round(sample, decimals).tolist())) / len(sample)
+    return {"json_full": round(full), f"json_{decimals}_decimals": round(rounded), "grpc_packed": DIMENSION * 4}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=2000, help="rows per add_vectors/save, as during ingestion")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--decimals", type=int, default=6, help="rounding for the Pinecone JSON payload")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="codemind-quant-")
+    os.environ["CODEMIND_DATA_DIR"] = workdir
+    os.environ["WARMUP_COMPONENTS"] = "none"
+    sys.path.insert(0, BACKEND_DIR)
+    from app.core.vector_store import LocalVectorStore
+
+    try:
+        print(f"🧪 {args.rows} vectors, {args.queries} queries, k={args.k}, rescore x{args.rescore_factor}")
+        corpus, queries = synthetic_corpus(args.rows, args.queries, args.seed)
+        scores = queries @ corpus.T
+        truth = np.argsort(-scores, axis=1)[:, :args.k]
+
+        report = {"rows": args.rows, "queries": args.queries, "k": args.k,
+                  "rescore_factor": args.rescore_factor, "modes": {}}
+        for mode, factor in MODES:
+            factor = args.rescore_factor if factor is None else factor
+            stats, results = run_mode(LocalVectorStore, workdir, mode, factor, corpus, queries, args.k, args.batch)
+            stats[f"recall@{args.k}"] = recall(results, truth, args.k)
+            stats["recall@1"] = recall(results, truth, 1)
+            report["modes"][mode] = stats
+        report["pinecone_upsert_bytes_per_vector"] = upsert_bytes(corpus, args.decimals)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    columns = ("scanned_mb", "disk_mb", "build_s", "p50_ms", "p95_ms", "recall@1", f"recall@{args.k}")
+    print(f"\n{'mode':<16}" + "".join(f"{c:>12}" for c in columns))
+    for mode, stats in report["modes"].items():
+        print(f"{mode:<16}" + "".join(f"{stats[c]:>12}" for c in columns))
+    print("\nPinecone upsert bytes/vector: " + ", ".join(
+        f"{name}={value}" for name, value in report["pinecone_upsert_bytes_per_vector"].items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+-- 001_chat_messages_client_id.sql
+-- Idempotent chat message inserts: the backend sends a client-generated
+-- client_id with every message and upserts on it, so a retried batch whose
+-- first attempt did reach the database adds nothing.
+-- Run once in the Supabase SQL editor (safe to run again).
+
+alter table chat_messages add column if not exists client_id text;
+
+create unique index if not exists chat_messages_client_id_key
+    on chat_messages (client_id);
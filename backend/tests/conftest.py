@@ -0,0 +1,23 @@
+# conftest.py
+"""
+Runs the suite against throwaway state: a temporary DATA_DIR and SQLite file,
+the local vector backend and no background warm-up. Set before any app import.
+
+Usage (from backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+
+_STATE_DIR = tempfile.mkdtemp(prefix="codemind-tests-")
+atexit.register(shutil.rmtree, _STATE_DIR, ignore_errors=True)
+os.environ["CODEMIND_DATA_DIR"] = _STATE_DIR
+os.environ["SQLITE_PATH"] = os.path.join(_STATE_DIR, "assistant.db")
+os.environ["VECTOR_BACKEND"] = "local"
+os.environ["WARMUP_COMPONENTS"] = "none"
+os.environ["CHAT_HISTORY_SINK"] = "sqlite"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+# test_chunk_planner.py
+"""Token-budgeted Python chunks (chunk_planner.py) and symbol-to-chunk mapping."""
+import textwrap
+
+from app.core.chunk_planner import CHUNK_MAX_TOKENS, estimate_tokens, plan_python_chunks
+from app.core.ingestion import _chunk_for_lines
+from app.core.parser import parse_python, extract_symbols
+
+
+def _plan(code: str):
+    code = textwrap.dedent(code).lstrip("\n")
+    return code, plan_python_chunks(parse_python(code, "m.py").root_node, code)
+
+def _body(name: str, statements: int) -> str:
+    lines = [f"def {name}(alpha, beta):"]
+    lines += [f"    value_{i} = compute_something(alpha, beta, index={i}) + offset_{i}" for i in range(statements)]
+    lines.append("    return value_0")
+    return "\n".join(lines) + "\n"
+
+
+def test_definition_within_budget_stays_whole():
+    code, chunks = _plan(_body("small", 8) + "\n\n" + _body("other", 8))
+
+    assert [c["name"] for c in chunks] == ["small", "other"]
+    assert chunks[0]["code"] == code.split("\n\n\n")[0].rstrip("\n")
+    assert (chunks[0]["start_line"], chunks[0]["end_line"]) == (1, 10)
+
+def test_oversized_function_is_split_and_repeats_its_signature():
+    code, chunks = _plan("import os\n\n\n" + _body("big", 200))
+
+    parts = [c for c in chunks if c["name"].startswith("big")]
+    assert len(parts) > 1
+    assert [c["name"] for c in parts] == [f"big (part {i}/{len(parts)})" for i in range(1, len(parts) + 1)]
+    for chunk in parts:
+        assert chunk["code"].startswith("def big(alpha, beta):")
+        assert estimate_tokens(chunk["code"], "m.py") <= CHUNK_MAX_TOKENS
+    assert "# ..." not in parts[0]["code"]
+    assert all("    # ..." in chunk["code"] for chunk in parts[1:])
+    # Together the pieces cover the whole body once
+    covered = [line for c in parts for line in range(c["start_line"], c["end_line"] + 1)]
+    assert sorted(covered) == list(range(parts[0]["start_line"], parts[-1]["end_line"] + 1))
+
+def test_nested_definitions_are_not_emitted_twice():
+    code, chunks = _plan('''
+        class Service:
+            """Handles requests."""
+
+            def handle(self, request):
+                def validate(item):
+                    return item is not None and item.ok
+                return [validate(x) for x in request.items]
+
+            def close(self):
+                self.pool.shutdown(wait=True)
+    ''')
+
+    assert len(chunks) == 1
+    assert chunks[0]["code"].count("def validate") == 1
+    assert chunks[0]["code"].count("def handle") == 1
+
+def test_module_level_code_is_merged():
+    code, chunks = _plan('''
+        import os
+        import sys
+
+        DEBUG = os.getenv("DEBUG", "0") == "1"
+        TIMEOUT = 30
+
+
+        def helper():
+            return DEBUG
+
+
+        if __name__ == "__main__":
+            sys.exit(helper())
+    ''')
+
+    assert len(chunks) == 1
+    assert chunks[0]["name"] == "helper"
+    assert (chunks[0]["start_line"], chunks[0]["end_line"]) == (1, len(code.rstrip("\n").split("\n")))
+
+def test_symbol_of_split_function_maps_to_its_first_piece():
+    code = "# Computes everything.\n# Long on purpose.\n" + _body("big", 200)
+    tree = parse_python(code, "m.py")
+    chunks = plan_python_chunks(tree.root_node, code)
+    spans = [(i, c["start_line"], c["end_line"]) for i, c in enumerate(chunks)]
+    symbol = next(s for s in extract_symbols(code, "m.py", tree) if s["name"] == "big")
+
+    # The first piece starts on the comments, above the `def` line, and ends mid-body
+    assert chunks[0]["start_line"] < symbol["start_line"]
+    assert chunks[0]["end_line"] < symbol["end_line"]
+    assert _chunk_for_lines(spans, symbol["start_line"], symbol["end_line"]) == 0
@@ -0,0 +1,40 @@
+# test_file_tree.py
+"""/files/tree lists ingested workspace roots only."""
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.core.file_content import register_workspace_root
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    return TestClient(app)
+
+@pytest.fixture
+def workspace(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("print('a')\n")
+    register_workspace_root(str(tmp_path))
+    return tmp_path
+
+
+def test_lists_an_ingested_root(client, workspace):
+    response = client.get("/files/tree", params={"path": str(workspace), "dir": str(workspace / "pkg")})
+
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()["entries"]] == ["a.py"]
+
+@pytest.mark.parametrize("path, directory", [("/", "/etc"), ("/etc", None)])
+def test_refuses_roots_that_were_not_ingested(client, workspace, path, directory):
+    params = {"path": path, **({"dir": directory} if directory else {})}
+    assert client.get("/files/tree", params=params).status_code == 403
+
+def test_refuses_directories_outside_the_root(client, workspace):
+    params = {"path": str(workspace), "dir": os.path.dirname(str(workspace))}
+    assert client.get("/files/tree", params=params).status_code == 403
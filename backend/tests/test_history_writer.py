@@ -0,0 +1,203 @@
+# test_history_writer.py
+"""ChatHistoryWriter against the SQLite sink (flush, retries, parking, spool adoption, reads), and the Supabase fallback."""
+import os
+import json
+import uuid
+import subprocess
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.db import history_reader
+from app.db.chat_store import SESSIONS_TABLE, MESSAGES_TABLE, SQLiteChatStore, SupabaseChatStore
+from app.db.history_writer import ChatHistoryWriter
+
+
+class FlakySink:
+    """Wraps the SQLite store; fails the next `failures` inserts (after writing, with `lost_reply`)."""
+
+    def __init__(self, failures: int = 0, lost_reply: bool = False):
+        self.store = SQLiteChatStore()
+        self.failures = failures
+        self.lost_reply = lost_reply
+        self.calls = 0
+
+    def insert(self, table, rows):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            if self.lost_reply:
+                self.store.insert(table, rows)
+                raise TimeoutError("write succeeded, reply lost")
+            raise ConnectionError("sink unavailable")
+        self.store.insert(table, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def _writer(sink, spool_dir) -> ChatHistoryWriter:
+    # A long interval keeps the background thread out of the way: tests flush explicitly
+    return ChatHistoryWriter(sink, spool_dir=str(spool_dir), max_batch=50, flush_interval=3600, retries=1)
+
+def _rows(user_id="u1"):
+    session_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    session = {"id": session_id, "user_id": user_id, "title": "Question", "created_at": now}
+    messages = [
+        {"client_id": str(uuid.uuid4()), "session_id": session_id, "role": role,
+         "content": f"{role} text", "created_at": now}
+        for role in ("user", "assistant")
+    ]
+    return session_id, session, messages
+
+def _enqueue(writer, session, messages):
+    writer.enqueue(SESSIONS_TABLE, session)
+    for message in messages:
+        writer.enqueue(MESSAGES_TABLE, message)
+
+def _stored(session_id):
+    return SQLiteChatStore().list_messages(session_id, limit=10)
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr("app.db.history_writer.time.sleep", lambda _: None)
+
+
+def test_flush_writes_rows_and_clears_spool(tmp_path):
+    writer = _writer(FlakySink(), tmp_path)
+    session_id, session, messages = _rows()
+    _enqueue(writer, session, messages)
+    assert os.path.exists(writer.spool_path)
+
+    assert writer.flush()
+    assert writer.pending() == 0
+    assert not os.path.exists(writer.spool_path)
+    assert [m["role"] for m in _stored(session_id)] == ["user", "assistant"]
+    writer.close()
+
+def test_failed_flush_keeps_rows_until_sink_recovers(tmp_path):
+    sink = FlakySink(failures=2)  # both attempts (retries=1) of the first flush fail
+    writer = _writer(sink, tmp_path)
+    session_id, session, messages = _rows()
+    _enqueue(writer, session, messages)
+
+    assert not writer.flush()
+    assert writer.pending() == 3
+    with open(writer.spool_path) as f:
+        assert len(f.readlines()) == 3
+    assert _stored(session_id) == []
+
+    assert writer.flush()
+    assert len(_stored(session_id)) == 2
+    writer.close()
+
+def test_retry_after_lost_reply_does_not_duplicate(tmp_path):
+    session_id, session, messages = _rows()
+    SQLiteChatStore().insert(SESSIONS_TABLE, [session])
+    writer = _writer(FlakySink(failures=1, lost_reply=True), tmp_path)
+    for message in messages:
+        writer.enqueue(MESSAGES_TABLE, message)
+
+    assert writer.flush()
+    assert writer.store.calls == 2
+    assert len(_stored(session_id)) == 2
+    writer.close()
+
+def test_spool_of_dead_process_is_adopted(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    session_id, session, messages = _rows()
+    with open(tmp_path / f"chat_spool.{dead.pid}.jsonl", "w") as f:
+        f.write(json.dumps({"table": SESSIONS_TABLE, "row": session}) + "\n")
+        for message in messages:
+            f.write(json.dumps({"table": MESSAGES_TABLE, "row": message}) + "\n")
+        f.write('{"table": "chat_mess')  # torn last line
+
+    writer = _writer(FlakySink(), tmp_path)
+    _enqueue(writer, *_rows()[1:])  # first enqueue adopts orphaned spools
+    assert writer.pending() == 6
+    assert not os.path.exists(tmp_path / f"chat_spool.{dead.pid}.jsonl")
+
+    assert writer.flush()
+    assert len(_stored(session_id)) == 2
+    assert os.listdir(tmp_path) == []
+    writer.close()
+
+def test_read_flushes_pending_rows_of_that_session(tmp_path, monkeypatch):
+    writer = _writer(FlakySink(), tmp_path)
+    monkeypatch.setattr(history_reader, "get_history_writer", lambda: writer)
+    session_id, session, messages = _rows(user_id=str(uuid.uuid4()))
+    _enqueue(writer, session, messages)
+    assert writer.has_pending(session_ids={session_id})
+    assert not writer.has_pending(session_ids={str(uuid.uuid4())})
+
+    page = history_reader.list_messages(session_id)
+    assert [m["content"] for m in page["items"]] == ["user text", "assistant text"]
+    assert writer.pending() == 0
+    assert history_reader.list_sessions(session["user_id"])["items"][0]["id"] == session_id
+    writer.close()
+
+def test_permanently_rejected_rows_are_parked(tmp_path):
+    writer = _writer(FlakySink(), tmp_path)
+    session_id, session, messages = _rows()
+    writer.enqueue(SESSIONS_TABLE, session)
+    writer.enqueue(MESSAGES_TABLE, {**messages[0], "no_such_column": 1})  # TypeError: never insertable
+
+    assert writer.flush()
+    assert writer.store.calls == 2  # not retried
+    with open(writer.parked_path) as f:
+        parked = [json.loads(line) for line in f]
+    assert [p["row"]["client_id"] for p in parked] == [messages[0]["client_id"]]
+
+    # The queue keeps moving
+    writer.enqueue(MESSAGES_TABLE, messages[1])
+    assert writer.flush()
+    assert [m["role"] for m in _stored(session_id)] == ["assistant"]
+    writer.close()
+
+
+class FakePostgrest:
+    """Just enough of the supabase client: records calls, rejects the first upsert with `code`."""
+
+    class Error(Exception):
+        def __init__(self, code):
+            super().__init__(code)
+            self.code = code
+
+    def __init__(self, code):
+        self.code = code
+        self.calls = []
+
+    def table(self, name):
+        fake = self
+
+        class Query:
+            def __init__(self, method, rows):
+                self.method, self.rows = method, rows
+
+            def execute(self):
+                fake.calls.append((self.method, self.rows))
+                if self.method == "upsert" and fake.code:
+                    code, fake.code = fake.code, None
+                    raise FakePostgrest.Error(code)
+
+        return SimpleNamespace(upsert=lambda rows, **kwargs: Query("upsert", rows),
+                               insert=lambda rows: Query("insert", rows))
+
+@pytest.mark.parametrize("code, keeps_id", [("PGRST204", False), ("42703", False), ("42P10", True)])
+def test_supabase_without_client_id_migration_falls_back_to_insert(code, keeps_id):
+    client = FakePostgrest(code)
+    store = SupabaseChatStore(client)
+    _, _, messages = _rows()
+
+    store.insert(MESSAGES_TABLE, messages)
+    store.insert(MESSAGES_TABLE, messages)
+
+    assert [method for method, _ in client.calls] == ["upsert", "insert", "insert"]
+    assert all(("client_id" in row) == keeps_id for _, rows in client.calls[1:] for row in rows)
+    assert SupabaseChatStore.is_permanent(FakePostgrest.Error("23503"))
+    assert not SupabaseChatStore.is_permanent(FakePostgrest.Error("PGRST000"))
+    assert not SupabaseChatStore.is_permanent(TimeoutError())
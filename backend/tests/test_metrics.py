@@ -0,0 +1,52 @@
+# test_metrics.py
+"""Cross-process metric merging: a dead worker's counters must not vanish."""
+import json
+import os
+
+import pytest
+
+from app.core import metrics
+
+DEAD_PID = 999999
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "RETIRED_FILE", str(tmp_path / "retired.json"))
+    monkeypatch.setattr(metrics, "RETIRED_LOCK_FILE", str(tmp_path / "retired.lock"))
+    monkeypatch.setattr(metrics, "_pid_alive", lambda pid: pid != DEAD_PID)
+    for metric in metrics._registry.values():
+        monkeypatch.setattr(metric, "values", {})
+    return tmp_path
+
+def _write_dead_worker(metrics_dir):
+    snapshot = {
+        "codemind_llm_tokens_total": [[["prompt"], 120.0]],
+        "codemind_queue_depth": [[["history"], 7.0]],
+        "codemind_chunk_tokens": [[["code"], [0, 1, 1, 1, 1, 1, 1, 100.0, 1]]],
+    }
+    (metrics_dir / f"metrics.{DEAD_PID}.json").write_text(json.dumps(snapshot))
+
+
+def test_dead_worker_counters_are_retired_not_dropped(metrics_dir):
+    _write_dead_worker(metrics_dir)
+    metrics.llm_tokens.inc(30, direction="prompt")
+
+    for _ in range(2):  # the second scrape must not count the dead worker twice
+        merged = metrics._merged_values()
+        assert merged["codemind_llm_tokens_total"][("prompt",)] == 150.0
+        assert merged["codemind_chunk_tokens"][("code",)][-2:] == [100.0, 1]
+        assert "codemind_queue_depth" not in merged
+
+    assert not os.path.exists(metrics_dir / f"metrics.{DEAD_PID}.json")
+
+def test_retired_totals_accumulate_across_dead_workers(metrics_dir):
+    _write_dead_worker(metrics_dir)
+    metrics._merged_values()
+    _write_dead_worker(metrics_dir)  # a later worker reusing the pid also died
+
+    merged = metrics._merged_values()
+
+    assert merged["codemind_llm_tokens_total"][("prompt",)] == 240.0
+    assert "# TYPE codemind_llm_tokens_total counter" in metrics.render_prometheus()
@@ -0,0 +1,95 @@
+# test_pinecone_search.py
+"""Routed drill-down on the Pinecone backend: one filtered query, no vector fetches."""
+import os
+import sys
+import uuid
+
+import numpy as np
+import pytest
+from pinecone import Pinecone
+from sqlmodel import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_pinecone import MockIndex, serve  # noqa: E402
+
+from app.core import chunk_store as chunk_store_module  # noqa: E402
+from app.core.chunk_store import chunk_store  # noqa: E402
+from app.core.coordination import allocate_ids  # noqa: E402
+from app.core.vector_store import PineconeIndexWrapper, VectorStore  # noqa: E402
+from app.db.models import Chunk, ChunkLocation  # noqa: E402
+from app.db.session import engine, init_db  # noqa: E402
+
+
+@pytest.fixture
+def pinecone_index(monkeypatch):
+    index = MockIndex()
+    server = serve(index, 0)
+    store = VectorStore.__new__(VectorStore)
+    store.dimension = 384
+    store.index = PineconeIndexWrapper(
+        Pinecone(api_key="mock").Index(host=f"http://127.0.0.1:{server.server_address[1]}"))
+    monkeypatch.setattr(chunk_store_module, "vector_db", store)
+    monkeypatch.setattr(chunk_store_module, "VECTOR_BACKEND", "pinecone")
+    init_db()
+    yield index
+    server.shutdown()
+
+def _add(root: str, files: dict) -> dict:
+    """files: relative path -> chunk count. Returns (path, n) -> (chunk id, vector)."""
+    specs = [(f"{root}/{path}", n) for path, count in files.items() for n in range(count)]
+    ids = list(allocate_ids(len(specs)))
+    vectors = np.random.default_rng(len(root)).standard_normal((len(specs), 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks, metas = [], []
+    for chunk_id, (path, n) in zip(ids, specs):
+        name = os.path.basename(path)
+        chunks.append(Chunk(id=chunk_id, chunk_hash=f"{path}:{n}", file_name=name, file_path=path,
+                            start_line=n * 10 + 1, end_line=n * 10 + 9, content=f"# {path} {n}"))
+        metas.append({"file_name": name, "file_path": path, "chunk_type": "code", "start_line": str(n * 10 + 1)})
+    chunk_store.add(vectors, chunks, metas)
+    return {(path.split("/", 2)[2], n): (chunk_id, vectors[i]) for i, (chunk_id, (path, n)) in enumerate(zip(ids, specs))}
+
+
+def test_drill_down_is_one_filtered_query(pinecone_index):
+    root = f"/repo-{uuid.uuid4().hex}"
+    chunks = _add(root, {"pkg/a.py": 2, "pkg/b.py": 1, "other/c.py": 2})
+    copied_id = chunks[("other/c.py", 1)][0]
+    with Session(engine) as session:
+        session.add(ChunkLocation(chunk_id=copied_id, file_name="d.py", file_path=f"{root}/pkg/d.py",
+                                  start_line=1, end_line=9))
+        session.commit()
+
+    passages, scores = chunk_store.search_within(
+        chunks[("pkg/b.py", 0)][1], [{"kind": "dir", "path": f"{root}/pkg", "root": False}], k=10)
+
+    expected = {chunks[key][0] for key in (("pkg/a.py", 0), ("pkg/a.py", 1), ("pkg/b.py", 0))} | {copied_id}
+    assert set(scores) == expected
+    assert passages[0]["id"] == chunks[("pkg/b.py", 0)][0]
+    assert pinecone_index.stats["queries"] == 1
+    assert pinecone_index.stats["fetched"] == 0
+
+def test_scope_over_the_filter_limit_falls_back(pinecone_index, monkeypatch):
+    monkeypatch.setattr(chunk_store_module, "ROUTE_MAX_FILTER_FILES", 1)
+    root = f"/repo-{uuid.uuid4().hex}"
+    chunks = _add(root, {"pkg/a.py": 1, "pkg/b.py": 1})
+
+    assert chunk_store.search_within(
+        chunks[("pkg/a.py", 0)][1], [{"kind": "dir", "path": f"{root}/pkg", "root": False}]) is None
+    assert pinecone_index.stats["queries"] == 0
+
+def test_relocated_chunk_is_filtered_under_its_new_file(pinecone_index):
+    root = f"/repo-{uuid.uuid4().hex}"
+    chunks = _add(root, {"old/a.py": 1})
+    chunk_id, vector = chunks[("old/a.py", 0)]
+    location = ChunkLocation(chunk_id=chunk_id, file_name="a.py", file_path=f"{root}/new/a.py",
+                             start_line=1, end_line=9)
+    with Session(engine) as session:
+        session.add(location)
+        session.commit()
+        session.refresh(location)
+
+    chunk_store.relocate(chunk_id, location)
+
+    assert pinecone_index.vectors[str(chunk_id)][1]["file_path"] == f"{root}/new/a.py"
+    _, scores = chunk_store.search_within(vector, [{"kind": "file", "path": f"{root}/new/a.py", "root": False}])
+    assert set(scores) == {chunk_id}
@@ -0,0 +1,129 @@
+# test_pinecone_upsert.py
+"""PineconeIndexWrapper's parallel upserts against benchmarks/mock_pinecone.py."""
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from pinecone import Pinecone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_pinecone import MockIndex, serve  # noqa: E402
+
+from app.core import vector_store  # noqa: E402
+from app.core.vector_store import PineconeIndexWrapper, _payload_batches  # noqa: E402
+
+
+@pytest.fixture
+def mock_index():
+    servers = []
+
+    def start(**options) -> tuple:
+        index = MockIndex(seed=3, **options)
+        server = serve(index, 0)
+        servers.append(server)
+        host = f"http://127.0.0.1:{server.server_address[1]}"
+        return index, PineconeIndexWrapper(Pinecone(api_key="mock").Index(host=host))
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # The wrapper's backoff only: the client's own 5xx retries still sleep for real
+    delays = []
+    monkeypatch.setattr(vector_store, "time", SimpleNamespace(sleep=delays.append))
+    return delays
+
+def _records(count: int, content_chars: int = 100):
+    vectors = np.random.default_rng(0).standard_normal((count, 384))
+    return [(str(i), vectors[i].round(6).tolist(), {"content": "x" * content_chars}) for i in range(count)]
+
+
+def test_throttling_is_retried(mock_index, sleeps, monkeypatch):
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_RETRIES", 8)
+    index, wrapper = mock_index(fail_rate=0.3, fail_statuses=(429,))
+    vectors = np.random.default_rng(1).standard_normal((500, 384))
+
+    wrapper.add(vectors, [{"n": i} for i in range(500)], ids=list(range(500)))
+
+    assert index.stats["injected_failures"] > 0
+    assert len(sleeps) == index.stats["injected_failures"]
+    assert set(index.vectors) == {str(i) for i in range(500)}
+
+def test_server_errors_are_retried(mock_index, sleeps, monkeypatch):
+    # The Pinecone client retries 5xx on its own first; whatever gets through is ours
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_RETRIES", 8)
+    index, wrapper = mock_index(fail_rate=0.4, fail_statuses=(500, 503))
+
+    wrapper._upsert_parallel([_records(20)[i:i + 2] for i in range(0, 20, 2)])
+
+    assert index.stats["injected_failures"] > 0
+    assert len(index.vectors) == 20
+    assert all(vector_store._is_retryable(SimpleNamespace(status=s)) for s in (429, 500, 503))
+    assert not any(vector_store._is_retryable(SimpleNamespace(status=s)) for s in (400, 404, 413))
+
+def test_backoff_doubles_until_retries_run_out(mock_index, sleeps, monkeypatch):
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_RETRIES", 3)
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_BACKOFF_S", 1.0)
+    index, wrapper = mock_index(fail_rate=1.0, fail_statuses=(429,))
+
+    with pytest.raises(Exception) as raised:
+        wrapper._upsert_parallel([_records(1)])
+
+    assert getattr(raised.value, "status", None) == 429
+    assert index.stats["upsert_requests"] == 4
+    # Attempt k waits base * 2**k, jittered by 0.5x-1.5x
+    assert [int(0.5 * 2 ** k <= delay < 1.5 * 2 ** k) for k, delay in enumerate(sleeps)] == [1, 1, 1]
+
+def test_client_errors_are_not_retried(mock_index, sleeps):
+    index, wrapper = mock_index(max_body=1024)
+
+    with pytest.raises(Exception) as raised:
+        wrapper._upsert_parallel([_records(5)])
+
+    assert getattr(raised.value, "status", None) == 413
+    assert index.stats["upsert_requests"] == 1
+    assert sleeps == []
+
+def test_in_flight_batches_are_bounded(mock_index, monkeypatch):
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_WORKERS", 2)
+    index, wrapper = mock_index(latency_ms=20)
+    records = _records(40)
+    ahead = []
+
+    def batches():
+        # Batches handed out but not yet answered, each time one more is asked for
+        for i in range(0, len(records), 2):
+            with index.lock:
+                answered = index.stats["upsert_requests"] - index.stats["in_flight"]
+            ahead.append(i // 2 - answered)
+            yield records[i:i + 2]
+
+    wrapper._upsert_parallel(batches())
+
+    assert len(index.vectors) == 40
+    assert max(ahead) <= 2 * 2
+    assert 1 < index.stats["max_in_flight"] <= 2
+
+def test_batches_split_by_payload_size(mock_index, monkeypatch):
+    limit = 64 * 1024
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_MAX_BYTES", limit)
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_MAX_VECTORS", 100)
+    records = _records(60, content_chars=6000)  # ~10 KB each: far fewer than 100 per request
+
+    batches = list(_payload_batches(records))
+    assert [r for batch in batches for r in batch] == records
+    assert all(1 < len(batch) < 10 for batch in batches)
+
+    index, wrapper = mock_index(max_body=limit)
+    wrapper._upsert_parallel(batches)
+    assert index.stats["rejected_too_large"] == 0
+    assert index.stats["upsert_requests"] == len(batches)
+    assert len(index.vectors) == 60
+
+def test_batches_split_by_vector_count(monkeypatch):
+    monkeypatch.setattr(vector_store, "PINECONE_UPSERT_MAX_VECTORS", 7)
+    assert [len(batch) for batch in _payload_batches(_records(20, content_chars=10))] == [7, 7, 6]